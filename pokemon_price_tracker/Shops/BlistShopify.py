@@ -1,5 +1,10 @@
-from pokemon_price_tracker.shopify_scraper import scan_shopify_store_json
+from functools import partial
+from typing import Iterator
+
+from pokemon_price_tracker.shopify_scraper import iter_shopify_store_json
+from pokemon_price_tracker.offers import Product
 from pokemon_price_tracker.queries import QUERIES
+from pokemon_price_tracker.scan_scheduler import ScanTask
 
 SHOP_NAME = "B-list Shopify"
 
@@ -9,22 +14,36 @@ B_LIST_SHOPIFY = [
     ("rogerz", "rogerz.dk"),
 ]
 
+# Narrow-mode (valgfri): domæne -> collection-handles der dækker Pokémon sealed.
+# Kun de collections hentes, med fuld crawl hver NARROW_VERIFY_DAYS.
+# Fx: {"spilforsyningen.dk": ["pokemon"]}
+B_LIST_COLLECTIONS = {}
 
-def get_products():
-    all_products = []
 
-    for shop_name, domain in B_LIST_SHOPIFY:
-        print(f"\n--- Scanner {shop_name} ({domain}) ---")
-        try:
-            products = scan_shopify_store_json(domain, QUERIES)
-            print(f"{shop_name}: hentede {len(products)} produkter")
+def _scan_shop(shop_name: str, domain: str) -> Iterator[Product]:
+    print(f"\n--- Scanner {shop_name} ({domain}) ---")
+    count = 0
+    for p in iter_shopify_store_json(domain, QUERIES, collections=B_LIST_COLLECTIONS.get(domain)):
+        p.set_shop(shop_name)
+        count += 1
+        yield p
+    print(f"{shop_name}: hentede {count} produkter")
+
 
-            for p in products:
-                p["shop_source"] = shop_name
+def get_scan_tasks():
+    return [
+        ScanTask(shop_name, domain, partial(_scan_shop, shop_name, domain))
+        for shop_name, domain in B_LIST_SHOPIFY
+    ]
 
-            all_products.extend(products)
 
+def get_products():
+    all_products = []
+
+    for task in get_scan_tasks():
+        try:
+            all_products.extend(task.run())
         except Exception as e:
-            print(f"Fejl i {shop_name}: {e}")
+            print(f"Fejl i {task.label}: {e}")
 
-    return all_products
\ No newline at end of file
+    return all_products
@@ -1,11 +1,14 @@
 import html as html_lib
 import re
-from urllib.parse import urljoin
-
-import requests
+from functools import partial
+from typing import List, Tuple
+from urllib.parse import urljoin, urlparse
 
+from pokemon_price_tracker import http_client, instrumentation, page_cache
+from pokemon_price_tracker.offers import Product, products_from_rows, products_to_rows
 from pokemon_price_tracker.queries import QUERIES
-from pokemon_price_tracker.shopify_scraper import looks_like_single_card
+from pokemon_price_tracker.prefilter import ProductFilter
+from pokemon_price_tracker.scan_scheduler import ScanTask
 
 SHOP_NAME = "epicpanda"
 BASE_URL = "https://epicpanda.dk"
@@ -19,6 +22,23 @@ HEADERS = {
 }
 
 PRICE_RE = re.compile(r"(\d{1,3}(?:\.\d{3})*,\d{2})\s*DKK", re.IGNORECASE)
+# Rigtige produktlinks: /shop/...p.html (evt. med query)
+PRODUCT_HREF_RE = re.compile(r"/shop/.+?p\.html(?:\?.*)?$", re.IGNORECASE)
+# Hvor langt efter et produktlink vi leder efter pris/lager (tegn HTML)
+SNIPPET_CHARS = 1500
+# Maks antal kategorisider vi følger via rel="next"
+MAX_CATEGORY_PAGES = 20
+
+# Tokenizer: <script>/<style>-blokke og kommentarer (springes over), ellers kun
+# <a>/</a>/<link>; øvrige tags fjernes først når en titel/pris-tekst skal bruges
+_TOKEN_RE = re.compile(
+    r"<(?:script|style)\b.*?</(?:script|style)\s*>"
+    r"|<!--.*?-->"
+    r"|<(?P<close>/?)(?P<tag>a|link)\b(?P<attrs>[^>]*)>",
+    re.IGNORECASE | re.DOTALL,
+)
+_TAG_RE = re.compile(r"<[^>]+>")
+_ATTR_RE = re.compile(r"""([\w:-]+)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+))""")
 
 SERIES_PAGES = [
     {
@@ -115,6 +135,12 @@ BANNED_LANGUAGE_WORDS = [
 
 BANNED_GRADED_WORDS = ["psa", "bgs", "cgc", "graded", "slab"]
 
+_TITLE_FILTER = ProductFilter(
+    (),
+    required_words=REQUIRED_PRODUCT_WORDS,
+    banned_words=BANNED_LANGUAGE_WORDS + BANNED_GRADED_WORDS,
+)
+
 
 def _normalize(text: str) -> str:
     text = html_lib.unescape((text or "").replace("\xa0", " "))
@@ -122,14 +148,10 @@ def _normalize(text: str) -> str:
     return text
 
 
-def _strip_tags(fragment: str) -> str:
-    fragment = re.sub(r"(?is)<script\b.*?</script>", " ", fragment or "")
-    fragment = re.sub(r"(?is)<style\b.*?</style>", " ", fragment)
-    fragment = re.sub(r"(?is)<[^>]+>", " ", fragment)
-    fragment = html_lib.unescape(fragment)
-    fragment = fragment.replace("\xa0", " ")
-    fragment = re.sub(r"\s+", " ", fragment).strip()
-    return fragment
+def _collapse(parts: list[str]) -> str:
+    # rå HTML-stykker mellem a/link-tags -> tekst, som _strip_tags gjorde (tags -> mellemrum)
+    text = _TAG_RE.sub(" ", " ".join(parts))
+    return " ".join(html_lib.unescape(text).replace("\xa0", " ").split())
 
 
 def _parse_price(text: str):
@@ -169,19 +191,9 @@ def _is_valid_title(title: str) -> bool:
     if not t:
         return False
 
-    if any(word in t for word in BANNED_LANGUAGE_WORDS):
-        return False
-
-    if any(word in t for word in BANNED_GRADED_WORDS):
-        return False
-
-    if looks_like_single_card(t):
-        return False
-
-    if not any(word in t for word in REQUIRED_PRODUCT_WORDS):
-        return False
-
-    return True
+    # Siderne er allerede udvalgt pr serie, så kun udeluk/kræv sealed på titlen
+    verdict = _TITLE_FILTER.classify(t, require_query=False)
+    return not verdict.banned and not verdict.single_card and verdict.sealed
 
 
 def _matched_queries_for_page(page_markers: set[str], queries: list[str]) -> list[str]:
@@ -189,46 +201,35 @@ def _matched_queries_for_page(page_markers: set[str], queries: list[str]) -> lis
     return sorted(qset.intersection({x.lower() for x in page_markers}))
 
 
-def _extract_products_from_category_html(category_html: str, series_hint: str, matched_queries: list[str]) -> list[dict]:
-    products = []
-    seen_urls = set()
-
-    # Find kun rigtige produktlinks i /shop/...p.html
-    matches = list(
-        re.finditer(
-            r'''<a\b[^>]*href=["']([^"']*?/shop/[^"']+?p\.html(?:\?[^"']*)?)["'][^>]*>(.*?)</a>''',
-            category_html or "",
-            re.IGNORECASE | re.DOTALL,
-        )
-    )
-
-    for i, match in enumerate(matches):
-        href = match.group(1)
-        inner_html = match.group(2)
-
-        title = _strip_tags(inner_html)
-        if not title:
-            continue
-
-        if not _is_valid_title(title):
-            continue
-
-        product_url = _clean_product_url(href)
-        if not product_url or product_url in seen_urls:
-            continue
-
-        next_start = matches[i + 1].start() if i + 1 < len(matches) else len(category_html)
-        snippet = category_html[match.end():next_start]
-
-        # kig kun lidt frem, så vi holder os til det relevante produktområde
-        snippet = snippet[:1500]
-        snippet_text = _strip_tags(snippet)
-        snippet_norm = _normalize(snippet_text)
-
+def _parse_category_page(
+    category_html: str,
+    series_hint: str,
+    matched_queries: list[str],
+    seen_urls: set,
+) -> Tuple[List[Product], str]:
+    """
+    Ét pass over kategorisiden med en tag-tokenizer (ét C-regex scan).
+    Produktlinks (/shop/...p.html) giver titel + URL; teksten efter linket
+    (op til næste produktlink, højst SNIPPET_CHARS tegn HTML) giver pris og
+    lagerstatus. <script>/<style> springes over, og rel="next" (<a> eller
+    <link>) returneres til paginering.
+    Returnerer (produkter, url til næste side eller "").
+    """
+    category_html = category_html or ""
+    products: List[Product] = []
+    next_url = ""
+
+    link = None      # (href, tekst-stykker) for åbent produktlink
+    pending = None   # (title, url, snippet-stykker, slut-offset)
+
+    def finish(pending) -> None:
+        title, product_url, parts, _end = pending
+        snippet_text = _collapse(parts)
         price = _parse_price(snippet_text)
         if price is None or price <= 0:
-            continue
+            return
 
+        snippet_norm = snippet_text.lower()
         available = True
         if "udsolgt" in snippet_norm or "ikke på lager" in snippet_norm or "sold out" in snippet_norm:
             available = False
@@ -236,54 +237,150 @@ def _extract_products_from_category_html(category_html: str, series_hint: str, m
             available = True
 
         products.append(
-            {
-                "name": title.strip(),
-                "price": float(price),
-                "available": bool(available),
-                "series_hint": series_hint,
-                "grouping_text": title.strip(),
-                "matched_queries": matched_queries,
-                "url": product_url,
-                "shop_source": "epicpanda",
-            }
+            Product(
+                title.strip(),
+                price,
+                available,
+                series_hint,
+                matched_queries,
+                product_url,
+                SHOP_NAME,
+                grouping_text=title.strip(),
+            )
         )
-
         seen_urls.add(product_url)
 
+    pos = 0
+    for m in _TOKEN_RE.finditer(category_html):
+        # tekst mellem forrige og dette tag
+        if m.start() > pos and (link is not None or pending is not None):
+            text = category_html[pos:m.start()]
+            if link is not None:
+                link[1].append(text)
+            elif pending[3] > pos:
+                pending[2].append(text[:pending[3] - pos])
+        pos = m.end()
+
+        tag = (m.group("tag") or "").lower()
+        if not tag:
+            continue
+
+        if m.group("close"):
+            if tag != "a" or link is None:
+                continue
+            href, parts = link
+            link = None
+            title = _collapse(parts)
+            if not title or not _is_valid_title(title):
+                continue
+            product_url = _clean_product_url(href)
+            if not product_url or product_url in seen_urls:
+                continue
+            pending = (title, product_url, [], m.end() + SNIPPET_CHARS)
+            continue
+
+        raw_attrs = m.group("attrs")
+        raw_l = raw_attrs.lower()
+        if "p.html" not in raw_l and "next" not in raw_l:
+            continue
+        attrs = {k.lower(): html_lib.unescape(v1 or v2 or v3 or "") for k, v1, v2, v3 in _ATTR_RE.findall(raw_attrs)}
+        href = attrs.get("href") or ""
+        if not next_url and href and "next" in (attrs.get("rel") or "").lower().split():
+            next_url = urljoin(BASE_URL, href)
+
+        if tag == "a" and PRODUCT_HREF_RE.search(href):
+            # næste produktlink afslutter forrige produkts område
+            if pending is not None:
+                finish(pending)
+                pending = None
+            link = (href, [])
+
+    if pending is not None:
+        tail = category_html[pos:pending[3]] if pending[3] > pos else ""
+        pending[2].append(tail)
+        finish(pending)
+
+    return products, next_url
+
+
+def _extract_products_from_category_html(category_html: str, series_hint: str, matched_queries: list[str]) -> List[Product]:
+    products, _next_url = _parse_category_page(category_html, series_hint, matched_queries, set())
     return products
 
 
-def get_products():
-    all_products = []
-    session = requests.Session()
-    session.headers.update(HEADERS)
+def _scan_series_page(page: dict) -> List[Product]:
+    matched_queries = _matched_queries_for_page(page["query_markers"], QUERIES)
+    if not matched_queries:
+        return []
 
-    for page in SERIES_PAGES:
-        matched_queries = _matched_queries_for_page(page["query_markers"], QUERIES)
-        if not matched_queries:
-            continue
+    category_url = page["url"]
+    series_hint = page["series_hint"]
 
-        category_url = page["url"]
-        series_hint = page["series_hint"]
+    print(f"\n--- Scanner epicpanda ({series_hint}) ---")
 
-        print(f"\n--- Scanner epicpanda ({series_hint}) ---")
+    products = []
+    seen_urls = set()
+    visited = set()
+    host = urlparse(BASE_URL).netloc
 
+    # Følg rel="next" så kategorier med flere sider kommer helt med
+    while category_url and category_url not in visited and len(visited) < MAX_CATEGORY_PAGES:
+        visited.add(category_url)
         try:
-            resp = session.get(category_url, timeout=30)
+            resp = http_client.get(category_url, headers=HEADERS)
             resp.raise_for_status()
-            category_html = resp.text
         except Exception as e:
             print(f"Fejl ved hentning af kategori {category_url}: {e}")
-            continue
+            break
+
+        # Byte-identisk side = genbrug sidste udtræk (page_cache)
+        digest = ""
+        cached = None
+        if page_cache.PAGE_CACHE:
+            digest = page_cache.page_digest(
+                resp.content, series_hint, ",".join(matched_queries), _TITLE_FILTER.signature
+            )
+            cached = page_cache.load(host, category_url, digest)
+
+        if cached is not None:
+            page_products = [p for p in products_from_rows(cached["products"]) or [] if p.url not in seen_urls]
+            seen_urls.update(p.url for p in page_products)
+            next_url = cached["next_url"]
+        else:
+            with instrumentation.timer("scrape.parse_s", shop=host):
+                # uden dedupe mod tidligere sider, så udtrækket kan genbruges uafhængigt af dem
+                page_products, next_url = _parse_category_page(resp.text, series_hint, matched_queries, set())
+            if digest:
+                page_cache.store(host, category_url, digest, {"products": products_to_rows(page_products), "next_url": next_url})
+            page_products = [p for p in page_products if p.url not in seen_urls]
+            seen_urls.update(p.url for p in page_products)
+        products.extend(page_products)
+        instrumentation.count("scrape.pages", shop=host)
+        instrumentation.count("scrape.products_kept", len(page_products), shop=host)
+
+        category_url = next_url if urlparse(next_url).netloc == host else ""
+
+    print(f"epicpanda: fandt {len(products)} produkter i {series_hint} ({len(visited)} sider)")
+    return products
 
-        products = _extract_products_from_category_html(
-            category_html=category_html,
-            series_hint=series_hint,
-            matched_queries=matched_queries,
-        )
 
-        print(f"epicpanda: fandt {len(products)} produkter i {series_hint}")
-        all_products.extend(products)
+def get_scan_tasks():
+    """
+    Én opgave pr kategoriside. Alle deler host, så scheduleren holder
+    per-host loftet for epicpanda.dk.
+    """
+    host = urlparse(BASE_URL).netloc
+    return [
+        ScanTask(f"{SHOP_NAME} ({page['series_hint']})", host, partial(_scan_series_page, page))
+        for page in SERIES_PAGES
+    ]
+
+
+def get_products():
+    all_products = []
+
+    for task in get_scan_tasks():
+        all_products.extend(task.run())
 
     print(f"epicpanda: hentede {len(all_products)} produkter i alt")
-    return all_products
\ No newline at end of file
+    return all_products
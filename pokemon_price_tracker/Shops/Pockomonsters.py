@@ -1,15 +1,26 @@
-from pokemon_price_tracker.shopify_scraper import scan_shopify_store_json
+from typing import Iterator
+
+from pokemon_price_tracker.shopify_scraper import iter_shopify_store_json
+from pokemon_price_tracker.offers import Product
 from pokemon_price_tracker.queries import QUERIES
+from pokemon_price_tracker.scan_scheduler import ScanTask
 
 SHOP_NAME = "pockomonsters"
 
 
-def get_products():
+def get_scan_tasks():
+    return [ScanTask(SHOP_NAME, "pockomonsters.dk", _scan_shop)]
+
+
+def _scan_shop() -> Iterator[Product]:
     print(f"\n--- Scanner pockomonsters (pockomonsters.dk) ---")
-    products = scan_shopify_store_json("pockomonsters.dk", QUERIES)
-    print(f"pockomonsters: hentede {len(products)} produkter")
+    count = 0
+    for p in iter_shopify_store_json("pockomonsters.dk", QUERIES):
+        p.set_shop("pockomonsters")
+        count += 1
+        yield p
+    print(f"pockomonsters: hentede {count} produkter")
 
-    for p in products:
-        p["shop_source"] = "pockomonsters"
 
-    return products
\ No newline at end of file
+def get_products():
+    return list(_scan_shop())
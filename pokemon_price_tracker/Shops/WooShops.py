@@ -1,5 +1,10 @@
-from pokemon_price_tracker.woocommerce_scraper import scan_woocommerce_store_api
+from functools import partial
+from typing import Iterator
+
+from pokemon_price_tracker.woocommerce_scraper import iter_woocommerce_store_api
+from pokemon_price_tracker.offers import Product
 from pokemon_price_tracker.queries import QUERIES
+from pokemon_price_tracker.scan_scheduler import ScanTask
 
 SHOP_NAME = "Woo shops"
 
@@ -9,22 +14,36 @@ WOO_SHOPS = [
     ("pokemons", "pokemons.dk"),
 ]
 
+# Narrow-mode (valgfri): domæner hvor vi bruger Store API search= pr serie i
+# stedet for hele kataloget, med fuld crawl hver NARROW_VERIFY_DAYS.
+# Fx: {"andcards.dk"}
+WOO_NARROW_SEARCH = set()
 
-def get_products():
-    all_products = []
 
-    for shop_name, domain in WOO_SHOPS:
-        print(f"\n--- Scanner {shop_name} ({domain}) [Woo Store API] ---")
-        try:
-            products = scan_woocommerce_store_api(domain, QUERIES)
-            print(f"{shop_name}: hentede {len(products)} produkter")
+def _scan_shop(shop_name: str, domain: str) -> Iterator[Product]:
+    print(f"\n--- Scanner {shop_name} ({domain}) [Woo Store API] ---")
+    count = 0
+    for p in iter_woocommerce_store_api(domain, QUERIES, narrow=domain in WOO_NARROW_SEARCH):
+        p.set_shop(shop_name)
+        count += 1
+        yield p
+    print(f"{shop_name}: hentede {count} produkter")
+
 
-            for p in products:
-                p["shop_source"] = shop_name
+def get_scan_tasks():
+    return [
+        ScanTask(shop_name, domain, partial(_scan_shop, shop_name, domain))
+        for shop_name, domain in WOO_SHOPS
+    ]
 
-            all_products.extend(products)
 
+def get_products():
+    all_products = []
+
+    for task in get_scan_tasks():
+        try:
+            all_products.extend(task.run())
         except Exception as e:
-            print(f"Fejl i {shop_name}: {e}")
+            print(f"Fejl i {task.label}: {e}")
 
-    return all_products
\ No newline at end of file
+    return all_products
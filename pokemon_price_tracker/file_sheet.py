@@ -0,0 +1,263 @@
+import atexit
+import json
+import os
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+
+_A1_RE = re.compile(r"^(?:'((?:[^']|'')*)'|([^!]+))(?:!([A-Z]*)(\d*)(?::([A-Z]*)(\d*))?)?$")
+
+
+def _col_index(letters: str) -> int:
+    n = 0
+    for c in letters:
+        n = n * 26 + (ord(c) - 64)
+    return n
+
+
+def _parse_a1(a1_range: str) -> Tuple[str, int, int, Optional[int]]:
+    """'Ark'!B5:G9 -> (titel, første række, første kolonne, sidste række eller None); 1-baseret."""
+    m = _A1_RE.match(a1_range.strip())
+    if not m:
+        raise ValueError(f"Ugyldigt A1-range: {a1_range}")
+    title = m.group(1).replace("''", "'") if m.group(1) is not None else m.group(2)
+    first_row = int(m.group(4) or 1)
+    first_col = _col_index(m.group(3)) if m.group(3) else 1
+    last_row = int(m.group(6)) if m.group(6) else None
+    return title, first_row, first_col, last_row
+
+
+def _trimmed(rows: List[list]) -> List[list]:
+    # Sheets udelader tomme celler/rækker i enden af et range
+    out = [row[:max((i + 1 for i, c in enumerate(row) if c not in ("", None)), default=0)] for row in rows]
+    while out and not out[-1]:
+        out.pop()
+    return out
+
+
+def _cell(value, formatted: bool):
+    if value is None:
+        return ""
+    if formatted and not isinstance(value, str):
+        if isinstance(value, bool):
+            return "TRUE" if value else "FALSE"
+        if isinstance(value, float) and value.is_integer():
+            return str(int(value))
+        return str(value)
+    return value
+
+
+class FileWorksheet:
+    """Den del af gspread.Worksheet som pipelinen bruger, på en liste af rækker."""
+
+    def __init__(self, book: "FileSpreadsheet", title: str, sheet_id: int, rows: int = 1000, cols: int = 26):
+        self.spreadsheet = book
+        self.title = title
+        self._properties = {"sheetId": sheet_id, "title": title}
+        self.grid = {"rowCount": rows, "columnCount": cols}
+        self.conditional_formats: List[dict] = []
+        self.values: List[list] = []
+
+    @property
+    def id(self) -> int:
+        return self._properties["sheetId"]
+
+    def _write(self, first_row: int, first_col: int, values: List[list]) -> None:
+        for i, row in enumerate(values):
+            r = first_row - 1 + i
+            while len(self.values) <= r:
+                self.values.append([])
+            target = self.values[r]
+            while len(target) < first_col - 1 + len(row):
+                target.append("")
+            target[first_col - 1:first_col - 1 + len(row)] = list(row)
+
+    def _read(self, first_row: int = 1, last_row: Optional[int] = None, formatted: bool = True) -> List[list]:
+        rows = self.values[first_row - 1:last_row]
+        return _trimmed([[_cell(c, formatted) for c in row] for row in rows])
+
+    # ---------- gspread-API ----------
+    def get_all_values(self, **_kwargs) -> List[list]:
+        return self._read()
+
+    def row_values(self, row: int, **_kwargs) -> list:
+        rows = self._read(row, row)
+        return rows[0] if rows else []
+
+    def update(self, *args, **kwargs):
+        # gspread 5: update(range, values); gspread 6: update(values, range)
+        range_name = kwargs.get("range_name")
+        values = kwargs.get("values")
+        for a in args:
+            if isinstance(a, str):
+                range_name = a
+            else:
+                values = a
+        _title, first_row, first_col, _last = _parse_a1(f"'{self.title}'!{range_name or 'A1'}")
+        self._write(first_row, first_col, values or [])
+        self.spreadsheet.save()
+
+    def append_rows(self, values: List[list], **_kwargs):
+        while self.values and not any(c not in ("", None) for c in self.values[-1]):
+            self.values.pop()
+        self._write(len(self.values) + 1, 1, values)
+        # RawOffers appendes i mange batches; filen skrives samlet ved exit/næste save()
+        self.spreadsheet.dirty = True
+
+    def clear(self):
+        self.values = []
+        self.spreadsheet.save()
+
+    def resize(self, rows: Optional[int] = None, cols: Optional[int] = None):
+        if rows is not None:
+            self.grid["rowCount"] = rows
+            del self.values[rows:]
+        if cols is not None:
+            self.grid["columnCount"] = cols
+        self.spreadsheet.save()
+
+
+class FileSpreadsheet:
+    """
+    Lokal, fil-baseret stand-in for gspread.Spreadsheet (SHEETS_FILE=sti.json),
+    til replay/benchmark af hele main() uden Google. Understøtter præcis de
+    kald pipelinen laver: worksheet/add_worksheet/sheet1, values_batch_get,
+    values_batch_update, batch_update (resize + conditional formats) og
+    fetch_sheet_metadata. Filen skrives efter hver skrivning (append_rows
+    samles og skrives ved exit eller næste skrivning).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.sheets: Dict[str, FileWorksheet] = {}
+        self.calls: Dict[str, int] = {}
+        self.dirty = False
+        self._lock = threading.Lock()
+        self._load()
+        atexit.register(self._save_if_dirty)
+
+    # ---------- persistens ----------
+    def _load(self) -> None:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        for s in data.get("sheets", []):
+            ws = FileWorksheet(self, s["title"], s["sheetId"])
+            ws.grid.update(s.get("grid") or {})
+            ws.conditional_formats = s.get("conditionalFormats") or []
+            ws.values = s.get("values") or []
+            self.sheets[ws.title] = ws
+
+    def save(self) -> None:
+        data = {
+            "sheets": [
+                {
+                    "title": ws.title,
+                    "sheetId": ws.id,
+                    "grid": ws.grid,
+                    "conditionalFormats": ws.conditional_formats,
+                    "values": ws.values,
+                }
+                for ws in self.sheets.values()
+            ]
+        }
+        with self._lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp = f"{self.path}.tmp{os.getpid()}"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp, self.path)
+            self.dirty = False
+
+    def _save_if_dirty(self) -> None:
+        if self.dirty:
+            self.save()
+
+    def _count(self, name: str) -> None:
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    # ---------- gspread-API ----------
+    def worksheet(self, title: str) -> FileWorksheet:
+        self._count("worksheet")
+        ws = self.sheets.get(title)
+        if ws is None:
+            raise KeyError(f"Arket findes ikke: {title}")
+        return ws
+
+    def add_worksheet(self, title: str, rows: int = 1000, cols: int = 26, **_kwargs) -> FileWorksheet:
+        self._count("add_worksheet")
+        ws = FileWorksheet(self, title, max((w.id for w in self.sheets.values()), default=-1) + 1, rows, cols)
+        self.sheets[title] = ws
+        self.save()
+        return ws
+
+    @property
+    def sheet1(self) -> FileWorksheet:
+        if not self.sheets:
+            return self.add_worksheet("Sheet1")
+        return next(iter(self.sheets.values()))
+
+    def values_batch_get(self, ranges: List[str], params: Optional[dict] = None) -> dict:
+        self._count("values_batch_get")
+        formatted = (params or {}).get("valueRenderOption", "FORMATTED_VALUE") == "FORMATTED_VALUE"
+        out = []
+        for a1_range in ranges:
+            title, first_row, _first_col, last_row = _parse_a1(a1_range)
+            values = self.worksheet(title)._read(first_row, last_row, formatted)
+            out.append({"range": a1_range, "values": values} if values else {"range": a1_range})
+        return {"valueRanges": out}
+
+    def values_batch_update(self, body: dict) -> dict:
+        self._count("values_batch_update")
+        for item in body.get("data", []):
+            title, first_row, first_col, _last = _parse_a1(item["range"])
+            self.sheets[title]._write(first_row, first_col, item.get("values") or [])
+        self.save()
+        return {"totalUpdatedCells": sum(len(r) for item in body.get("data", []) for r in item.get("values") or [])}
+
+    def batch_update(self, body: dict) -> dict:
+        self._count("batch_update")
+        by_id = {ws.id: ws for ws in self.sheets.values()}
+        for req in body.get("requests", []):
+            if "updateSheetProperties" in req:
+                props = req["updateSheetProperties"]["properties"]
+                by_id[props["sheetId"]].grid.update(props.get("gridProperties") or {})
+            elif "insertDimension" in req or "deleteDimension" in req:
+                rng = (req.get("insertDimension") or req.get("deleteDimension"))["range"]
+                ws = by_id[rng["sheetId"]]
+                start, end = rng["startIndex"], rng["endIndex"]
+                if rng.get("dimension", "ROWS") == "ROWS":
+                    if "insertDimension" in req:
+                        if start < len(ws.values):
+                            ws.values[start:start] = [[] for _ in range(end - start)]
+                        ws.grid["rowCount"] = ws.grid.get("rowCount", 0) + (end - start)
+                    else:
+                        del ws.values[start:end]
+                        ws.grid["rowCount"] = ws.grid.get("rowCount", 0) - (end - start)
+            elif "deleteConditionalFormatRule" in req:
+                d = req["deleteConditionalFormatRule"]
+                rules = by_id[d["sheetId"]].conditional_formats
+                if 0 <= d["index"] < len(rules):
+                    rules.pop(d["index"])
+            elif "addConditionalFormatRule" in req:
+                a = req["addConditionalFormatRule"]
+                ws = by_id[a["rule"]["ranges"][0]["sheetId"]]
+                ws.conditional_formats.insert(a.get("index", 0), a["rule"])
+            # øvrige requests (repeatCell-formatering mv.) påvirker ikke værdier
+        self.save()
+        return {"replies": []}
+
+    def fetch_sheet_metadata(self, params: Optional[dict] = None) -> dict:
+        self._count("fetch_sheet_metadata")
+        return {
+            "sheets": [
+                {
+                    "properties": {"sheetId": ws.id, "title": ws.title, "gridProperties": dict(ws.grid)},
+                    "conditionalFormats": list(ws.conditional_formats),
+                }
+                for ws in self.sheets.values()
+            ]
+        }
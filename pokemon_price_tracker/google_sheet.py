@@ -3,6 +3,14 @@ import json
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
 
+from pokemon_price_tracker.file_sheet import FileSpreadsheet
+from pokemon_price_tracker.sheets_throttle import get_throttle, throttled
+
+# Kvote-limiter + backoff omkring alle Sheets-kald (SHEETS_THROTTLE=0 slår fra)
+SHEETS_THROTTLE = os.getenv("SHEETS_THROTTLE", "1").strip() not in ("0", "false", "")
+# SHEETS_FILE=sti.json: brug et lokalt fil-baseret regneark i stedet for Google (offline replay)
+SHEETS_FILE = os.getenv("SHEETS_FILE", "").strip()
+
 
 def connect_google_sheet():
     """
@@ -16,6 +24,10 @@ def connect_google_sheet():
         "https://www.googleapis.com/auth/drive",
     ]
 
+    if SHEETS_FILE:
+        print(f"Bruger lokalt regneark: {SHEETS_FILE}")
+        return FileSpreadsheet(SHEETS_FILE)
+
     sa_json = os.getenv("GOOGLE_SERVICE_ACCOUNT_JSON")
     if not sa_json:
         raise RuntimeError("Mangler GOOGLE_SERVICE_ACCOUNT_JSON i GitHub Secrets")
@@ -27,5 +39,8 @@ def connect_google_sheet():
     creds = ServiceAccountCredentials.from_json_keyfile_dict(json.loads(sa_json), scope)
     client = gspread.authorize(creds)
 
-    sh = client.open_by_key(sheet_id)
-    return sh
+    if not SHEETS_THROTTLE:
+        return client.open_by_key(sheet_id)
+
+    sh = get_throttle().call("read", client.open_by_key, sheet_id)
+    return throttled(sh)
@@ -0,0 +1,78 @@
+import hashlib
+import os
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from pokemon_price_tracker import instrumentation, product_grouping
+from pokemon_price_tracker.state import load_json, save_json
+
+
+# ----------------- KONFIG -----------------
+GROUPING_CACHE_SIZE = int(os.getenv("GROUPING_CACHE_SIZE", "50000"))
+GROUPING_CACHE_FILE = "grouping_cache.json"
+# ------------------------------------------
+
+
+def _extra_digest(extra_text: Optional[str]) -> str:
+    if not extra_text:
+        return ""
+    return hashlib.blake2b(extra_text.encode("utf-8", "surrogatepass"), digest_size=8).hexdigest()
+
+
+class GroupingCache:
+    """
+    Bounded LRU omkring build_group_key_and_name, nøglet på
+    (titel, hash af extra_text, series_hint). Kan gemmes/indlæses mellem
+    kørsler; fingerprint sikrer at cachen smides væk når reglerne ændres.
+    """
+
+    def __init__(self, max_size: int = GROUPING_CACHE_SIZE):
+        self.max_size = max(1, int(max_size))
+        self.fingerprint = product_grouping.rules_fingerprint()
+        self._entries: "OrderedDict[Tuple[str, str, str], Tuple[str, str]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(
+        self,
+        product_title: str,
+        extra_text: Optional[str] = None,
+        series_hint: Optional[str] = None,
+    ) -> Tuple[str, str]:
+        hint = series_hint or ""
+        # extra_text bruges kun når serien ikke er kendt, så ellers skal den ikke hashes
+        extra = _extra_digest(extra_text) if hint in ("", "Unknown Series") else ""
+        cache_key = (product_title or "", extra, hint)
+
+        hit = self._entries.get(cache_key)
+        if hit is not None:
+            self._entries.move_to_end(cache_key)
+            self.hits += 1
+            return hit
+
+        self.misses += 1
+        with instrumentation.timer("grouping.build_s"):
+            result = product_grouping.build_group_key_and_name(product_title, extra_text, series_hint)
+        self._entries[cache_key] = result
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        return result
+
+    def load(self) -> None:
+        data = load_json(GROUPING_CACHE_FILE, default=None)
+        if not isinstance(data, dict) or data.get("fingerprint") != self.fingerprint:
+            return
+        for title, extra, hint, key, name in (data.get("entries") or [])[-self.max_size:]:
+            self._entries[(title, extra, hint)] = (key, name)
+
+    def save(self) -> None:
+        save_json(
+            {
+                "fingerprint": self.fingerprint,
+                "entries": [[t, e, h, k, n] for (t, e, h), (k, n) in self._entries.items()],
+            },
+            GROUPING_CACHE_FILE,
+        )
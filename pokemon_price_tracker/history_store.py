@@ -0,0 +1,184 @@
+import datetime
+import sqlite3
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+from pokemon_price_tracker.median_engine import OfferArrays
+from pokemon_price_tracker.state import state_path
+
+
+# ----------------- KONFIG -----------------
+HISTORY_DB_NAME = "price_history.sqlite"
+RAW_DATE_FORMAT = "%d-%m-%Y"  # dato-format i RawOffers-arket
+# ------------------------------------------
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    group_key TEXT
+);
+CREATE TABLE IF NOT EXISTS shops (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS urls (
+    id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS offers (
+    day INTEGER NOT NULL,          -- date.toordinal()
+    product_id INTEGER NOT NULL,
+    shop_id INTEGER NOT NULL,
+    price REAL NOT NULL,
+    available INTEGER NOT NULL,
+    url_id INTEGER,
+    ts TEXT
+);
+CREATE INDEX IF NOT EXISTS offers_product_day ON offers (product_id, day);
+"""
+
+
+class HistoryStore:
+    """
+    Append-only prishistorik i SQLite (sandheden for medianer).
+    Produkter, shops og URL'er gemmes én gang i opslagstabeller, så hver
+    offer-række kun er et par heltal + pris.
+    Produkt-identitet er det kanoniske navn (samme som Product i arkene);
+    group_key gemmes ved siden af når den kendes.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or state_path(HISTORY_DB_NAME)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.executescript(_SCHEMA)
+        self._ids: Dict[Tuple[str, str], int] = {}
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def is_empty(self) -> bool:
+        return self.conn.execute("SELECT 1 FROM offers LIMIT 1").fetchone() is None
+
+    def max_rowid(self) -> int:
+        """Offers er append-only, så højeste rowid fungerer som versionsnummer for historikken."""
+        return int(self.conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM offers").fetchone()[0])
+
+    def _lookup_id(self, table: str, column: str, value: str, group_key: Optional[str] = None) -> int:
+        cache_key = (table, value)
+        rid = self._ids.get(cache_key)
+        if rid is not None:
+            return rid
+
+        row = self.conn.execute(f"SELECT id FROM {table} WHERE {column} = ?", (value,)).fetchone()
+        if row is not None:
+            rid = row[0]
+            if group_key and table == "products":
+                self.conn.execute("UPDATE products SET group_key = ? WHERE id = ?", (group_key, rid))
+        elif table == "products":
+            rid = self.conn.execute(
+                "INSERT INTO products (name, group_key) VALUES (?, ?)", (value, group_key)
+            ).lastrowid
+        else:
+            rid = self.conn.execute(f"INSERT INTO {table} ({column}) VALUES (?)", (value,)).lastrowid
+
+        self._ids[cache_key] = rid
+        return rid
+
+    def append_offers(
+        self,
+        ts: str,
+        day: datetime.date,
+        offers: Iterable[Tuple[Optional[str], str, float, str, bool, str]],
+    ) -> int:
+        """
+        offers = (group_key, product_name, price, shop, available, url).
+        Returnerer antal skrevne rækker.
+        """
+        day_ord = day.toordinal()
+        rows = []
+        for group_key, name, price, shop, available, url in offers:
+            url_id = self._lookup_id("urls", "url", url) if url else None
+            rows.append((
+                day_ord,
+                self._lookup_id("products", "name", name, group_key),
+                self._lookup_id("shops", "name", shop),
+                float(price),
+                1 if available else 0,
+                url_id,
+                ts,
+            ))
+
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO offers (day, product_id, shop_id, price, available, url_id, ts) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+        return len(rows)
+
+    def load_offer_arrays(self, chunk_size: int = 200_000) -> OfferArrays:
+        """
+        Læs hele historikken én gang som kolonner til median_engine.
+        Hentes i bidder, så vi aldrig holder millioner af Python-tupler på én gang.
+        """
+        names = dict(self.conn.execute("SELECT id, name FROM products"))
+
+        chunks = []
+        cur = self.conn.execute("SELECT product_id, day, price, available FROM offers")
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            chunks.append(np.array(rows, dtype=np.float64))
+
+        if not chunks:
+            return OfferArrays([], np.zeros(0, np.int64), np.zeros(0, np.int64), np.zeros(0), np.zeros(0, bool))
+
+        data = np.concatenate(chunks)
+        product_ids, product_idx = np.unique(data[:, 0].astype(np.int64), return_inverse=True)
+        return OfferArrays(
+            [names.get(int(pid), str(pid)) for pid in product_ids],
+            product_idx.astype(np.int64),
+            data[:, 1].astype(np.int64),
+            data[:, 2],
+            data[:, 3] != 0,
+        )
+
+    def backfill_from_raw_values(self, values: list) -> int:
+        """
+        Engangs-import af RawOffers-arket (get_all_values()-format),
+        fx første gang eller hvis den lokale DB er gået tabt.
+        """
+        if not values or len(values) < 2:
+            return 0
+
+        idx = {h.strip(): i for i, h in enumerate(values[0])}
+        if not {"Date", "Product", "Price", "Shop", "Available"}.issubset(idx):
+            return 0
+
+        def cell(row, col):
+            i = idx.get(col)
+            return (row[i] or "").strip() if i is not None and i < len(row) else ""
+
+        by_ts_day: Dict[Tuple[str, datetime.date], list] = {}
+        for row in values[1:]:
+            try:
+                day = datetime.datetime.strptime(cell(row, "Date"), RAW_DATE_FORMAT).date()
+                price = float(cell(row, "Price"))
+            except ValueError:
+                continue
+            product = cell(row, "Product")
+            if not product:
+                continue
+            available = cell(row, "Available").upper() in ("TRUE", "1", "YES", "IN_STOCK")
+            by_ts_day.setdefault((cell(row, "Timestamp"), day), []).append(
+                (None, product, price, cell(row, "Shop"), available, cell(row, "URL"))
+            )
+
+        total = 0
+        for (ts, day), offers in by_ts_day.items():
+            total += self.append_offers(ts, day, offers)
+        return total
+
@@ -0,0 +1,133 @@
+import gzip
+import hashlib
+import os
+import tempfile
+import threading
+from typing import Optional
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from pokemon_price_tracker import instrumentation, state
+from pokemon_price_tracker.state import load_json, save_json
+
+
+# ----------------- KONFIG -----------------
+# HTTP_ARCHIVE=record gemmer alle svar fra http_client.get, HTTP_ARCHIVE=replay
+# serverer dem igen uden netværk (tom/ukendt = slået fra)
+HTTP_ARCHIVE = os.getenv("HTTP_ARCHIVE", "").strip().lower()
+# Relativ sti = under state-mappen (den oprindelige, også når replay isolerer state)
+HTTP_ARCHIVE_DIR = os.getenv("HTTP_ARCHIVE_DIR", "http_archive").strip()
+# Replay må aldrig skrive historik/medianer/crawl-state i den rigtige state;
+# tom = ny midlertidig mappe pr kørsel (kold), ellers en fast mappe (varm)
+HTTP_REPLAY_STATE_DIR = os.getenv("HTTP_REPLAY_STATE_DIR", "").strip()
+
+# Disse headers gælder den rå transport og passer ikke til den dekodede body
+DROP_HEADERS = frozenset({"content-encoding", "content-length", "transfer-encoding", "connection", "set-cookie"})
+# Betingede headers sendes ikke under record, så arkivet altid har fulde svar
+CONDITIONAL_HEADERS = ("If-None-Match", "If-Modified-Since")
+# ------------------------------------------
+
+# Arkivet ligger fast under state-mappen fra opstart, før isolate_state flytter resten
+_ARCHIVE_ROOT = os.path.abspath(os.path.join(state.STATE_DIR, HTTP_ARCHIVE_DIR))
+
+_write_lock = threading.Lock()
+_missing_logged = set()
+
+
+def recording() -> bool:
+    return HTTP_ARCHIVE == "record"
+
+
+def replaying() -> bool:
+    return HTTP_ARCHIVE == "replay"
+
+
+def _root() -> str:
+    return _ARCHIVE_ROOT
+
+
+def isolate_state() -> str:
+    """
+    Flyt state (historik, rolling medianer, grouping cache, crawl-state) til
+    HTTP_REPLAY_STATE_DIR eller en midlertidig mappe, så en replay-kørsel
+    ikke blander gamle data ind i næste live-kørsel. Returnerer mappen.
+    """
+    path = os.path.abspath(HTTP_REPLAY_STATE_DIR or tempfile.mkdtemp(prefix="ppt-replay-"))
+    state.set_state_dir(path)
+    return path
+
+
+def _entry_name(url: str) -> str:
+    return hashlib.sha256(url.encode("utf-8")).hexdigest()[:32] + ".json"
+
+
+def strip_conditional(headers: Optional[dict]) -> Optional[dict]:
+    if not headers:
+        return headers
+    return {k: v for k, v in headers.items() if k not in CONDITIONAL_HEADERS}
+
+
+def record(url: str, response: requests.Response) -> None:
+    """
+    Gem svaret: body gzip'et under blobs/<sha256>.gz (content-addressed, så
+    identiske sider kun gemmes én gang) og et indeks-opslag pr URL.
+    Læser hele body, så også stream=True-svar kan arkiveres; iter_content
+    virker bagefter stadig (requests serverer den læste body).
+    """
+    body = response.content
+    digest = hashlib.sha256(body).hexdigest()
+    blob = os.path.join(_root(), "blobs", digest[:2], f"{digest}.gz")
+
+    with _write_lock:
+        if not os.path.exists(blob):
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            tmp = f"{blob}.tmp{os.getpid()}"
+            with gzip.open(tmp, "wb", compresslevel=6) as f:
+                f.write(body)
+            os.replace(tmp, blob)
+
+    entry = {
+        "url": url,
+        "status": response.status_code,
+        "headers": {k: v for k, v in response.headers.items() if k.lower() not in DROP_HEADERS},
+        "encoding": response.encoding,
+        "body": digest,
+    }
+    save_json(entry, _root(), "entries", _entry_name(url))
+    instrumentation.count("http.archive_recorded")
+
+
+def replay(url: str) -> requests.Response:
+    """Svar fra arkivet; mangler URL'en, returneres 404 (som en død side live)."""
+    entry = load_json(_root(), "entries", _entry_name(url), default=None)
+    response = requests.Response()
+    response.url = url
+    response.headers = CaseInsensitiveDict()
+
+    body = b""
+    if entry:
+        digest = entry["body"]
+        try:
+            with gzip.open(os.path.join(_root(), "blobs", digest[:2], f"{digest}.gz"), "rb") as f:
+                body = f.read()
+            response.status_code = int(entry["status"])
+            response.headers.update(entry.get("headers") or {})
+            response.encoding = entry.get("encoding")
+        except OSError:
+            entry = None
+
+    if not entry:
+        instrumentation.count("http.archive_missing")
+        if url not in _missing_logged:
+            _missing_logged.add(url)
+            print(f"HTTP replay: {url} findes ikke i arkivet – svarer 404")
+        response.status_code = 404
+        response.reason = "Not in archive"
+        body = b""
+
+    # Som et færdiglæst svar: .text/.json() og iter_content() læser _content
+    response._content = body
+    response._content_consumed = True
+    instrumentation.count("http.archive_replayed")
+    return response
@@ -0,0 +1,280 @@
+import email.utils
+import os
+import threading
+import time
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from pokemon_price_tracker import http_archive, instrumentation
+
+try:
+    # urllib3 dekoder kun "br" hvis brotli (eller brotlicffi) er installeret
+    import brotli  # noqa: F401
+    _ACCEPT_ENCODING = "gzip, deflate, br"
+except ImportError:
+    try:
+        import brotlicffi  # noqa: F401
+        _ACCEPT_ENCODING = "gzip, deflate, br"
+    except ImportError:
+        _ACCEPT_ENCODING = "gzip, deflate"
+
+
+# ----------------- KONFIG -----------------
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "30"))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "3"))
+HTTP_BACKOFF = float(os.getenv("HTTP_BACKOFF", "0.5"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "8"))
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Høflighed pr host (AIMD): samtidighed vokser langsomt ved succes og halveres ved 429/5xx
+HOST_INITIAL_CONCURRENCY = float(os.getenv("HOST_INITIAL_CONCURRENCY", "2"))
+HOST_MAX_CONCURRENCY = float(os.getenv("HOST_MAX_CONCURRENCY", "6"))
+HOST_MIN_INTERVAL = float(os.getenv("HOST_MIN_INTERVAL", "0"))     # sek. mellem request-starter
+HOST_MAX_INTERVAL = float(os.getenv("HOST_MAX_INTERVAL", "10"))
+HOST_BACKOFF_STEP = 0.5                                              # første spacing efter en fejl
+HOST_SLOW_LATENCY = float(os.getenv("HOST_SLOW_LATENCY", "5"))      # EWMA over dette = host er presset
+HOST_MAX_RETRY_AFTER = 120.0
+# ------------------------------------------
+
+_sessions: Dict[str, requests.Session] = {}
+_sessions_lock = threading.Lock()
+
+# Host-aliaser til benchmark/offline-kørsler: "https://butik.dk" -> "http://127.0.0.1:8123".
+# Kan også sættes via HTTP_HOST_ALIASES="https://a.dk=http://127.0.0.1:8123,https://b.dk=..."
+_host_aliases: Dict[str, str] = {}
+
+
+class HostPolicy:
+    """
+    AIMD-styring af én host, delt af alle tråde der crawler den:
+      - limit: hvor mange requests der må være i gang samtidig
+      - interval: minimum tid mellem to request-starter
+      - blocked_until: Retry-After / backoff gælder hele hosten, ikke kun én tråd
+    Succes med normal latency: limit += 1/limit, interval skrumper.
+    429/5xx/netværksfejl: limit halveres, interval fordobles.
+    """
+
+    def __init__(self):
+        self.limit = max(1.0, HOST_INITIAL_CONCURRENCY)
+        self.interval = HOST_MIN_INTERVAL
+        self.in_flight = 0
+        self.next_start = 0.0
+        self.blocked_until = 0.0
+        self.latency: Optional[float] = None
+        self.requests = 0
+        self.throttled = 0
+        self._cond = threading.Condition()
+
+    def acquire(self) -> None:
+        with self._cond:
+            while True:
+                if self.in_flight < int(self.limit):
+                    wait = max(self.next_start, self.blocked_until) - time.monotonic()
+                    if wait <= 0:
+                        self.in_flight += 1
+                        self.requests += 1
+                        self.next_start = time.monotonic() + self.interval
+                        return
+                    self._cond.wait(wait)
+                else:
+                    self._cond.wait()
+
+    def release(self, latency: float, ok: bool, retry_after: Optional[float] = None) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            if ok:
+                self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+                if self.latency > HOST_SLOW_LATENCY:
+                    self.limit = max(1.0, self.limit * 0.75)
+                else:
+                    self.limit = min(HOST_MAX_CONCURRENCY, self.limit + 1.0 / self.limit)
+                    self.interval = max(HOST_MIN_INTERVAL, self.interval * 0.8 if self.interval > 0.05 else 0.0)
+            else:
+                self.throttled += 1
+                self.limit = max(1.0, self.limit / 2)
+                self.interval = min(HOST_MAX_INTERVAL, max(self.interval * 2, HOST_BACKOFF_STEP))
+                if retry_after:
+                    until = time.monotonic() + min(retry_after, HOST_MAX_RETRY_AFTER)
+                    self.blocked_until = max(self.blocked_until, until)
+            self._cond.notify_all()
+
+
+_policies: Dict[str, HostPolicy] = {}
+
+
+def _host_key(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}".lower()
+
+
+def _new_session() -> requests.Session:
+    retry = Retry(
+        total=HTTP_RETRIES,
+        connect=HTTP_RETRIES,
+        read=HTTP_RETRIES,
+        # status-retries (429/5xx) laves i get(), så HostPolicy ser dem
+        status=0,
+        backoff_factor=HTTP_BACKOFF,
+        allowed_methods=frozenset({"GET", "HEAD"}),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"Accept-Encoding": _ACCEPT_ENCODING})
+    return session
+
+
+def set_host_alias(host_url: str, target: str) -> None:
+    """Send alle requests til host_url (scheme + host) videre til target i stedet."""
+    _host_aliases[_host_key(host_url)] = target.rstrip("/")
+
+
+def clear_host_aliases() -> None:
+    _host_aliases.clear()
+
+
+def _resolve(url: str) -> str:
+    if not _host_aliases:
+        return url
+    key = _host_key(url)
+    target = _host_aliases.get(key)
+    return target + url[len(key):] if target else url
+
+
+for _pair in filter(None, os.getenv("HTTP_HOST_ALIASES", "").split(",")):
+    if "=" in _pair:
+        set_host_alias(*(x.strip() for x in _pair.split("=", 1)))
+
+
+def get_session(url: str) -> requests.Session:
+    """
+    Én keep-alive Session pr host (scheme + netloc), delt på tværs af tråde,
+    så alle sider fra samme butik genbruger TCP/TLS-forbindelsen.
+    """
+    key = _host_key(url)
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = _new_session()
+            _sessions[key] = session
+        return session
+
+
+def get_host_policy(url: str) -> HostPolicy:
+    key = _host_key(url)
+    with _sessions_lock:
+        policy = _policies.get(key)
+        if policy is None:
+            policy = HostPolicy()
+            _policies[key] = policy
+        return policy
+
+
+def _retry_after_seconds(response: requests.Response) -> Optional[float]:
+    value = (response.headers.get("Retry-After") or "").strip()
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+        return max(0.0, when.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def get(url: str, headers: Optional[dict] = None, timeout=None, **kwargs) -> requests.Response:
+    """
+    GET via den delte transport (pooling, gzip/brotli) og hostens HostPolicy.
+    Connect/read-fejl retries af urllib3; 429/5xx retries her med Retry-After
+    (eller eksponentiel backoff) som pause for hele hosten.
+    Status-koden på sidste forsøg returneres som den er.
+    Med HTTP_ARCHIVE=record/replay arkiveres svarene / serveres fra disk.
+    """
+    if http_archive.replaying():
+        return http_archive.replay(url)
+    archive_url = url
+    if http_archive.recording():
+        headers = http_archive.strip_conditional(headers)
+
+    if timeout is None:
+        timeout = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+    host = urlsplit(url).netloc.lower()  # før alias, så rapporten viser butikken
+    url = _resolve(url)
+    session = get_session(url)
+    policy = get_host_policy(url)
+
+    attempt = 0
+    while True:
+        waited = time.monotonic()
+        policy.acquire()
+        started = time.monotonic()
+        instrumentation.observe("http.wait_s", started - waited, host=host)
+        try:
+            response = session.get(url, headers=headers, timeout=timeout, **kwargs)
+        except requests.RequestException:
+            policy.release(time.monotonic() - started, ok=False)
+            instrumentation.count("http.errors", host=host)
+            raise
+
+        latency = time.monotonic() - started
+        instrumentation.observe("http.latency_s", latency, host=host)
+        instrumentation.count("http.requests", host=host, status=response.status_code)
+        # ved stream=True kendes kun Content-Length (komprimeret størrelse, hvis den er sat)
+        size = response.headers.get("Content-Length")
+        if size and size.isdigit():
+            instrumentation.count("http.bytes", int(size), host=host)
+        elif not kwargs.get("stream"):
+            instrumentation.count("http.bytes", len(response.content), host=host)
+
+        if response.status_code not in RETRY_STATUSES:
+            policy.release(latency, ok=True)
+            if http_archive.recording():
+                http_archive.record(archive_url, response)
+            return response
+
+        retry_after = _retry_after_seconds(response)
+        if retry_after is None:
+            retry_after = HTTP_BACKOFF * (2 ** attempt)
+        policy.release(latency, ok=False, retry_after=retry_after)
+
+        if attempt >= HTTP_RETRIES:
+            if http_archive.recording():
+                http_archive.record(archive_url, response)
+            return response
+        attempt += 1
+        response.close()
+
+
+def host_stats() -> Dict[str, dict]:
+    """Nuværende AIMD-tilstand pr host (til logs)."""
+    with _sessions_lock:
+        policies = dict(_policies)
+    return {
+        host: {
+            "requests": p.requests,
+            "throttled": p.throttled,
+            "limit": round(p.limit, 2),
+            "interval": round(p.interval, 3),
+            "latency": round(p.latency, 3) if p.latency is not None else None,
+        }
+        for host, p in policies.items()
+    }
+
+
+def close_all() -> None:
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
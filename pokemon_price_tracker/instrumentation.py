@@ -0,0 +1,179 @@
+import datetime
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from pokemon_price_tracker.state import save_json
+
+
+# ----------------- KONFIG -----------------
+RUN_REPORT_FILE = "run_report.json"
+# Skriv også rapporten som GitHub Actions job summary (hvis GITHUB_STEP_SUMMARY findes)
+RUN_REPORT_SUMMARY = os.getenv("RUN_REPORT_SUMMARY", "1").strip() not in ("0", "false", "")
+MAX_SAMPLES = 10000  # pr histogram; derefter kun count/sum/min/max
+# ------------------------------------------
+
+
+def _key(name: str, labels: dict) -> str:
+    if not labels:
+        return name
+    return name + "[" + ",".join(f"{k}={labels[k]}" for k in sorted(labels)) + "]"
+
+
+class _Histogram:
+    __slots__ = ("count", "total", "min", "max", "samples")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = float("-inf")
+        self.samples: List[float] = []
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if len(self.samples) < MAX_SAMPLES:
+            self.samples.append(value)
+
+    def summary(self) -> dict:
+        ordered = sorted(self.samples)
+
+        def pct(p: float) -> float:
+            return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))], 4) if ordered else 0.0
+
+        return {
+            "count": self.count,
+            "sum": round(self.total, 4),
+            "min": round(self.min, 4) if self.count else 0.0,
+            "p50": pct(0.50),
+            "p95": pct(0.95),
+            "max": round(self.max, 4) if self.count else 0.0,
+        }
+
+
+class Metrics:
+    """
+    Let instrumentering til én kørsel: counters og histogrammer (timere er
+    histogrammer i sekunder), nøglet på navn + labels. Trådsikker.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self.counters: Dict[str, float] = {}
+        self.histograms: Dict[str, _Histogram] = {}
+
+    def count(self, name: str, value: float = 1, **labels) -> None:
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = _key(name, labels)
+        with self._lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = _Histogram()
+            hist.add(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - t0, **labels)
+
+    def timed(self, fn, name: str, **labels):
+        """Wrap fn, så hvert kald måles med timer(name, **labels)."""
+        def wrapper(*args, **kwargs):
+            with self.timer(name, **labels):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    def report(self) -> dict:
+        with self._lock:
+            counters = dict(sorted(self.counters.items()))
+            histograms = {k: h.summary() for k, h in sorted(self.histograms.items())}
+        return {
+            "started": datetime.datetime.fromtimestamp(self.started).isoformat(timespec="seconds"),
+            "duration_s": round(time.time() - self.started, 2),
+            "counters": counters,
+            "timers": histograms,
+        }
+
+
+class StageClock:
+    """
+    Tider for sekventielle faser i main: mark("scan") registrerer tiden siden
+    forrige mark (eller start) som stage_s[stage=scan].
+    """
+
+    def __init__(self, metrics: Metrics):
+        self.metrics = metrics
+        self.last = time.perf_counter()
+
+    def mark(self, stage: str) -> float:
+        now = time.perf_counter()
+        elapsed = now - self.last
+        self.last = now
+        self.metrics.observe("stage_s", elapsed, stage=stage)
+        return elapsed
+
+
+metrics = Metrics()
+
+# Genveje, så kaldsstederne kan skrive instrumentation.timer(...) osv.
+count = metrics.count
+observe = metrics.observe
+timer = metrics.timer
+timed = metrics.timed
+
+
+def stage_clock() -> StageClock:
+    return StageClock(metrics)
+
+
+def _markdown(report: dict) -> str:
+    lines = [
+        "## Pokémon price tracker – kørselsrapport",
+        "",
+        f"Start: {report['started']} · varighed: {report['duration_s']} s",
+        "",
+        "| Timer | antal | sum (s) | p50 | p95 | max |",
+        "|---|---:|---:|---:|---:|---:|",
+    ]
+    for name, h in report["timers"].items():
+        lines.append(f"| `{name}` | {h['count']} | {h['sum']} | {h['p50']} | {h['p95']} | {h['max']} |")
+    lines += ["", "| Counter | værdi |", "|---|---:|"]
+    for name, value in report["counters"].items():
+        lines.append(f"| `{name}` | {value:g} |")
+    return "\n".join(lines) + "\n"
+
+
+def write_run_report(path: Optional[str] = None) -> dict:
+    """
+    Gem rapporten som JSON i state-mappen (eller path) og, når vi kører i
+    GitHub Actions, som job summary.
+    """
+    report = metrics.report()
+    if path:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    else:
+        save_json(report, RUN_REPORT_FILE)
+
+    summary_path = os.getenv("GITHUB_STEP_SUMMARY", "").strip()
+    if RUN_REPORT_SUMMARY and summary_path:
+        try:
+            with open(summary_path, "a", encoding="utf-8") as f:
+                f.write(_markdown(report))
+        except OSError as e:
+            print(f"Kunne ikke skrive job summary: {e}")
+    return report
@@ -0,0 +1,74 @@
+import codecs
+import json
+import re
+from typing import Iterable, Iterator
+
+_WS = " \t\r\n"
+_decoder = json.JSONDecoder()
+
+
+def iter_json_array(chunks: Iterable[bytes], key: str) -> Iterator[dict]:
+    """
+    Yield elementerne i et top-level array, fx {"products": [...]}, efterhånden
+    som bytes kommer ind, uden at hele dokumentet bygges i hukommelsen.
+
+    Hvert element dekodes med json's C-decoder (raw_decode); er et element
+    ikke kommet helt ind endnu, læser vi næste chunk og prøver igen.
+    Mangler nøglen, yieldes intet.
+    """
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    start_re = re.compile(r'"' + re.escape(key) + r'"\s*:\s*\[')
+    chunk_iter = iter(chunks)
+
+    buf = ""
+    eof = False
+
+    def read_more() -> bool:
+        nonlocal buf, eof
+        if eof:
+            return False
+        for chunk in chunk_iter:
+            if chunk:
+                buf += text_decoder.decode(chunk)
+                return True
+        buf += text_decoder.decode(b"", final=True)
+        eof = True
+        return False
+
+    # Find starten af arrayet
+    while True:
+        m = start_re.search(buf)
+        if m:
+            pos = m.end()
+            break
+        # behold kun halen, så en nøgle delt over to chunks stadig findes
+        if len(buf) > 65536:
+            buf = buf[-(len(key) + 64):]
+        if not read_more():
+            return
+
+    while True:
+        # spring whitespace og kommaer over
+        while True:
+            while pos < len(buf) and (buf[pos] in _WS or buf[pos] == ","):
+                pos += 1
+            if pos < len(buf):
+                break
+            buf, pos = "", 0
+            if not read_more():
+                raise ValueError(f"JSON-array '{key}' sluttede uventet")
+
+        if buf[pos] == "]":
+            return
+
+        try:
+            item, end = _decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if not read_more():
+                raise
+            continue
+
+        yield item
+
+        # smid det forbrugte væk, så bufferen kun holder det aktuelle element
+        buf, pos = buf[end:], 0
@@ -1,15 +1,31 @@
 import os
+import argparse
 import datetime
-import statistics
+import difflib
 import importlib
+import itertools
 import pkgutil
-from typing import Optional, Dict, Tuple, List
+from typing import Optional, Dict, Tuple, List, Iterable, Iterator
 
 import gspread
 
-from pokemon_price_tracker.google_sheet import connect_google_sheet
+from pokemon_price_tracker.google_sheet import SHEETS_FILE, connect_google_sheet
+from pokemon_price_tracker.sheets_throttle import get_throttle
+from pokemon_price_tracker.history_store import RAW_DATE_FORMAT, HistoryStore
+from pokemon_price_tracker.median_engine import arrays_from_raw_values, compute_daily_medians
+from pokemon_price_tracker.rolling_stats import RollingMedianState
 from pokemon_price_tracker.push_notification import send_push
-from pokemon_price_tracker.product_grouping import build_group_key_and_name
+from pokemon_price_tracker.grouping_cache import GroupingCache
+from pokemon_price_tracker.offers import Offer, Product
+from pokemon_price_tracker import http_archive, instrumentation, profiling
+from pokemon_price_tracker.sheet_session import SheetSession, a1_sheet
+from pokemon_price_tracker.scan_scheduler import (
+    SCAN_MAX_PER_HOST,
+    SCAN_MAX_WORKERS,
+    ScanEvent,
+    collect_scan_tasks,
+    stream_scan_tasks,
+)
 
 
 # ----------------- KONFIG -----------------
@@ -17,11 +33,21 @@ SHEET_SUMMARY_TITLE = "Sheet1"
 SHEET_IN_STOCK_TITLE = "Billigste in stock"
 SHEET_RAW_TITLE = "RawOffers"
 
+# Lokal SQLite-historik er sandheden for medianer; RawOffers-arket er et fast spejl.
+# DB'en ligger kun i state-cachen (kan evictes), så arket er den varige kopi,
+# som historikken genopbygges fra, hvis DB'en er væk.
+RAW_APPEND_BATCH = 5000  # tilbud pr skrivning til DB/ark mens scanningen kører
+
 MIN_HISTORY_FOR_PUSH = 5
 DISCOUNT_PCT = 0.15
 MAX_PUSH_LINES = 20
 
 SNAPSHOT_HEADERS = ["Product", "Median", "Price", "Prev Price", "Δ", "Δ%", "Shop", "Stock", "Updated"]
+# Diff-mode: skriv kun ændrede rækker og rør kun formatting når reglerne afviger
+SNAPSHOT_DIFF = os.getenv("SNAPSHOT_DIFF", "1").strip() not in ("0", "false", "")
+# Rækker matches på Product og skrives kun når en af disse kolonner ændres;
+# "Updated" (sidste scanning) skrives for alle rækker som én kolonne
+SNAPSHOT_DIFF_COLUMNS = len(SNAPSHOT_HEADERS) - 1
 # ------------------------------------------
 
 
@@ -58,20 +84,50 @@ def make_shop_cell(shop_label: str, url: str) -> str:
     return f'=HYPERLINK("{safe_url}","{safe_text}")'
 
 
-def ensure_raw_headers(raw_ws):
+def ensure_raw_headers(raw_ws, header: Optional[List[str]] = None):
+    """header kan gives med, hvis række 1 allerede er læst (fx via SheetSession)."""
     wanted = ["Timestamp", "Date", "Product", "Price", "Shop", "URL", "Available"]
-    header = raw_ws.row_values(1)
+    if header is None:
+        header = raw_ws.row_values(1)
     if header != wanted:
         raw_ws.update("A1:G1", [wanted])
 
 
-def append_raw_offers(raw_ws, today_str: str, offers_by_group: Dict[str, list], group_name_map: Dict[str, str]):
+def append_raw_offers(
+    raw_ws,
+    today_str: str,
+    offers: Iterable[Tuple[str, str, Offer]],
+    store: Optional[HistoryStore] = None,
+    batch_size: int = RAW_APPEND_BATCH,
+) -> int:
+    """
+    offers = (group_key, canonical_name, Offer), gerne en generator.
+    Skrives i batches efterhånden som de kommer, så vi aldrig holder alle rækker.
+    Returnerer antal skrevne tilbud.
+    """
     now_ts = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    rows = []
-    for gkey, offers in offers_by_group.items():
-        canonical_name = group_name_map.get(gkey, gkey)
-        for price, shop, available, url in offers:
-            rows.append([
+    today = datetime.datetime.strptime(today_str, RAW_DATE_FORMAT).date()
+
+    total = 0
+    offers_iter = iter(offers)
+    while True:
+        batch = list(itertools.islice(offers_iter, batch_size))
+        if not batch:
+            break
+        total += len(batch)
+
+        if store is not None:
+            store.append_offers(
+                now_ts,
+                today,
+                (
+                    (gkey, canonical_name, price, shop, available, url or "")
+                    for gkey, canonical_name, (price, shop, available, url) in batch
+                ),
+            )
+
+        rows = [
+            [
                 now_ts,
                 today_str,
                 canonical_name,
@@ -79,38 +135,115 @@ def append_raw_offers(raw_ws, today_str: str, offers_by_group: Dict[str, list],
                 shop,
                 url or "",
                 "TRUE" if available else "FALSE",
-            ])
-
-    if rows:
+            ]
+            for _gkey, canonical_name, (price, shop, available, url) in batch
+        ]
         raw_ws.append_rows(rows, value_input_option="USER_ENTERED")
 
+    return total
 
-def _bool_from_raw(s: str) -> bool:
-    s = (s or "").strip().upper()
-    return s in ("TRUE", "1", "YES", "IN_STOCK")
+
+def iter_grouped_offers(
+    events: Iterable[ScanEvent],
+    grouping: GroupingCache,
+) -> Iterator[Tuple[str, str, Offer]]:
+    """
+    scan -> filter -> group: yield (group_key, canonical_name, offer) pr gyldigt produkt,
+    efterhånden som crawl-trådene leverer dem. Efter grupperingen lever kun
+    Offer videre; Product (inkl. grouping_text) kan smides væk.
+    """
+    for event in events:
+        shop_label = event.task.label
+        if event.kind == "error":
+            print(f"Fejl i shop {shop_label}: {event.value}")
+            continue
+        if event.kind == "done":
+            # shop-modulerne logger selv "hentede N produkter"
+            continue
+
+        p = event.value
+        if isinstance(p, dict):
+            # shop-moduler der (stadig) yielder dicts
+            p = Product.from_dict(p)
+            if p is None:
+                continue
+
+        raw_name = p.name.strip()
+        if not raw_name:
+            continue
+
+        group_key, canonical_name = grouping.get(
+            raw_name,
+            extra_text=p.grouping_text,
+            series_hint=p.series_hint,
+        )
+
+        yield group_key, canonical_name, Offer(p.price, p.shop_source or shop_label, p.available, p.url.strip())
 
 
 # ----------------- VÆLG BILLIGSTE -----------------
-def choose_cheapest_overall(offers: List[Tuple[float, str, bool, str]]):
+def _offer_order(o: Offer) -> Tuple[float, str, str]:
+    # Ved samme pris afgør shop/url, så vinderen ikke afhænger af hvilken crawl-tråd der blev først færdig
+    return o.price, o.shop, o.url
+
+
+def choose_cheapest_overall(offers: List[Offer]) -> Offer:
     # 100% billigste uanset lager
-    return min(offers, key=lambda t: t[0])
+    return min(offers, key=_offer_order)
 
 
-def choose_cheapest_in_stock(offers: List[Tuple[float, str, bool, str]]):
+def choose_cheapest_in_stock(offers: List[Offer]) -> Optional[Offer]:
     # Kun in-stock. Returnér None hvis intet er på lager (så produktet ikke kommer med).
-    in_stock = [o for o in offers if o[2] is True]
+    in_stock = [o for o in offers if o.available]
     if not in_stock:
         return None
-    return min(in_stock, key=lambda t: t[0])
+    return min(in_stock, key=_offer_order)
+
+
+class CheapestOffers:
+    """
+    Billigste tilbud pr gruppe, opdateret løbende mens tilbuddene strømmer
+    forbi, så hukommelsen kun afhænger af antal grupper.
+    """
+
+    def __init__(self):
+        self.names: Dict[str, str] = {}
+        self.overall: Dict[str, Offer] = {}
+        self.in_stock: Dict[str, Offer] = {}
+
+    def add(self, gkey: str, canonical_name: str, offer: Offer) -> None:
+        self.names[gkey] = canonical_name
+
+        best = self.overall.get(gkey)
+        self.overall[gkey] = offer if best is None else choose_cheapest_overall([best, offer])
+
+        best = self.in_stock.get(gkey)
+        best_instock = choose_cheapest_in_stock([offer] if best is None else [best, offer])
+        if best_instock is not None:
+            self.in_stock[gkey] = best_instock
+
+    def track(self, offers: Iterable[Tuple[str, str, Offer]]):
+        """Pass-through generator: registrér hvert tilbud og send det videre."""
+        for gkey, canonical_name, offer in offers:
+            self.add(gkey, canonical_name, offer)
+            yield gkey, canonical_name, offer
+
+    def chosen(self):
+        chosen_summary: Dict[str, Offer] = {}
+        chosen_instock: Dict[str, Offer] = {}
+        for gkey, offer in self.overall.items():
+            chosen_summary[self.names.get(gkey, gkey)] = offer
+        for gkey, offer in self.in_stock.items():
+            chosen_instock[self.names.get(gkey, gkey)] = offer
+        return chosen_summary, chosen_instock
 
 
 # ----------------- SNAPSHOT HELPERS -----------------
-def get_prev_price_map(ws) -> Dict[str, float]:
+def prev_price_map_from_values(values: List[List[str]]) -> Dict[str, float]:
     """
     Læs forrige snapshot (kolonne A=Product, C=Price).
     Hvis arket stadig er i gammelt "dato-kolonne"-format, returnér {}.
     """
-    values = ws.get_all_values()
     if not values or len(values) < 2:
         return {}
 
@@ -125,7 +258,7 @@ def get_prev_price_map(ws) -> Dict[str, float]:
     for row in values[1:]:
         if len(row) < 3:
             continue
-        name = (row[0] or "").strip()
+        name = str(row[0] or "").strip()
         if not name:
             continue
         p = parse_float(row[2])
@@ -135,158 +268,211 @@ def get_prev_price_map(ws) -> Dict[str, float]:
     return out
 
 
+def get_prev_price_map(ws) -> Dict[str, float]:
+    return prev_price_map_from_values(ws.get_all_values())
+
+
 def build_daily_medians_from_raw(raw_ws, mode: str) -> Tuple[Dict[str, float], Dict[str, int]]:
     """
     mode = "overall"  -> daily min uanset lager
     mode = "in_stock" -> daily min kun Available=TRUE
     Median = median af daily minima (1 tal pr dag).
     hist_days = antal dage med data.
+    Bruges kun til ark-baseret historik; main() læser fra HistoryStore.
     """
-    values = raw_ws.get_all_values()
-    if not values or len(values) < 2:
-        return {}, {}
+    return compute_daily_medians(arrays_from_raw_values(raw_ws.get_all_values()))[mode]
 
-    header = values[0]
-    idx = {h.strip(): i for i, h in enumerate(header)}
 
-    needed = {"Date", "Product", "Price", "Available"}
-    if not needed.issubset(idx):
-        return {}, {}
+def _snapshot_format_requests(sheet_id: int, existing_rules: int, delta_col_index_1based: int = 5) -> List[dict]:
+    """
+    - Freeze header
+    - Bold header
+    - Conditional formatting på Δ:
+        grøn (<0), gul (=0), rød (>0)
+    """
+    requests = []
+
+    # Freeze 1. række
+    requests.append({
+        "updateSheetProperties": {
+            "properties": {
+                "sheetId": sheet_id,
+                "gridProperties": {"frozenRowCount": 1},
+            },
+            "fields": "gridProperties.frozenRowCount",
+        }
+    })
+
+    # Bold header
+    requests.append({
+        "repeatCell": {
+            "range": {"sheetId": sheet_id, "startRowIndex": 0, "endRowIndex": 1},
+            "cell": {"userEnteredFormat": {"textFormat": {"bold": True}}},
+            "fields": "userEnteredFormat.textFormat.bold",
+        }
+    })
+
+    # Slet gamle conditional rules (så vi ikke stapler nye på hver dag)
+    for i in range(existing_rules - 1, -1, -1):
+        requests.append({"deleteConditionalFormatRule": {"sheetId": sheet_id, "index": i}})
+
+    # Range: Δ-kolonnen (E) fra række 2 og ned
+    start_col = delta_col_index_1based - 1
+    rng = {
+        "sheetId": sheet_id,
+        "startRowIndex": 1,  # skip header
+        "startColumnIndex": start_col,
+        "endColumnIndex": start_col + 1,
+    }
 
-    daily_min: Dict[Tuple[str, str], float] = {}
+    def add_rule(cond_type: str, value: str, rgb: Tuple[float, float, float]):
+        r, g, b = rgb
+        requests.append({
+            "addConditionalFormatRule": {
+                "rule": {
+                    "ranges": [rng],
+                    "booleanRule": {
+                        "condition": {
+                            "type": cond_type,
+                            "values": [{"userEnteredValue": value}],
+                        },
+                        "format": {
+                            "backgroundColor": {"red": r, "green": g, "blue": b}
+                        },
+                    },
+                },
+                "index": 0,
+            }
+        })
 
-    for row in values[1:]:
-        try:
-            date = (row[idx["Date"]] or "").strip()
-            product = (row[idx["Product"]] or "").strip()
-            price = parse_float(row[idx["Price"]] if idx["Price"] < len(row) else "")
-            available = _bool_from_raw(row[idx["Available"]] if idx["Available"] < len(row) else "")
-        except Exception:
-            continue
+    # Grøn: fald
+    add_rule("NUMBER_LESS", "0", (0.80, 0.94, 0.80))
+    # Gul: uændret
+    add_rule("NUMBER_EQ", "0", (1.00, 0.96, 0.70))
+    # Rød: steget
+    add_rule("NUMBER_GREATER", "0", (0.98, 0.80, 0.80))
 
-        if not date or not product or price is None:
-            continue
+    return requests
 
-        if mode == "in_stock" and not available:
-            continue
 
-        key = (product, date)
-        fp = float(price)
-        if key not in daily_min or fp < daily_min[key]:
-            daily_min[key] = fp
+def _cell_key(value) -> str:
+    """
+    Sammenligningsnøgle for en celle: tal normaliseres (så "103", 103 og 103.0
+    er ens), alt andet sammenlignes som tekst. Arket læses med FORMULA-rendering,
+    så HYPERLINK-formler og rå tal kommer tilbage som de blev skrevet.
+    """
+    if isinstance(value, bool):
+        return str(value).upper()
+    f = parse_float(value)
+    if f is not None:
+        return f"{f:.9g}"
+    return str(value if value is not None else "").strip()
 
-    by_product: Dict[str, List[float]] = {}
-    for (product, _date), p in daily_min.items():
-        by_product.setdefault(product, []).append(p)
 
-    median_map: Dict[str, float] = {}
-    hist_days_map: Dict[str, int] = {}
-    for product, prices in by_product.items():
-        median_map[product] = float(statistics.median(prices))
-        hist_days_map[product] = len(prices)
+def _row_keys(row: list, n_cols: int) -> List[str]:
+    row = list(row)[:n_cols]
+    return [_cell_key(v) for v in row] + [""] * (n_cols - len(row))
 
-    return median_map, hist_days_map
 
+def _consecutive_runs(indexes: List[int]) -> List[Tuple[int, int]]:
+    """[2, 3, 4, 9] -> [(2, 4), (9, 9)]"""
+    runs: List[Tuple[int, int]] = []
+    for i in indexes:
+        if runs and runs[-1][1] == i - 1:
+            runs[-1] = (runs[-1][0], i)
+        else:
+            runs.append((i, i))
+    return runs
 
-def _apply_snapshot_formatting(ws, delta_col_index_1based: int = 5):
-    """
-    - Freeze header
-    - Bold header
-    - Conditional formatting på Δ:
-        grøn (<0), gul (=0), rød (>0)
-    """
-    try:
-        sh = ws.spreadsheet
-        sheet_id = ws._properties["sheetId"]
 
-        meta = sh.fetch_sheet_metadata()
-        conditional_rules = []
-        for s in meta.get("sheets", []):
-            props = s.get("properties", {})
-            if props.get("sheetId") == sheet_id:
-                conditional_rules = s.get("conditionalFormatRules", []) or []
-                break
+def _dimension_request(kind: str, sheet_id: int, start: int, end: int) -> dict:
+    rng = {"sheetId": sheet_id, "dimension": "ROWS", "startIndex": start, "endIndex": end}
+    if kind == "insertDimension":
+        # arv formatering fra rækken over, men aldrig fra headeren
+        return {kind: {"range": rng, "inheritFromBefore": start > 1}}
+    return {kind: {"range": rng}}
 
-        requests = []
 
-        # Freeze 1. række
-        requests.append({
-            "updateSheetProperties": {
-                "properties": {
-                    "sheetId": sheet_id,
-                    "gridProperties": {"frozenRowCount": 1},
-                },
-                "fields": "gridProperties.frozenRowCount",
-            }
-        })
+def _align_snapshot_rows(sheet_id: int, old_names: List[str], new_names: List[str]) -> Tuple[List[dict], Dict[int, int]]:
+    """
+    Match gårsdagens og dagens rækker på produktnavn, så en ny/forsvundet
+    gruppe ikke forskyder (og dermed omskriver) alle rækkerne under den.
+    Returnerer (insert/deleteDimension-requests, {ny data-række: gammel data-række})
+    for rækker med samme navn. Requests laves nedefra og op, så index'er
+    længere oppe stadig passer; række 0 i arket er headeren.
+    """
+    matcher = difflib.SequenceMatcher(None, old_names, new_names, autojunk=False)
+    requests: List[dict] = []
+    matched: Dict[int, int] = {}
+    for tag, i1, i2, j1, j2 in reversed(matcher.get_opcodes()):
+        if tag == "equal":
+            for k in range(i2 - i1):
+                matched[j1 + k] = i1 + k
+            continue
+        # "replace": overskriv de første rækker på stedet, indsæt/slet resten
+        keep = min(i2 - i1, j2 - j1)
+        if i2 - i1 > keep:
+            requests.append(_dimension_request("deleteDimension", sheet_id, 1 + i1 + keep, 1 + i2))
+        elif j2 - j1 > keep:
+            requests.append(_dimension_request("insertDimension", sheet_id, 1 + i2, 1 + i2 + (j2 - j1 - keep)))
+    return requests, matched
+
+
+def _column_letter(n: int) -> str:
+    letters = ""
+    while n:
+        n, rem = divmod(n - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+def _rule_signature(rule: dict) -> tuple:
+    boolean = rule.get("booleanRule", {}) or {}
+    cond = boolean.get("condition", {}) or {}
+    bg = (boolean.get("format", {}) or {}).get("backgroundColor", {}) or {}
+    return (
+        tuple(sorted((k, v) for r in rule.get("ranges", []) or [] for k, v in r.items())),
+        cond.get("type"),
+        tuple(v.get("userEnteredValue") for v in cond.get("values", []) or []),
+        tuple(round(float(bg.get(c, 0)), 2) for c in ("red", "green", "blue")),
+    )
 
-        # Bold header
-        requests.append({
-            "repeatCell": {
-                "range": {"sheetId": sheet_id, "startRowIndex": 0, "endRowIndex": 1},
-                "cell": {"userEnteredFormat": {"textFormat": {"bold": True}}},
-                "fields": "userEnteredFormat.textFormat.bold",
-            }
-        })
 
-        # Slet gamle conditional rules (så vi ikke stapler nye på hver dag)
-        for i in range(len(conditional_rules) - 1, -1, -1):
-            requests.append({"deleteConditionalFormatRule": {"sheetId": sheet_id, "index": i}})
-
-        # Range: Δ-kolonnen (E) fra række 2 og ned
-        start_col = delta_col_index_1based - 1
-        rng = {
-            "sheetId": sheet_id,
-            "startRowIndex": 1,  # skip header
-            "startColumnIndex": start_col,
-            "endColumnIndex": start_col + 1,
-        }
+def _snapshot_formatting_current(sheet_meta: dict, format_requests: List[dict]) -> bool:
+    """True hvis arket allerede har frozen header og præcis de Δ-regler vi ville lægge på."""
+    grid = sheet_meta.get("properties", {}).get("gridProperties", {}) or {}
+    if grid.get("frozenRowCount") != 1:
+        return False
 
-        def add_rule(cond_type: str, value: str, rgb: Tuple[float, float, float]):
-            r, g, b = rgb
-            requests.append({
-                "addConditionalFormatRule": {
-                    "rule": {
-                        "ranges": [rng],
-                        "booleanRule": {
-                            "condition": {
-                                "type": cond_type,
-                                "values": [{"userEnteredValue": value}],
-                            },
-                            "format": {
-                                "backgroundColor": {"red": r, "green": g, "blue": b}
-                            },
-                        },
-                    },
-                    "index": 0,
-                }
-            })
-
-        # Grøn: fald
-        add_rule("NUMBER_LESS", "0", (0.80, 0.94, 0.80))
-        # Gul: uændret
-        add_rule("NUMBER_EQ", "0", (1.00, 0.96, 0.70))
-        # Rød: steget
-        add_rule("NUMBER_GREATER", "0", (0.98, 0.80, 0.80))
-
-        sh.batch_update({"requests": requests})
-    except Exception:
-        # Hvis formatting fejler, skal scriptet stadig virke
-        pass
+    # Reglerne indsættes på index 0 én ad gangen, så de ender i omvendt rækkefølge
+    wanted = [
+        _rule_signature(r["addConditionalFormatRule"]["rule"])
+        for r in format_requests
+        if "addConditionalFormatRule" in r
+    ][::-1]
+    existing = [_rule_signature(r) for r in sheet_meta.get("conditionalFormats", []) or []]
+    return existing == wanted
 
 
 def update_snapshot_sheet(
+    session: SheetSession,
     ws,
-    chosen_today: Dict[str, Tuple[float, str, bool, str]],
-    prev_price_map: Dict[str, float],
+    chosen_today: Dict[str, Offer],
+    prev_values: List[List[str]],
     median_map: Dict[str, float],
     hist_days_map: Dict[str, int],
     updated_ts: str,
     sheet_kind: str,
 ):
+    """
+    Bygger snapshot-rækkerne og lægger resize/format/værdier i session;
+    intet sendes før session.flush(). prev_values = arkets nuværende indhold.
+    """
+    prev_price_map = prev_price_map_from_values(prev_values)
     rows = []
     push_candidates = []
 
+    # Sorteret alfabetisk på Product allerede her, så arket ikke skal sorteres bagefter
     for name in sorted(chosen_today.keys()):
         offer = chosen_today[name]
         if offer is None:
@@ -317,26 +503,89 @@ def update_snapshot_sheet(
         if sheet_kind == "in_stock" and available:
             push_candidates.append((name, price, shop_label, median, hist_days))
 
-    ws.clear()
-    ws.resize(rows=max(1000, len(rows) + 50), cols=len(SNAPSHOT_HEADERS))
-    ws.update("A1", [SNAPSHOT_HEADERS] + rows, value_input_option="USER_ENTERED")
-
-    _apply_snapshot_formatting(ws, delta_col_index_1based=5)
-
-    # Sortér alfabetisk på Product (kolonne A)
-    try:
-        ws.sort((1, "asc"), range=f"A2:I{len(rows) + 1}")
-    except Exception:
-        pass
+    sheet_id = ws._properties["sheetId"]
+    sheet_meta = session.sheet_properties(sheet_id)
+    grid = sheet_meta.get("properties", {}).get("gridProperties", {}) or {}
+    grid_rows = max(1000, len(rows) + 50)
+    n_cols = len(SNAPSHOT_HEADERS)
+
+    values = [SNAPSHOT_HEADERS] + rows
+    diff_ok = SNAPSHOT_DIFF and bool(prev_values) and _row_keys(prev_values[0], n_cols) == _row_keys(SNAPSHOT_HEADERS, n_cols)
+
+    # Diff-mode: indsæt/slet rækker så uændrede produkter bliver stående ud for deres gamle række
+    row_count = grid.get("rowCount")
+    matched: Dict[int, int] = {}
+    if diff_ok:
+        old_names = [_cell_key(row[0]) if row else "" for row in prev_values[1:]]
+        align_requests, matched = _align_snapshot_rows(sheet_id, old_names, [_cell_key(r[0]) for r in rows])
+        session.queue_requests(align_requests)
+        for req in align_requests:
+            rng = next(iter(req.values()))["range"]
+            size = rng["endIndex"] - rng["startIndex"]
+            row_count = (row_count or 0) + (size if "insertDimension" in req else -size)
+
+    if not SNAPSHOT_DIFF or row_count != grid_rows or grid.get("columnCount") != n_cols:
+        session.queue_requests([{
+            "updateSheetProperties": {
+                "properties": {
+                    "sheetId": sheet_id,
+                    "gridProperties": {"rowCount": grid_rows, "columnCount": n_cols},
+                },
+                "fields": "gridProperties.rowCount,gridProperties.columnCount",
+            }
+        }])
+
+    existing_rules = sheet_meta.get("conditionalFormats", []) or []
+    format_requests = _snapshot_format_requests(sheet_id, len(existing_rules), delta_col_index_1based=5)
+    if not SNAPSHOT_DIFF or not _snapshot_formatting_current(sheet_meta, format_requests):
+        session.queue_requests(format_requests, optional=True)
+
+    if diff_ok:
+        # Kun rækker hvor andet end Updated er ændret (eller som er nye) skrives
+        changed = [
+            j for j in range(len(rows))
+            if j not in matched
+            or _row_keys(prev_values[1 + matched[j]], SNAPSHOT_DIFF_COLUMNS) != _row_keys(rows[j], SNAPSHOT_DIFF_COLUMNS)
+        ]
+        for first, last in _consecutive_runs(changed):
+            session.queue_values(
+                a1_sheet(ws.title, f"A{first + 2}"),
+                [row[:SNAPSHOT_DIFF_COLUMNS] for row in rows[first:last + 1]],
+            )
+        cells_written = len(changed) * SNAPSHOT_DIFF_COLUMNS
+        # Updated = sidste scanning for alle rækker, som én smal kolonne
+        if rows:
+            updated_col = _column_letter(n_cols)
+            session.queue_values(a1_sheet(ws.title, f"{updated_col}2"), [[updated_ts] for _ in rows])
+            cells_written += len(rows)
+    else:
+        session.queue_values(a1_sheet(ws.title, "A1"), values)
+        cells_written = len(values) * n_cols
+
+        # Tomme rækker overskriver resten af gårsdagens snapshot (erstatter ws.clear())
+        blank_rows = min(len(prev_values), grid_rows) - len(values)
+        if blank_rows > 0:
+            session.queue_values(
+                a1_sheet(ws.title, f"A{len(values) + 1}"),
+                [[""] * n_cols for _ in range(blank_rows)],
+            )
+            cells_written += blank_rows * n_cols
 
     return {
         "updates_count": len(rows),
+        "cells_written": cells_written,
         "push_candidates": push_candidates,
     }
 
 
 def main():
     print("STARTER SCRIPT")
+    if http_archive.replaying():
+        # replayede (gamle) svar må hverken nå det rigtige regneark eller den rigtige state
+        if not SHEETS_FILE:
+            raise RuntimeError("HTTP_ARCHIVE=replay kræver SHEETS_FILE (lokalt regneark)")
+        print(f"HTTP replay: state isoleret i {http_archive.isolate_state()}")
+    stages = instrumentation.stage_clock()
 
     push_user_key = os.getenv("PUSH_USER_KEY", "").strip()
     push_app_token = os.getenv("PUSH_APP_TOKEN", "").strip()
@@ -362,93 +611,113 @@ def main():
     except Exception:
         ws_raw = sh.add_worksheet(title=SHEET_RAW_TITLE, rows=5000, cols=10)
 
-    shops = load_shops()
-    print("Shops loaded:", [s[0] for s in shops])
-
-    offers_by_group: Dict[str, list] = {}
-    group_name_map: Dict[str, str] = {}
-
-    for shop_label, shop_module in shops:
-        try:
-            products = shop_module.get_products()
-            print(f"{shop_label}: hentede {len(products)} produkter")
-        except Exception as e:
-            print(f"Fejl i shop {shop_label}: {e}")
-            continue
-
-        for p in products:
-            raw_name = (p.get("name") or "").strip()
-            if not raw_name:
-                continue
+    # Alle læsninger vi skal bruge i én values.batchGet
+    session = SheetSession(sh)
+    # (FORMULA-rendering: rå tal og HYPERLINK-formler, så diff kan sammenligne med det vi skriver)
+    prev_values_summary, prev_values_instock, raw_header = session.batch_get(
+        [
+            a1_sheet(ws_summary.title),
+            a1_sheet(ws_instock.title),
+            a1_sheet(ws_raw.title, "A1:G1"),
+        ],
+        value_render_option="FORMULA",
+    )
+    stages.mark("sheets_connect_read")
 
-            price = parse_float(p.get("price"))
-            if price is None:
-                continue
+    # Lokal historik (sandheden for medianer); RawOffers-arket er et spejl
+    history = HistoryStore()
+    if history.is_empty():
+        imported = history.backfill_from_raw_values(ws_raw.get_all_values())
+        print(f"HISTORY backfill fra RawOffers: {imported} rækker")
 
-            available = bool(p.get("available", True))
-            real_shop = (p.get("shop_source") or shop_label)
-            url = (p.get("url") or "").strip()
+    history_rowid_before = history.max_rowid()
 
-            group_key, canonical_name = build_group_key_and_name(
-                raw_name,
-                extra_text=p.get("grouping_text"),
-                series_hint=p.get("series_hint"),
-            )
+    ensure_raw_headers(ws_raw, raw_header[0] if raw_header else [])
 
-            group_name_map[group_key] = canonical_name
-            offers_by_group.setdefault(group_key, []).append((float(price), real_shop, available, url))
+    shops = load_shops()
+    print("Shops loaded:", [s[0] for s in shops])
 
-    print("TOTAL grupper fundet:", len(offers_by_group))
+    grouping = GroupingCache()
+    grouping.load()
+    stages.mark("setup")
+
+    # Streaming pipeline: crawl (parallelt) -> gruppering -> billigste pr gruppe -> raw history
+    scan_tasks = collect_scan_tasks(shops)
+    print(f"Scan-opgaver: {len(scan_tasks)} (max {SCAN_MAX_WORKERS} samtidige, {SCAN_MAX_PER_HOST} pr host)")
+
+    cheapest = CheapestOffers()
+    grouped = iter_grouped_offers(stream_scan_tasks(scan_tasks), grouping)
+    raw_count = append_raw_offers(
+        ws_raw,
+        today_str,
+        cheapest.track(grouped),
+        store=history,
+    )
 
-    # Raw history (append)
-    ensure_raw_headers(ws_raw)
-    append_raw_offers(ws_raw, today_str, offers_by_group, group_name_map)
-    print("RAW OFFERS appended")
+    print("TOTAL grupper fundet:", len(cheapest.names))
+    print(f"RAW OFFERS appended: {raw_count}")
+    print(f"Grouping cache: {grouping.hits} hits, {grouping.misses} misses")
+    instrumentation.count("grouping.cache_hits", grouping.hits)
+    instrumentation.count("grouping.cache_misses", grouping.misses)
+    instrumentation.count("offers.raw_appended", raw_count)
+    instrumentation.count("offers.groups", len(cheapest.names))
+    grouping.save()
+    stages.mark("scan_group_append")
 
     # Vælg billigste pr gruppe
-    chosen_summary: Dict[str, Tuple[float, str, bool, str]] = {}
-    chosen_instock: Dict[str, Tuple[float, str, bool, str]] = {}
-
-    for gkey, offers in offers_by_group.items():
-        canonical_name = group_name_map.get(gkey, gkey)
-
-        chosen_summary[canonical_name] = choose_cheapest_overall(offers)
-
-        best_instock = choose_cheapest_in_stock(offers)
-        if best_instock is not None:
-            chosen_instock[canonical_name] = best_instock
-
-    # Medianer fra RawOffers (daily minima)
-    median_overall, hist_days_overall = build_daily_medians_from_raw(ws_raw, mode="overall")
-    median_instock, hist_days_instock = build_daily_medians_from_raw(ws_raw, mode="in_stock")
+    chosen_summary, chosen_instock = cheapest.chosen()
+
+    # Medianer (daily minima): læg dagens minimum til den gemte rolling state.
+    # Passer state ikke til historikken, genopbygges den fra HistoryStore.
+    rolling = RollingMedianState.load()
+    if rolling.in_sync(history_rowid_before):
+        today_ord = datetime.datetime.strptime(today_str, RAW_DATE_FORMAT).date().toordinal()
+        rolling.update("overall", today_ord, chosen_summary)
+        rolling.update("in_stock", today_ord, chosen_instock)
+    else:
+        print("ROLLING MEDIANS genopbygges fra historikken")
+        rolling = RollingMedianState.rebuild(history.load_offer_arrays())
+    rolling.synced_rowid = history.max_rowid()
+    rolling.save()
+    history.close()
 
-    # Pris i går fra snapshot-ark (nyt format)
-    prev_summary = get_prev_price_map(ws_summary)
-    prev_instock = get_prev_price_map(ws_instock)
+    median_overall, hist_days_overall = rolling.medians("overall")
+    median_instock, hist_days_instock = rolling.medians("in_stock")
+    stages.mark("medians")
 
     now_ts = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
+    # Pris i går kommer fra snapshot-arkene læst i starten (nyt format)
     info_summary = update_snapshot_sheet(
+        session,
         ws_summary,
         chosen_summary,
-        prev_summary,
+        prev_values_summary,
         median_overall,
         hist_days_overall,
         now_ts,
         sheet_kind="overall",
     )
-    print(f"SUMMARY updated rows: {info_summary['updates_count']}")
+    print(f"SUMMARY updated rows: {info_summary['updates_count']} ({info_summary['cells_written']} celler skrevet)")
 
     info_instock = update_snapshot_sheet(
+        session,
         ws_instock,
         chosen_instock,
-        prev_instock,
+        prev_values_instock,
         median_instock,
         hist_days_instock,
         now_ts,
         sheet_kind="in_stock",
     )
-    print(f"IN_STOCK updated rows: {info_instock['updates_count']}")
+    print(f"IN_STOCK updated rows: {info_instock['updates_count']} ({info_instock['cells_written']} celler skrevet)")
+
+    # Resize/format for begge ark i én batchUpdate, alle værdier i én values.batchUpdate
+    session.flush()
+    print(f"Sheets API-kald (snapshot/session): {session.calls}")
+    print(f"Sheets kvote: {get_throttle().summary()}")
+    instrumentation.count("sheets.cells_written", info_summary["cells_written"] + info_instock["cells_written"])
+    stages.mark("sheets_write")
 
     # Push (kun in-stock ark)
     push_messages = []
@@ -460,7 +729,9 @@ def main():
                     f"Tilbud ({DISCOUNT_PCT*100:.0f}%): {name} → {price:g} kr ({shop}) | median: {median:.0f}"
                 )
 
-    if push_messages:
+    if push_messages and http_archive.replaying():
+        print(f"HTTP replay: springer push over ({len(push_messages)} tilbud)")
+    elif push_messages:
         msg = "\n".join(push_messages[:MAX_PUSH_LINES])
         if len(push_messages) > MAX_PUSH_LINES:
             msg += f"\n(+{len(push_messages) - MAX_PUSH_LINES} flere tilbud)"
@@ -468,7 +739,22 @@ def main():
         print("PUSH SENT:", len(push_messages))
     else:
         print("NO PUSH OFFERS")
+    instrumentation.count("push.offers", len(push_messages))
+    stages.mark("push")
+
+    report = instrumentation.write_run_report()
+    print(f"Kørselsrapport gemt ({len(report['timers'])} timere, {len(report['counters'])} counters)")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Daglig Pokémon pris-scan")
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        default=profiling.PROFILE,
+        help="cProfile + tracemalloc + stack sampling af hele kørslen (også PPT_PROFILE=1)",
+    )
+    args = parser.parse_args()
+
+    with profiling.profiled(enabled=args.profile):
+        main()
\ No newline at end of file
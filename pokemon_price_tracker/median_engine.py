@@ -0,0 +1,165 @@
+from typing import Dict, List, NamedTuple, Tuple
+
+import numpy as np
+
+
+MODES = ("overall", "in_stock")
+
+
+class OfferArrays(NamedTuple):
+    """
+    Historik som kolonner (struct-of-arrays).
+    products[product_idx[i]] er navnet for række i.
+    """
+    products: List[str]
+    product_idx: np.ndarray  # int64
+    day: np.ndarray          # int64 dag-nøgle (skal kun kunne grupperes)
+    price: np.ndarray        # float64
+    available: np.ndarray    # bool
+
+
+def _bool_from_raw(s: str) -> bool:
+    s = (s or "").strip().upper()
+    return s in ("TRUE", "1", "YES", "IN_STOCK")
+
+
+def arrays_from_raw_values(values: list) -> OfferArrays:
+    """
+    RawOffers get_all_values()-format -> OfferArrays.
+    Rækker uden dato/produkt/pris springes over (som i den gamle loop).
+    """
+    empty = OfferArrays([], np.zeros(0, np.int64), np.zeros(0, np.int64), np.zeros(0), np.zeros(0, bool))
+    if not values or len(values) < 2:
+        return empty
+
+    idx = {h.strip(): i for i, h in enumerate(values[0])}
+    if not {"Date", "Product", "Price", "Available"}.issubset(idx):
+        return empty
+
+    i_date, i_prod, i_price, i_avail = idx["Date"], idx["Product"], idx["Price"], idx["Available"]
+
+    # Intern navne/datoer til heltal mens vi parser (dag-nøglen skal kun kunne grupperes)
+    product_ids: Dict[str, int] = {}
+    day_ids: Dict[str, int] = {}
+    prod_col, day_col, prices, avail = [], [], [], []
+    for row in values[1:]:
+        n = len(row)
+        date = (row[i_date] or "").strip() if i_date < n else ""
+        product = (row[i_prod] or "").strip() if i_prod < n else ""
+        if not date or not product:
+            continue
+        try:
+            price = float(row[i_price]) if i_price < n else None
+        except (TypeError, ValueError):
+            price = None
+        if price is None:
+            continue
+        prod_col.append(product_ids.setdefault(product, len(product_ids)))
+        day_col.append(day_ids.setdefault(date, len(day_ids)))
+        prices.append(price)
+        avail.append(_bool_from_raw(row[i_avail] if i_avail < n else ""))
+
+    if not prices:
+        return empty
+
+    return OfferArrays(
+        list(product_ids),
+        np.asarray(prod_col, dtype=np.int64),
+        np.asarray(day_col, dtype=np.int64),
+        np.asarray(prices, dtype=np.float64),
+        np.asarray(avail, dtype=bool),
+    )
+
+
+def _daily_minima(prod: np.ndarray, day: np.ndarray, price: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Input skal være sorteret på (prod, day, price).
+    Første række i hver (prod, day)-gruppe er dagens minimum.
+    Returnerer (prod, day, min_price), stadig sorteret på (prod, day).
+    """
+    if prod.size == 0:
+        return prod, day, price
+    starts = np.empty(prod.size, dtype=bool)
+    starts[0] = True
+    starts[1:] = (prod[1:] != prod[:-1]) | (day[1:] != day[:-1])
+    return prod[starts], day[starts], price[starts]
+
+
+def _medians_by_product(prod: np.ndarray, mins: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Median af daily minima pr produkt (gennemsnit af de to midterste ved lige antal,
+    som statistics.median). Returnerer (product_idx, median, antal dage).
+    """
+    if prod.size == 0:
+        return prod, mins, prod
+
+    order = np.lexsort((mins, prod))
+    prod_s, mins_s = prod[order], mins[order]
+
+    uniq, starts, counts = np.unique(prod_s, return_index=True, return_counts=True)
+    lo = starts + (counts - 1) // 2
+    hi = starts + counts // 2
+    medians = (mins_s[lo] + mins_s[hi]) / 2.0
+    return uniq, medians, counts
+
+
+def _sorted_per_mode(arrays: OfferArrays) -> Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Én sortering af hele historikken på (prod, day, price).
+    Filtrering bevarer sorteringen, så in_stock ikke kræver en ny sort.
+    """
+    order = np.lexsort((arrays.price, arrays.day, arrays.product_idx))
+    prod = arrays.product_idx[order]
+    day = arrays.day[order]
+    price = arrays.price[order]
+    avail = arrays.available[order]
+
+    return {
+        "overall": (prod, day, price),
+        "in_stock": (prod[avail], day[avail], price[avail]),
+    }
+
+
+def compute_daily_medians(arrays: OfferArrays) -> Dict[str, Tuple[Dict[str, float], Dict[str, int]]]:
+    """
+    Daily minima + medianer for alle modes i ét pass:
+      "overall"  -> daily min uanset lager
+      "in_stock" -> daily min kun available
+    Returnerer {mode: (median_map, hist_days_map)}.
+    """
+    out: Dict[str, Tuple[Dict[str, float], Dict[str, int]]] = {m: ({}, {}) for m in MODES}
+    if arrays.price.size == 0:
+        return out
+
+    names = arrays.products
+    for mode, (p, d, pr) in _sorted_per_mode(arrays).items():
+        min_prod, _min_day, min_price = _daily_minima(p, d, pr)
+        uniq, medians, counts = _medians_by_product(min_prod, min_price)
+        median_map = {names[i]: float(m) for i, m in zip(uniq.tolist(), medians.tolist())}
+        hist_days_map = {names[i]: int(c) for i, c in zip(uniq.tolist(), counts.tolist())}
+        out[mode] = (median_map, hist_days_map)
+
+    return out
+
+
+def daily_minima_series(arrays: OfferArrays) -> Dict[str, Dict[str, Tuple[List[int], List[float]]]]:
+    """
+    Daily minima pr produkt som (dage, priser) i dag-orden, for alle modes.
+    Bruges til at (gen)opbygge rolling_stats fra historikken.
+    """
+    out: Dict[str, Dict[str, Tuple[List[int], List[float]]]] = {m: {} for m in MODES}
+    if arrays.price.size == 0:
+        return out
+
+    names = arrays.products
+    for mode, (p, d, pr) in _sorted_per_mode(arrays).items():
+        min_prod, min_day, min_price = _daily_minima(p, d, pr)
+        if min_prod.size == 0:
+            continue
+        uniq, starts = np.unique(min_prod, return_index=True)
+        ends = np.append(starts[1:], min_prod.size)
+        days_l, prices_l = min_day.tolist(), min_price.tolist()
+        for i, a, b in zip(uniq.tolist(), starts.tolist(), ends.tolist()):
+            out[mode][names[i]] = (days_l[a:b], prices_l[a:b])
+
+    return out
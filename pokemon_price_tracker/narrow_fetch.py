@@ -0,0 +1,40 @@
+import datetime
+import os
+from typing import Iterable, List
+
+from pokemon_price_tracker.state import load_json, safe_name, save_json
+
+
+# ----------------- KONFIG -----------------
+# Butikker i narrow-mode (search=/collections) crawles stadig fuldt med dette interval,
+# så vi opdager produkter som søgningen ikke rammer
+NARROW_VERIFY_DAYS = int(os.getenv("NARROW_VERIFY_DAYS", "7"))
+# NARROW_FETCH=0 slår narrow-mode fra for alle butikker
+NARROW_FETCH = os.getenv("NARROW_FETCH", "1").strip() not in ("0", "false", "")
+# ------------------------------------------
+
+
+def search_terms(queries: Iterable[str]) -> List[str]:
+    """
+    Søgeord til server-side søgning: queries der indeholder en kortere query
+    droppes ("prismatic evolutions" dækkes af "prismatic evolution").
+    Resultaterne filtreres stadig lokalt med de fulde QUERIES.
+    """
+    terms = list(dict.fromkeys((q or "").strip().lower() for q in queries if (q or "").strip()))
+    return [t for t in terms if not any(o != t and o in t for o in terms)]
+
+
+def use_narrow(domain: str) -> bool:
+    """False når det er tid til en fuld verifikations-crawl af domænet."""
+    if not NARROW_FETCH:
+        return False
+    entry = load_json("narrow", f"{safe_name(domain)}.json", default=None)
+    try:
+        last_full = datetime.date.fromisoformat((entry or {}).get("last_full_crawl") or "")
+    except (AttributeError, ValueError):
+        return False
+    return (datetime.date.today() - last_full).days < NARROW_VERIFY_DAYS
+
+
+def mark_full_crawl(domain: str) -> None:
+    save_json({"last_full_crawl": datetime.date.today().isoformat()}, "narrow", f"{safe_name(domain)}.json")
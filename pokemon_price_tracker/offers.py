@@ -0,0 +1,121 @@
+import sys
+from typing import Iterable, Iterator, List, Optional
+
+UNKNOWN_SERIES = "Unknown Series"
+
+
+def _intern(s: Optional[str]) -> str:
+    # butiks- og serienavne gentages for hvert produkt; én delt str pr værdi
+    return sys.intern(s) if s else ""
+
+
+class Product:
+    """
+    Ét produkt/variant fra en scraper (før gruppering).
+
+    __slots__ i stedet for dict: ingen dict pr produkt, og shop/serie er
+    internede strenge. grouping_text (titel + hele body_html) gemmes kun når
+    serien er ukendt, for det er det eneste tilfælde hvor
+    build_group_key_and_name læser den.
+    """
+
+    __slots__ = ("name", "price", "available", "series_hint", "matched_queries", "url", "shop_source", "grouping_text")
+
+    def __init__(
+        self,
+        name: str,
+        price: float,
+        available: bool,
+        series_hint: str,
+        matched_queries: Iterable[str] = (),
+        url: str = "",
+        shop_source: str = "",
+        grouping_text: Optional[str] = None,
+    ):
+        self.name = name
+        self.price = float(price)
+        self.available = bool(available)
+        self.series_hint = _intern(series_hint)
+        self.matched_queries = tuple(matched_queries or ())
+        self.url = url or ""
+        self.shop_source = _intern(shop_source)
+        self.grouping_text = grouping_text if self.series_hint in ("", UNKNOWN_SERIES) else None
+
+    def set_shop(self, shop: str) -> None:
+        self.shop_source = _intern(shop)
+
+    def copy(self) -> "Product":
+        return Product.from_row(self.to_row())
+
+    # Kompakt JSON (page_cache / crawl-state): én liste pr produkt i stedet for et objekt med nøgler
+    def to_row(self) -> list:
+        return [
+            self.name, self.price, self.available, self.series_hint,
+            list(self.matched_queries), self.url, self.shop_source, self.grouping_text,
+        ]
+
+    @classmethod
+    def from_row(cls, row: list) -> "Product":
+        return cls(*row)
+
+    @classmethod
+    def from_dict(cls, d: dict) -> Optional["Product"]:
+        """Til shop-moduler der stadig yielder dicts; None hvis navn/pris mangler."""
+        name = (d.get("name") or "").strip()
+        try:
+            price = float(d.get("price"))
+        except (TypeError, ValueError):
+            return None
+        if not name:
+            return None
+        return cls(
+            name,
+            price,
+            d.get("available", True),
+            d.get("series_hint") or "",
+            d.get("matched_queries") or (),
+            (d.get("url") or "").strip(),
+            d.get("shop_source") or "",
+            d.get("grouping_text"),
+        )
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Product) and self.to_row() == other.to_row()
+
+    def __repr__(self) -> str:
+        return f"Product({self.name!r}, {self.price!r}, {self.shop_source!r}, {self.url!r})"
+
+
+def products_to_rows(products: Iterable[Product]) -> List[list]:
+    return [p.to_row() for p in products]
+
+
+def products_from_rows(rows) -> Optional[List[Product]]:
+    """None hvis rows ikke er i rækkeformatet (fx gammel state med dicts)."""
+    if not isinstance(rows, list) or not all(isinstance(r, list) for r in rows):
+        return None
+    return [Product.from_row(r) for r in rows]
+
+
+class Offer:
+    """
+    Et grupperet tilbud: kun det billigste-valget, snapshot og historik
+    bruger. Kan pakkes ud som (price, shop, available, url).
+    """
+
+    __slots__ = ("price", "shop", "available", "url")
+
+    def __init__(self, price: float, shop: str, available: bool, url: str = ""):
+        self.price = float(price)
+        self.shop = _intern(shop)
+        self.available = bool(available)
+        self.url = url or ""
+
+    def __iter__(self) -> Iterator:
+        return iter((self.price, self.shop, self.available, self.url))
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Offer) and tuple(self) == tuple(other)
+
+    def __repr__(self) -> str:
+        return f"Offer({self.price!r}, {self.shop!r}, {self.available!r}, {self.url!r})"
@@ -0,0 +1,123 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Optional
+
+from pokemon_price_tracker import instrumentation
+from pokemon_price_tracker.product_grouping import rules_fingerprint
+from pokemon_price_tracker.state import safe_name, state_path
+
+try:
+    # zstd er hurtigere og mindre end gzip, men valgfri
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# ----------------- KONFIG -----------------
+# Byte-identisk side (samme digest) = genbrug sidste udtræk i stedet for at parse/filtrere igen
+PAGE_CACHE = os.getenv("PAGE_CACHE", "1").strip() not in ("0", "false", "")
+PAGE_CACHE_DIR = "pages"
+# Bump når udtræk/filtrering i scraperne ændres, så gamle udtræk ikke genbruges
+PAGE_CACHE_VERSION = "2"
+ZSTD_LEVEL = 6
+GZIP_LEVEL = 6
+# ------------------------------------------
+
+_EXTS = (".json.zst", ".json.gz")
+
+
+def page_hasher(*context: str):
+    """
+    blake2b klar til sidens rå bytes, seedet med PAGE_CACHE_VERSION, kontekst
+    (fx filter-signatur) og fingerprint af product_grouping (som GroupingCache),
+    så ændrede serie-regler eller et ændret filter aldrig rammer et gammelt
+    udtræk. Til sider der hashes mens de streames.
+    """
+    h = hashlib.blake2b(digest_size=20)
+    h.update(PAGE_CACHE_VERSION.encode())
+    h.update(b"\0")
+    h.update(rules_fingerprint().encode())
+    for part in context:
+        h.update(b"\0")
+        h.update(str(part).encode("utf-8"))
+    h.update(b"\0")
+    return h
+
+
+def context_key(*context: str) -> str:
+    """
+    Digest af konteksten alene (version, regler, filter). Gemmes ved udtrækket,
+    så opslag uden body (fx efter en 304, med digesten fra crawl-state) kan
+    afvise udtræk lavet under andre regler.
+    """
+    return page_hasher(*context).hexdigest()
+
+
+def page_digest(body: bytes, *context: str) -> str:
+    """Digest af en helt læst side; se page_hasher."""
+    h = page_hasher(*context)
+    h.update(body or b"")
+    return h.hexdigest()
+
+
+def _base_path(domain: str, page_key: str) -> str:
+    # Én fil pr (domæne, side); digesten ligger i filen, så kun seneste udtræk gemmes
+    name = hashlib.sha1(page_key.encode("utf-8")).hexdigest()[:20]
+    return state_path(PAGE_CACHE_DIR, safe_name(domain), name)
+
+
+def load(domain: str, page_key: str, digest: str, context: Optional[str] = None) -> Optional[Any]:
+    """
+    Udtrækket for siden, hvis det er gemt med præcis denne digest (og, når
+    context er givet, samme context_key); ellers None.
+    """
+    if not PAGE_CACHE:
+        return None
+    base = _base_path(domain, page_key)
+    for ext in _EXTS:
+        try:
+            with open(base + ext, "rb") as f:
+                raw = f.read()
+        except OSError:
+            continue
+        try:
+            if ext == ".json.zst":
+                if zstandard is None:
+                    continue
+                raw = zstandard.ZstdDecompressor().decompress(raw)
+            else:
+                raw = gzip.decompress(raw)
+            entry = json.loads(raw)
+        except Exception:
+            continue
+        if entry.get("digest") == digest and (context is None or entry.get("context") == context):
+            instrumentation.count("page_cache.hits", shop=domain)
+            return entry.get("payload")
+    instrumentation.count("page_cache.misses", shop=domain)
+    return None
+
+
+def store(domain: str, page_key: str, digest: str, payload: Any, context: Optional[str] = None) -> None:
+    if not PAGE_CACHE:
+        return
+    raw = json.dumps({"digest": digest, "context": context, "payload": payload}, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if zstandard is not None:
+        ext, data = ".json.zst", zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+    else:
+        ext, data = ".json.gz", gzip.compress(raw, compresslevel=GZIP_LEVEL)
+
+    base = _base_path(domain, page_key)
+    tmp = f"{base}{ext}.tmp{os.getpid()}_{threading.get_ident()}"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, base + ext)
+    # den anden kodning må ikke ligge tilbage med et gammelt udtræk
+    for other in _EXTS:
+        if other != ext:
+            try:
+                os.remove(base + other)
+            except OSError:
+                pass
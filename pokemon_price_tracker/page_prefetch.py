@@ -0,0 +1,85 @@
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, Optional, Tuple, TypeVar
+
+from pokemon_price_tracker import http_archive
+
+
+# ----------------- KONFIG -----------------
+# Maks antal sider i gang samtidig pr crawl (HostPolicy i http_client begrænser stadig pr host)
+PAGE_PREFETCH_WINDOW = int(os.getenv("PAGE_PREFETCH_WINDOW", "4"))
+# ------------------------------------------
+
+T = TypeVar("T")
+
+
+def iter_pages(
+    fetch_page: Callable[[int], T],
+    is_last: Callable[[T], bool],
+    first_page: int = 1,
+    max_page: Optional[int] = None,
+    total_pages: Optional[Callable[[T], Optional[int]]] = None,
+    window: int = PAGE_PREFETCH_WINDOW,
+) -> Iterator[Tuple[int, T]]:
+    """
+    Spekulativ paginering: hent op til `window` sider parallelt, men yield
+    (page, result) i side-rækkefølge.
+
+    - is_last(result): tom/kort side -> siden yieldes, og intet efter den
+      hentes eller yieldes; spekulative requests der ikke er startet annulleres.
+    - total_pages(result): sideantal fra fx X-WP-TotalPages, læst fra første side.
+    - Vinduet starter på 1 og fordobles pr færdig side (slow start), så
+      butikker med én side ikke betaler for spekulative requests.
+    Fejl fra fetch_page kommer ud når den pågældende side står for tur.
+    Under HTTP replay hentes én side ad gangen: arkivet er lokalt, og
+    spekulative sider efter den sidste optagne side findes ikke i arkivet.
+    """
+    window = 1 if http_archive.replaying() else max(1, int(window))
+    last = max_page
+    inflight: Dict[int, "Future[T]"] = {}
+    next_page = first_page
+    done = 0
+
+    pool = ThreadPoolExecutor(max_workers=window, thread_name_prefix="prefetch")
+    try:
+        page = first_page
+        while last is None or page <= last:
+            allowed = min(window, 2 ** done)
+            while len(inflight) < allowed and (last is None or next_page <= last):
+                inflight[next_page] = pool.submit(fetch_page, next_page)
+                next_page += 1
+
+            result = inflight.pop(page).result()
+            done += 1
+
+            if done == 1 and total_pages is not None:
+                known = total_pages(result)
+                if known:
+                    last = known if last is None else min(last, known)
+
+            yield page, result
+            if is_last(result):
+                return
+            page += 1
+    finally:
+        for future in inflight.values():
+            future.cancel()
+        # Igangværende spekulative requests får lov at løbe færdig i baggrunden
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def short_page_detector(size_of: Callable[[T], int]) -> Callable[[T], bool]:
+    """
+    is_last til iter_pages: en side er sidste side hvis den er tom eller
+    kortere end den største side set indtil nu (butikkens reelle sidestørrelse).
+    Kald is_last præcis én gang pr side, i rækkefølge.
+    """
+    largest = 0
+
+    def is_last(result: T) -> bool:
+        nonlocal largest
+        size = size_of(result)
+        largest = max(largest, size)
+        return size == 0 or size < largest
+
+    return is_last
@@ -0,0 +1,165 @@
+import re
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+try:
+    # pyahocorasick (valgfri): ét C-scan for alle ordlister på én gang
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+
+# -------- Singles (kort) indikatorer --------
+RARITY_WORDS = [
+    "common", "uncommon", "rare", "double rare",
+    "ultra rare", "secret rare", "illustration rare", "art rare",
+    "holo", "reverse holo", "reverse-holo", "reverseholo",
+]
+
+CONDITION_WORDS = [
+    "near mint", "nm", "lp", "mp", "hp", "played", "damaged",
+    "reverse-holo normal",
+]
+
+CARD_NO_BRACKET_RE = re.compile(r"\[[a-z0-9\-]{2,}\]", re.IGNORECASE)
+SLASHY_CONDITION_RE = re.compile(r"\b(english|near mint|reverse|holo)\b.*\/", re.IGNORECASE)
+
+
+# -------- Sealed-filter ordlister --------
+BANNED_LANGUAGE_WORDS = [
+    "japanese", "japansk", "korean", "koreansk", "chinese", "kinesisk",
+    "german", "tysk", "french", "fransk",
+]
+
+BANNED_GRADED_WORDS = ["psa", "bgs", "cgc", "graded", "slab"]
+
+REQUIRED_PRODUCT_WORDS = [
+    "booster", "box", "bundle", "collection",
+    "elite trainer", "etb", "tin", "blister",
+    "display", "sticker", "poster", "figure", "pin",
+]
+
+
+def looks_like_single_card(title_or_text: str) -> bool:
+    t = (title_or_text or "").lower()
+    if CARD_NO_BRACKET_RE.search(t):
+        return True
+    if SLASHY_CONDITION_RE.search(t):
+        return True
+    if any(w in t for w in RARITY_WORDS):
+        return True
+    if any(w in t for w in CONDITION_WORDS):
+        return True
+    if re.search(r"\((common|uncommon|rare)\)", t):
+        return True
+    return False
+
+
+class FilterResult(NamedTuple):
+    matched_queries: List[str]
+    banned: bool        # sprog/graded-ord i titlen
+    single_card: bool   # ligner et enkelt kort (titel eller fuld tekst)
+    sealed: bool        # titlen indeholder et sealed-produktord
+
+    @property
+    def keep(self) -> bool:
+        return bool(self.matched_queries) and not self.banned and not self.single_card and self.sealed
+
+
+_REJECTED = FilterResult([], False, False, False)
+
+
+class ProductFilter:
+    """
+    Fælles prefilter for alle scrapers.
+
+    Med pyahocorasick bygges ét automaton over queries + alle ordlister, og
+    titel + fuld tekst klassificeres i ét lineært scan (titlen er præfiks af
+    full_text, så titel-ord er hits der slutter inden for titlens længde).
+    Uden pyahocorasick bruges str-søgning, med queries først så de ~95%
+    ikke-Pokémon produkter afvises efter ét pass.
+    """
+
+    def __init__(
+        self,
+        queries: Iterable[str],
+        required_words: Iterable[str] = REQUIRED_PRODUCT_WORDS,
+        banned_words: Iterable[str] = BANNED_LANGUAGE_WORDS + BANNED_GRADED_WORDS,
+    ):
+        self.queries = list(dict.fromkeys(q.lower() for q in queries if q))
+        self.banned_words = tuple(dict.fromkeys(w.lower() for w in banned_words))
+        self.required_words = tuple(dict.fromkeys(w.lower() for w in required_words))
+        self.single_words = tuple(dict.fromkeys(RARITY_WORDS + CONDITION_WORDS))
+
+        self._automaton = None
+        if ahocorasick is not None:
+            groups: Dict[str, set] = {}
+            for label, words in (
+                ("query", self.queries),
+                ("banned", self.banned_words),
+                ("required", self.required_words),
+                ("single", self.single_words),
+            ):
+                for w in words:
+                    groups.setdefault(w, set()).add(label)
+            if groups:
+                automaton = ahocorasick.Automaton()
+                for w, labels in groups.items():
+                    automaton.add_word(w, (w, frozenset(labels)))
+                automaton.make_automaton()
+                self._automaton = automaton
+
+    @property
+    def signature(self) -> str:
+        """Stabil nøgle for filterets ordlister (til caches af filtrerede resultater)."""
+        return "|".join(
+            ",".join(words) for words in (self.queries, self.banned_words, self.required_words, self.single_words)
+        )
+
+    def classify(self, title: str, full_text: Optional[str] = None, require_query: bool = True) -> FilterResult:
+        """
+        full_text skal starte med titlen (som i scraperne); udelades den, bruges titlen.
+        require_query=False når siden allerede er udvalgt pr serie (fx Epicpanda).
+        """
+        title_l = (title or "").lower()
+        text_l = (full_text or title or "").lower()
+
+        if self._automaton is not None:
+            return self._classify_automaton(title_l, text_l, full_text or title or "", require_query)
+
+        matched = [q for q in self.queries if q in text_l]
+        if require_query and not matched:
+            return _REJECTED
+
+        banned = any(w in title_l for w in self.banned_words)
+        single = any(w in text_l for w in self.single_words) or self._single_card_regex(full_text or title or "")
+        sealed = any(w in title_l for w in self.required_words)
+        return FilterResult(matched, banned, single, sealed)
+
+    def _classify_automaton(self, title_l: str, text_l: str, raw_text: str, require_query: bool) -> FilterResult:
+        title_end = len(title_l)
+        found_queries = set()
+        banned = single = sealed = False
+
+        for end, (word, labels) in self._automaton.iter(text_l):
+            if "query" in labels:
+                found_queries.add(word)
+            if "single" in labels:
+                single = True
+            if end < title_end:
+                if "banned" in labels:
+                    banned = True
+                if "required" in labels:
+                    sealed = True
+
+        if require_query and not found_queries:
+            return _REJECTED
+
+        matched = [q for q in self.queries if q in found_queries]
+        if not single:
+            single = self._single_card_regex(raw_text)
+        return FilterResult(matched, banned, single, sealed)
+
+    @staticmethod
+    def _single_card_regex(text: str) -> bool:
+        # "(common)" o.l. er allerede dækket af ordlisterne
+        return bool(CARD_NO_BRACKET_RE.search(text) or SLASHY_CONDITION_RE.search(text))
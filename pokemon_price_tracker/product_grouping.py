@@ -1,20 +1,39 @@
 # pokemon_price_tracker/product_grouping.py
+import hashlib
 import re
+from functools import lru_cache
 from typing import Optional, Tuple
 
 _ws_re = re.compile(r"\s+")
 _punct_re = re.compile(r"[^\w\s&x\-\/]+")
+_clean_table = str.maketrans({"æ": "ae", "ø": "oe", "å": "aa", "–": "-", "—": "-"})
 
 
 def _clean(s: str) -> str:
-    s = (s or "").strip().lower()
-    s = s.replace("æ", "ae").replace("ø", "oe").replace("å", "aa")
-    s = s.replace("–", "-").replace("—", "-")
+    s = (s or "").strip().lower().translate(_clean_table)
     s = _punct_re.sub(" ", s)
     s = _ws_re.sub(" ", s).strip()
     return s
 
 
+@lru_cache(maxsize=1)
+def rules_fingerprint() -> str:
+    """
+    Hash af selve modulet. Enhver ændring i regler, stopwords eller logik
+    giver et nyt fingerprint, så caches/state bygget på de gamle regler kan smides væk.
+    """
+    with open(__file__, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+
+def _compile_rules(rules):
+    """
+    [(navn, [regex, ...]), ...] -> [(navn, kompileret alternation), ...]
+    Rækkefølgen bevares, så første regel der matcher stadig vinder.
+    """
+    return [(name, re.compile("|".join(f"(?:{p})" for p in pats))) for name, pats in rules]
+
+
 SERIES_PATTERNS = [
     ("Mega Evolution - Ascended Heroes", [r"\bascended heroes\b"]),
     ("Mega Evolution - Phantasmal Flames", [r"\bphantasmal flames\b"]),
@@ -39,41 +58,55 @@ SERIES_PATTERNS = [
 ]
 
 
-def detect_series(text: str) -> str:
-    t = _clean(text)
-    for series_name, pats in SERIES_PATTERNS:
-        for p in pats:
-            if re.search(p, t):
-                return series_name
+_SERIES_COMPILED = _compile_rules(SERIES_PATTERNS)
+
+
+def _detect_series_clean(t: str) -> str:
+    for series_name, rx in _SERIES_COMPILED:
+        if rx.search(t):
+            return series_name
     return "Unknown Series"
 
 
-def detect_count_tag(title: str) -> Optional[str]:
-    t = _clean(title)
+def detect_series(text: str) -> str:
+    return _detect_series_clean(_clean(text))
+
 
-    m = re.search(r"\b(\d{1,3})\s*x\b", t)
+_COUNT_X_RE = re.compile(r"\b(\d{1,3})\s*x\b")
+_COUNT_PACKS_RE = re.compile(r"\b(\d{1,3})\s*(booster\s*packs|packs)\b")
+_COUNT_ALL_RE = re.compile(r"\b(alle|all)\s*(\d{1,3})\b")
+_COUNT_TINS_RE = re.compile(r"\b(\d{1,3})\s*(mini\s*tins?|tins?)\b")
+_COUNT_PACK_OF_RE = re.compile(r"\b(pack|case)\s*of\s*(\d{1,3})\b")
+
+
+def _detect_count_tag_clean(t: str) -> Optional[str]:
+    m = _COUNT_X_RE.search(t)
     if m:
         return f"{m.group(1)}x"
 
-    m = re.search(r"\b(\d{1,3})\s*(booster\s*packs|packs)\b", t)
+    m = _COUNT_PACKS_RE.search(t)
     if m:
         return f"{m.group(1)} packs"
 
     if "display" in t:
-        m = re.search(r"\b(alle|all)\s*(\d{1,3})\b", t)
+        m = _COUNT_ALL_RE.search(t)
         if m:
             return f"{m.group(2)}x"
-        m = re.search(r"\b(\d{1,3})\s*(mini\s*tins?|tins?)\b", t)
+        m = _COUNT_TINS_RE.search(t)
         if m:
             return f"{m.group(1)}x"
 
-    m = re.search(r"\b(pack|case)\s*of\s*(\d{1,3})\b", t)
+    m = _COUNT_PACK_OF_RE.search(t)
     if m:
         return f"{m.group(2)}x"
 
     return None
 
 
+def detect_count_tag(title: str) -> Optional[str]:
+    return _detect_count_tag_clean(_clean(title))
+
+
 TYPE_RULES = [
     ("Ultra Premium Collection", [r"\bultra premium collection\b", r"\bupc\b"]),
     ("Pokemon Center ETB Plus", [r"\bpokemon center\b.*\betb\b", r"\betb\b.*\bplus\b"]),
@@ -98,15 +131,20 @@ TYPE_RULES = [
 ]
 
 
-def detect_type(title: str) -> str:
-    t = _clean(title)
-    for type_name, pats in TYPE_RULES:
-        for p in pats:
-            if re.search(p, t):
-                return type_name
+_TYPE_COMPILED = _compile_rules(TYPE_RULES)
+
+
+def _detect_type_clean(t: str) -> str:
+    for type_name, rx in _TYPE_COMPILED:
+        if rx.search(t):
+            return type_name
     return "Sealed Product"
 
 
+def detect_type(title: str) -> str:
+    return _detect_type_clean(_clean(title))
+
+
 THEME_STOPWORDS = {
     "pokemon", "center", "plus", "elite", "trainer", "box", "etb",
     "english", "sealed", "preorder", "pre-order", "pre", "order",
@@ -123,45 +161,48 @@ THEME_STOPWORDS = {
 }
 
 
-def detect_theme(title: str, ptype: str) -> Optional[str]:
-    """
-    Udtræk kun tema for ETB'er når det ligner et rigtigt karakter/variant-navn.
-    Vi vil IKKE bruge generiske ord som 'Case', 'Kort', 'Scarlet' osv.
-    """
+_THEME_TAIL_RE = re.compile(r"\b(elite trainer box|etb)\b\s*[:\-]?\s*(.+)$")
+_THEME_PAREN_RE = re.compile(r"\b(etb|elite trainer box)\b.*\(([^)]+)\)")
+_THEME_SPLIT_RE = re.compile(r"[\s\-\/]+")
+_THEME_CODE_RE = re.compile(r"[a-z]{1,3}\d{1,3}")
+
+# Hvis halen tydeligt bare beskriver retail-format, så intet tema
+_RETAIL_NOISE_RE = re.compile(
+    "|".join([
+        r"\bcase\b",
+        r"\bkort\b",
+        r"\bcard(s)?\b",
+        r"\b10x\b",
+        r"\bscarlet\b",
+        r"\bviolet\b",
+        r"\bprismatic\b",
+        r"\bevolution(s)?\b",
+    ])
+)
+
+
+def _detect_theme_clean(t: str, ptype: str) -> Optional[str]:
     if "ETB" not in (ptype or "") and "Elite Trainer Box" not in (ptype or ""):
         return None
 
-    t = _clean(title)
-
     # Efter "etb" eller "elite trainer box"
-    m = re.search(r"\b(elite trainer box|etb)\b\s*[:\-]?\s*(.+)$", t)
+    m = _THEME_TAIL_RE.search(t)
     cand = None
     if m:
         cand = m.group(2)
     else:
         # Parentheser: "... ETB (Glaceon)"
-        m2 = re.search(r"\b(etb|elite trainer box)\b.*\(([^)]+)\)", t)
+        m2 = _THEME_PAREN_RE.search(t)
         if m2:
             cand = m2.group(2)
 
     if not cand:
         return None
 
-    # Hvis halen tydeligt bare beskriver retail-format, så intet tema
-    retail_noise_patterns = [
-        r"\bcase\b",
-        r"\bkort\b",
-        r"\bcard(s)?\b",
-        r"\b10x\b",
-        r"\bscarlet\b",
-        r"\bviolet\b",
-        r"\bprismatic\b",
-        r"\bevolution(s)?\b",
-    ]
-    if any(re.search(p, cand) for p in retail_noise_patterns):
+    if _RETAIL_NOISE_RE.search(cand):
         return None
 
-    tokens = [tok for tok in re.split(r"[\s\-\/]+", cand.strip()) if tok]
+    tokens = [tok for tok in _THEME_SPLIT_RE.split(cand.strip()) if tok]
     for tok in tokens:
         if tok.isdigit():
             continue
@@ -171,7 +212,7 @@ def detect_theme(title: str, ptype: str) -> Optional[str]:
             continue
 
         # undgå rene model/seriekoder
-        if re.fullmatch(r"[a-z]{1,3}\d{1,3}", tok):
+        if _THEME_CODE_RE.fullmatch(tok):
             continue
 
         return tok.replace("-", " ").title()
@@ -179,22 +220,46 @@ def detect_theme(title: str, ptype: str) -> Optional[str]:
     return None
 
 
+def detect_theme(title: str, ptype: str) -> Optional[str]:
+    """
+    Udtræk kun tema for ETB'er når det ligner et rigtigt karakter/variant-navn.
+    Vi vil IKKE bruge generiske ord som 'Case', 'Kort', 'Scarlet' osv.
+    """
+    if "ETB" not in (ptype or "") and "Elite Trainer Box" not in (ptype or ""):
+        return None
+    return _detect_theme_clean(_clean(title), ptype)
+
+
+def classify_title(title: str) -> Tuple[str, str, Optional[str], Optional[str]]:
+    """
+    Rens titlen én gang og kør alle (forkompilerede) regler på den.
+    Returnerer (series, type, count_tag, theme).
+    """
+    t = _clean(title)
+    ptype = _detect_type_clean(t)
+    return _detect_series_clean(t), ptype, _detect_count_tag_clean(t), _detect_theme_clean(t, ptype)
+
+
+_CLEAN_NAMES = {
+    name: _clean(name)
+    for name in [n for n, _ in SERIES_PATTERNS] + [n for n, _ in TYPE_RULES] + ["Unknown Series", "Sealed Product"]
+}
+
+
 def build_group_key_and_name(
     product_title: str,
     extra_text: Optional[str] = None,
     series_hint: Optional[str] = None,
 ) -> Tuple[str, str]:
+    title_series, ptype, count_tag, theme = classify_title(product_title)
+
     if series_hint and series_hint != "Unknown Series":
         series = series_hint
     else:
-        series = detect_series(product_title)
+        series = title_series
         if series == "Unknown Series" and extra_text:
             series = detect_series(extra_text)
 
-    ptype = detect_type(product_title)
-    count_tag = detect_count_tag(product_title)
-    theme = detect_theme(product_title, ptype)
-
     canonical = f"{series}: {ptype}"
     if count_tag:
         canonical += f" ({count_tag})"
@@ -202,11 +267,11 @@ def build_group_key_and_name(
         canonical += f" - {theme}"
 
     key_parts = [
-        _clean(series),
-        _clean(ptype),
+        _CLEAN_NAMES.get(series) or _clean(series),
+        _CLEAN_NAMES[ptype],
         _clean(count_tag or ""),
         _clean(theme or ""),
     ]
     key = "|".join(key_parts)
 
-    return key, canonical
\ No newline at end of file
+    return key, canonical
@@ -0,0 +1,248 @@
+import collections
+import cProfile
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+from pokemon_price_tracker.state import state_path
+
+
+# ----------------- KONFIG -----------------
+# PPT_PROFILE=1 svarer til `python -m pokemon_price_tracker.main --profile`
+PROFILE = os.getenv("PPT_PROFILE", "0").strip() not in ("0", "false", "")
+PROFILE_DIR = "profile"  # under state-mappen
+PROFILE_TOP_N = int(os.getenv("PROFILE_TOP_N", "20"))
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))  # sekunder
+PROFILE_TRACEMALLOC_FRAMES = int(os.getenv("PROFILE_TRACEMALLOC_FRAMES", "10"))
+
+# Hotspots grupperes efter hvilken del af pipelinen filen hører til (første match vinder)
+MODULE_GROUPS: List[Tuple[str, Tuple[str, ...]]] = [
+    ("scrapers", (
+        "pokemon_price_tracker/Shops/", "shopify_scraper", "woocommerce_scraper",
+        "json_stream", "page_prefetch", "narrow_fetch", "scan_scheduler",
+    )),
+    ("http", ("http_client", "/requests/", "/urllib3/", "/ssl.py", "/socket.py", "/http/")),
+    ("product_grouping", ("product_grouping", "grouping_cache", "prefilter")),
+    ("median engine", ("median_engine", "rolling_stats", "history_store", "/numpy/", "sqlite3")),
+    ("sheets", ("sheet_session", "sheets_throttle", "google_sheet", "/gspread/", "/oauth2client/", "/google/")),
+    ("json", ("/json/",)),
+]
+# Indbyggede kald der blot venter (låse, køer, sleep, sockets) – vist for sig,
+# så de ikke drukner de egentlige CPU-hotspots
+WAIT_MARKERS = ("acquire", "_queue.SimpleQueue", "_thread.lock", "sleep", "select", "poll", "recv", "connect", "read' of '_ssl")
+# ------------------------------------------
+
+
+def _group_of(filename: str, func: str = "") -> str:
+    if filename == "~" and any(m in func for m in WAIT_MARKERS):
+        return "ventetid"
+    # indbyggede funktioner har filename "~"; så matches på navnet i stedet
+    path = (func if filename == "~" else filename or "").replace("\\", "/")
+    for group, markers in MODULE_GROUPS:
+        if any(m in path for m in markers):
+            return group
+    if "pokemon_price_tracker/" in path:
+        return "main/øvrigt"
+    return "stdlib/andet"
+
+
+def _short(filename: str) -> str:
+    path = (filename or "").replace("\\", "/")
+    if "pokemon_price_tracker/" in path:
+        return path[path.rindex("pokemon_price_tracker/"):]
+    return "/".join(path.split("/")[-2:])
+
+
+class StackSampler(threading.Thread):
+    """
+    Sampling-profiler for alle tråde (cProfile ser kun de tråde den er slået
+    til i): hvert interval tages stakken for hver tråd via
+    sys._current_frames() og tælles som "collapsed stack" (rod;...;blad),
+    klar til flamegraph.pl / speedscope.
+    """
+
+    def __init__(self, interval: float = PROFILE_SAMPLE_INTERVAL):
+        super().__init__(name="stack-sampler", daemon=True)
+        self.interval = max(0.0005, interval)
+        self.stacks: Dict[str, int] = collections.Counter()
+        self.samples = 0
+        self._halt = threading.Event()
+
+    def run(self) -> None:
+        me = threading.get_ident()
+        while not self._halt.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    names.append(f"{_short(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(names))] += 1
+                self.samples += 1
+
+    def stop(self) -> None:
+        self._halt.set()
+        self.join()
+
+    def write_collapsed(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, n in sorted(self.stacks.items(), key=lambda kv: -kv[1]):
+                f.write(f"{stack} {n}\n")
+
+
+class _ThreadProfiles:
+    """
+    cProfile for alle tråde. Før 3.12 er cProfile pr tråd, så nye tråde
+    (scan-workers) får deres egen Profile omkring Thread.run, der slås fra
+    i tråden selv når den slutter; fra 3.12 bygger cProfile på
+    sys.monitoring og ser i forvejen alle tråde.
+    Kun færdige tråde lægges sammen: en Profile der stadig kører (fx en
+    spekulativ request der løber færdig i baggrunden) kan ikke slås fra
+    sikkert fra en anden tråd.
+    """
+
+    def __init__(self):
+        self.finished: List[cProfile.Profile] = []
+        self.started = 0
+        self.main = None
+        self._lock = threading.Lock()
+        self._per_thread = sys.version_info < (3, 12)
+        self._orig_run = None
+
+    def _wrap_run(self, run):
+        profiles = self
+
+        def profiled_run(thread):
+            prof = cProfile.Profile()
+            with profiles._lock:
+                profiles.started += 1
+            prof.enable()
+            try:
+                return run(thread)
+            finally:
+                prof.disable()
+                with profiles._lock:
+                    profiles.finished.append(prof)
+
+        return profiled_run
+
+    def start(self) -> None:
+        if self._per_thread:
+            self._orig_run = threading.Thread.run
+            threading.Thread.run = self._wrap_run(self._orig_run)
+        self.main = cProfile.Profile()
+        self.main.enable()
+
+    def stop(self) -> pstats.Stats:
+        self.main.disable()
+        if self._orig_run is not None:
+            threading.Thread.run = self._orig_run
+            self._orig_run = None
+        with self._lock:
+            profiles = list(self.finished)
+            running = self.started - len(profiles)
+        if running:
+            print(f"PROFIL: {running} tråd(e) kørte stadig ved slut og er ikke medregnet")
+        stats = pstats.Stats(self.main)
+        for prof in profiles:
+            try:
+                stats.add(prof)
+            except (TypeError, ValueError):
+                pass  # tråd der aldrig nåede at kalde noget
+        return stats
+
+
+def _print_cpu_hotspots(stats: pstats.Stats, top_n: int) -> None:
+    by_group: Dict[str, float] = collections.defaultdict(float)
+    rows = []
+    for (filename, lineno, func), (_cc, nc, tt, ct, _callers) in stats.stats.items():
+        group = _group_of(filename, func)
+        by_group[group] += tt
+        rows.append((tt, ct, nc, group, f"{_short(filename)}:{lineno}({func})"))
+
+    waited = by_group.pop("ventetid", 0.0)
+    total = sum(by_group.values()) or 1.0
+    print(f"\n=== PROFIL: CPU (egen tid) pr modulgruppe – {waited:.2f}s ventetid (låse/køer/I/O) ikke medregnet ===")
+    for group, tt in sorted(by_group.items(), key=lambda kv: -kv[1]):
+        print(f"{group:<18} {tt:8.2f}s  {100 * tt / total:5.1f}%")
+
+    print(f"\n=== PROFIL: top {top_n} funktioner (egen tid, uden ventetid) ===")
+    busy = [row for row in rows if row[3] != "ventetid"]
+    for tt, ct, nc, group, where in sorted(busy, reverse=True)[:top_n]:
+        print(f"{tt:8.3f}s egen  {ct:8.3f}s total  {nc:>9} kald  [{group}] {where}")
+
+
+def _print_memory_hotspots(snapshot: tracemalloc.Snapshot, peak: int, top_n: int) -> List[str]:
+    snapshot = snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+    ))
+    by_group: Dict[str, int] = collections.defaultdict(int)
+    for stat in snapshot.statistics("filename"):
+        by_group[_group_of(stat.traceback[0].filename)] += stat.size
+
+    print(f"\n=== PROFIL: hukommelse (peak {peak / 1e6:.1f} MB, live ved slut pr modulgruppe) ===")
+    for group, size in sorted(by_group.items(), key=lambda kv: -kv[1]):
+        print(f"{group:<18} {size / 1e6:8.2f} MB")
+
+    lines = []
+    print(f"\n=== PROFIL: top {top_n} allokeringssteder ===")
+    for stat in snapshot.statistics("lineno")[:top_n]:
+        frame = stat.traceback[0]
+        line = f"{stat.size / 1e6:8.2f} MB  {stat.count:>8} blokke  [{_group_of(frame.filename)}] {_short(frame.filename)}:{frame.lineno}"
+        print(line)
+        lines.append(line)
+    return lines
+
+
+@contextmanager
+def profiled(enabled: bool = True, top_n: int = PROFILE_TOP_N):
+    """
+    Profilér alt inde i with-blokken: cProfile (alle tråde), tracemalloc og
+    en sampling-profiler. Artefakter gemmes i <state>/profile/:
+      main.pstats     (python -m pstats / snakeviz)
+      main.collapsed  (flamegraph.pl / speedscope)
+      memory.txt      (top allokeringssteder)
+    og top-N hotspots printes pr modulgruppe.
+    """
+    if not enabled:
+        yield
+        return
+
+    print(f"PROFILERING slået til (sample hvert {PROFILE_SAMPLE_INTERVAL * 1000:.0f} ms)")
+    tracemalloc.start(PROFILE_TRACEMALLOC_FRAMES)
+    sampler = StackSampler()
+    sampler.start()
+    profiles = _ThreadProfiles()
+    started = time.perf_counter()
+    profiles.start()
+    try:
+        yield
+    finally:
+        stats = profiles.stop()
+        elapsed = time.perf_counter() - started
+        sampler.stop()
+        snapshot = tracemalloc.take_snapshot()
+        _current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        pstats_path = state_path(PROFILE_DIR, "main.pstats")
+        collapsed_path = state_path(PROFILE_DIR, "main.collapsed")
+        memory_path = state_path(PROFILE_DIR, "memory.txt")
+        stats.dump_stats(pstats_path)
+        sampler.write_collapsed(collapsed_path)
+
+        print(f"\nPROFIL: {elapsed:.1f}s væg-tid, {sampler.samples} stack samples")
+        _print_cpu_hotspots(stats, top_n)
+        memory_lines = _print_memory_hotspots(snapshot, peak, top_n)
+        with open(memory_path, "w", encoding="utf-8") as f:
+            f.write(f"peak {peak} bytes\n")
+            f.write("\n".join(memory_lines) + "\n")
+        print(f"\nProfil gemt: {pstats_path}, {collapsed_path}, {memory_path}")
@@ -0,0 +1,161 @@
+import bisect
+import os
+from typing import Dict, List, Optional, Tuple
+
+from pokemon_price_tracker.median_engine import MODES, OfferArrays, daily_minima_series
+from pokemon_price_tracker.offers import Offer
+from pokemon_price_tracker.state import load_json, save_json
+
+
+# ----------------- KONFIG -----------------
+# Median over daily minima fra de seneste N kalenderdage (0 = hele historikken, som hidtil).
+# Typiske værdier: 30 / 90 / 365.
+MEDIAN_WINDOW_DAYS = int(os.getenv("MEDIAN_WINDOW_DAYS", "0"))
+
+ROLLING_STATE_FILE = "rolling_medians.json"
+ROLLING_STATE_VERSION = 2
+# ------------------------------------------
+
+
+class _ProductSeries:
+    """
+    Daily minima for ét produkt:
+      days/prices = serien i dag-orden (kun dage inden for vinduet)
+      ordered     = samme priser sorteret, så medianen er et opslag
+    """
+    __slots__ = ("days", "prices", "ordered")
+
+    def __init__(self, days: List[int], prices: List[float], ordered: Optional[List[float]] = None):
+        self.days = days
+        self.prices = prices
+        self.ordered = ordered if ordered is not None else sorted(prices)
+
+    def add(self, day: int, price: float) -> None:
+        i = bisect.bisect_left(self.days, day)
+        if i < len(self.days) and self.days[i] == day:
+            # Samme dag igen (fx kørt to gange): behold dagens minimum
+            old = self.prices[i]
+            if price >= old:
+                return
+            del self.ordered[bisect.bisect_left(self.ordered, old)]
+            self.prices[i] = price
+        else:
+            self.days.insert(i, day)
+            self.prices.insert(i, price)
+        bisect.insort(self.ordered, price)
+
+    def prune(self, cutoff: int) -> None:
+        """Fjern dage <= cutoff (uden for vinduet)."""
+        while self.days and self.days[0] <= cutoff:
+            self.days.pop(0)
+            del self.ordered[bisect.bisect_left(self.ordered, self.prices.pop(0))]
+
+    def median(self) -> float:
+        n = len(self.ordered)
+        return (self.ordered[(n - 1) // 2] + self.ordered[n // 2]) / 2.0
+
+
+class RollingMedianState:
+    """
+    Persisteret median-state pr mode og produkt, så en daglig kørsel kun
+    skal lægge dagens minimum til (O(produkter)) i stedet for at læse hele
+    historikken.
+
+    synced_rowid = højeste offers-rowid i HistoryStore som state afspejler.
+    Passer det ikke (ny maskine, tabt cache, backfill), genopbygges fra historikken.
+    latest_day = seneste dag i historikken; vinduet skæres mod den for alle
+    produkter (også dem uden pris i dag), præcis som rebuild gør.
+    """
+
+    def __init__(self, window: int = MEDIAN_WINDOW_DAYS, synced_rowid: int = -1):
+        self.window = int(window)
+        self.synced_rowid = synced_rowid
+        self.latest_day = 0
+        self.modes: Dict[str, Dict[str, _ProductSeries]] = {m: {} for m in MODES}
+
+    @classmethod
+    def load(cls, window: int = MEDIAN_WINDOW_DAYS) -> "RollingMedianState":
+        data = load_json(ROLLING_STATE_FILE, default=None)
+        state = cls(window)
+        if (
+            not isinstance(data, dict)
+            or data.get("version") != ROLLING_STATE_VERSION
+            or data.get("window") != state.window
+        ):
+            return state
+
+        state.synced_rowid = int(data.get("synced_rowid", -1))
+        state.latest_day = int(data.get("latest_day", 0))
+        for mode in MODES:
+            for product, (days, prices, ordered) in (data.get("modes", {}).get(mode) or {}).items():
+                state.modes[mode][product] = _ProductSeries(days, prices, ordered)
+        return state
+
+    @classmethod
+    def rebuild(cls, arrays: OfferArrays, window: int = MEDIAN_WINDOW_DAYS) -> "RollingMedianState":
+        state = cls(window)
+        latest = int(arrays.day.max()) if arrays.day.size else 0
+        state.latest_day = latest
+        for mode, series in daily_minima_series(arrays).items():
+            for product, (days, prices) in series.items():
+                if state.window > 0:
+                    i = bisect.bisect_right(days, latest - state.window)
+                    days, prices = days[i:], prices[i:]
+                if days:
+                    state.modes[mode][product] = _ProductSeries(days, prices)
+        return state
+
+    def in_sync(self, rowid: int) -> bool:
+        return self.synced_rowid == rowid
+
+    def save(self) -> None:
+        save_json(
+            {
+                "version": ROLLING_STATE_VERSION,
+                "window": self.window,
+                "synced_rowid": self.synced_rowid,
+                "latest_day": self.latest_day,
+                "modes": {
+                    mode: {name: [s.days, s.prices, s.ordered] for name, s in products.items()}
+                    for mode, products in self.modes.items()
+                },
+            },
+            ROLLING_STATE_FILE,
+        )
+
+    def update(self, mode: str, day: int, chosen: Dict[str, Offer]) -> None:
+        """Læg dagens minimum (billigste valgte tilbud) til for hvert produkt."""
+        products = self.modes[mode]
+        for name, offer in chosen.items():
+            if offer is None:
+                continue
+            price = float(offer.price)
+            series = products.get(name)
+            if series is None:
+                products[name] = _ProductSeries([day], [price])
+            else:
+                series.add(day, price)
+        self.latest_day = max(self.latest_day, day)
+        for m in MODES:
+            self._prune(m)
+
+    def _prune(self, mode: str) -> None:
+        if self.window <= 0:
+            return
+        cutoff = self.latest_day - self.window
+        products = self.modes[mode]
+        for name in list(products):
+            products[name].prune(cutoff)
+            if not products[name].days:
+                del products[name]
+
+    def medians(self, mode: str) -> Tuple[Dict[str, float], Dict[str, int]]:
+        median_map: Dict[str, float] = {}
+        hist_days_map: Dict[str, int] = {}
+        self._prune(mode)
+        for name, series in self.modes[mode].items():
+            if not series.days:
+                continue
+            median_map[name] = float(series.median())
+            hist_days_map[name] = len(series.days)
+        return median_map, hist_days_map
@@ -0,0 +1,136 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, Iterator, List, NamedTuple, Optional
+
+from pokemon_price_tracker import instrumentation
+
+
+# ----------------- KONFIG -----------------
+# Globalt loft over samtidige crawls, og hvor mange der må ramme samme host ad gangen.
+SCAN_MAX_WORKERS = int(os.getenv("SCAN_MAX_WORKERS", "8"))
+SCAN_MAX_PER_HOST = int(os.getenv("SCAN_MAX_PER_HOST", "2"))
+# Maks antal produkter i kø mellem crawl-tråde og main (backpressure)
+SCAN_QUEUE_SIZE = int(os.getenv("SCAN_QUEUE_SIZE", "2000"))
+# ------------------------------------------
+
+
+class ScanTask(NamedTuple):
+    """
+    Én uafhængig crawl-opgave (typisk ét domæne).
+    label = shop-navn til logs/fallback, host = nøgle til per-host loft,
+    run = callable der returnerer (eller yielder) produkt-dicts.
+    """
+    label: str
+    host: str
+    run: Callable[[], Iterable[dict]]
+
+
+class ScanEvent(NamedTuple):
+    """
+    kind = "product" -> value er et produkt-dict
+    kind = "done"    -> value er antal produkter fra opgaven
+    kind = "error"   -> value er exception
+    """
+    kind: str
+    task: ScanTask
+    value: Any
+
+
+def collect_scan_tasks(shops) -> List[ScanTask]:
+    """
+    Shop-moduler med get_scan_tasks() splittes op pr domæne.
+    Moduler der kun har get_products() køres som én samlet opgave.
+    """
+    tasks: List[ScanTask] = []
+    for shop_label, module in shops:
+        if hasattr(module, "get_scan_tasks"):
+            try:
+                tasks.extend(module.get_scan_tasks())
+                continue
+            except Exception as e:
+                print(f"Fejl ved opgaver fra {shop_label}: {e}")
+                continue
+        tasks.append(ScanTask(shop_label, shop_label, module.get_products))
+    return tasks
+
+
+def stream_scan_tasks(
+    tasks: List[ScanTask],
+    max_workers: int = SCAN_MAX_WORKERS,
+    max_per_host: int = SCAN_MAX_PER_HOST,
+    queue_size: int = SCAN_QUEUE_SIZE,
+) -> Iterator[ScanEvent]:
+    """
+    Kør opgaverne i en bounded thread pool og yield ScanEvents efterhånden
+    som produkterne kommer, så main kan gruppere/persistere løbende i stedet
+    for at vente på (og holde) hele lister.
+
+    Vi submitter kun en opgave når dens host har ledig kapacitet, så ventende
+    opgaver ikke optager en worker mens de venter på deres host.
+    """
+    max_workers = max(1, int(max_workers))
+    max_per_host = max(1, int(max_per_host))
+
+    events: "queue.Queue[ScanEvent]" = queue.Queue(maxsize=max(1, int(queue_size)))
+    cancelled = threading.Event()
+
+    def put(event: ScanEvent) -> bool:
+        while not cancelled.is_set():
+            try:
+                events.put(event, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def worker(task: ScanTask) -> None:
+        count = 0
+        started = time.perf_counter()
+        try:
+            for product in task.run() or []:
+                count += 1
+                if not put(ScanEvent("product", task, product)):
+                    return
+        except Exception as e:
+            instrumentation.count("scan.task_errors", task=task.label)
+            put(ScanEvent("error", task, e))
+            return
+        finally:
+            # inkl. tid blokeret på en fuld kø (backpressure fra main)
+            instrumentation.observe("scan.task_s", time.perf_counter() - started, task=task.label)
+            instrumentation.count("scan.products", count, task=task.label)
+        put(ScanEvent("done", task, count))
+
+    pending = list(tasks)
+    running = 0
+    host_load = {}
+
+    def next_ready() -> Optional[ScanTask]:
+        for i, t in enumerate(pending):
+            if host_load.get(t.host, 0) < max_per_host:
+                return pending.pop(i)
+        return None
+
+    pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="scan")
+    try:
+        while pending or running:
+            while running < max_workers:
+                task = next_ready()
+                if task is None:
+                    break
+                host_load[task.host] = host_load.get(task.host, 0) + 1
+                running += 1
+                pool.submit(worker, task)
+
+            event = events.get()
+            if event.kind != "product":
+                running -= 1
+                host_load[event.task.host] -= 1
+            yield event
+    finally:
+        # Stopper forbrugeren før tid, skal ventende workers ikke hænge på en fuld kø
+        cancelled.set()
+        pool.shutdown(wait=True, cancel_futures=True)
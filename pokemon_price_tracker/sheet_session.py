@@ -0,0 +1,96 @@
+from typing import Dict, List, Optional
+
+
+def a1_sheet(title: str, cells: str = "") -> str:
+    """'Ark navn'!A1:G1 (eller hele arket hvis cells er tom)."""
+    quoted = "'" + str(title).replace("'", "''") + "'"
+    return f"{quoted}!{cells}" if cells else quoted
+
+
+class SheetSession:
+    """
+    Samler en kørsels Sheets-I/O i så få API-kald som muligt:
+      - læsninger: én values.batchGet (+ én metadata-læsning)
+      - skrivninger: én spreadsheets.batchUpdate (resize/format)
+        og én values.batchUpdate (alle celleværdier), sendt ved flush()
+    """
+
+    def __init__(self, sh):
+        self.sh = sh
+        self.calls = 0
+        self._metadata: Optional[dict] = None
+        self._values: List[dict] = []
+        self._requests: List[dict] = []
+        self._optional_requests: List[dict] = []
+
+    # ---------- læsning ----------
+    def batch_get(self, ranges: List[str], value_render_option: Optional[str] = None) -> List[list]:
+        """
+        Værdier for hvert range i samme rækkefølge. Default er FORMATTED_VALUE
+        (som get_all_values); "FORMULA" giver rå tal og formler.
+        """
+        if not ranges:
+            return []
+        self.calls += 1
+        params = {"valueRenderOption": value_render_option} if value_render_option else None
+        resp = self.sh.values_batch_get(ranges, params=params)
+        value_ranges = resp.get("valueRanges", []) or []
+        out = [vr.get("values", []) or [] for vr in value_ranges]
+        out += [[] for _ in range(len(ranges) - len(out))]
+        return out
+
+    def sheet_properties(self, sheet_id: int) -> dict:
+        """
+        Metadata (gridProperties + conditionalFormats) for ét ark. Hele
+        regnearkets metadata hentes kun én gang pr session.
+        """
+        if self._metadata is None:
+            self.calls += 1
+            self._metadata = self.sh.fetch_sheet_metadata(
+                params={"fields": "sheets(properties(sheetId,title,gridProperties),conditionalFormats)"}
+            )
+        for s in self._metadata.get("sheets", []):
+            if s.get("properties", {}).get("sheetId") == sheet_id:
+                return s
+        return {}
+
+    # ---------- skrivning ----------
+    def queue_values(self, a1_range: str, values: List[list]) -> None:
+        self._values.append({"range": a1_range, "values": values})
+
+    def queue_requests(self, requests: List[dict], optional: bool = False) -> None:
+        """optional=True: fx formatting, som ikke må vælte kørslen hvis den fejler."""
+        (self._optional_requests if optional else self._requests).extend(requests)
+
+    def flush(self) -> Dict[str, int]:
+        """
+        Struktur (resize) + formatting først, så gridet er stort nok til
+        værdierne, derefter alle værdier i ét kald.
+        """
+        sent = {"requests": 0, "value_ranges": 0}
+
+        requests = self._requests + self._optional_requests
+        if requests:
+            try:
+                self.calls += 1
+                self.sh.batch_update({"requests": requests})
+                sent["requests"] = len(requests)
+            except Exception as e:
+                if not self._optional_requests:
+                    raise
+                # Formatting må gerne fejle, strukturændringerne skal stadig igennem
+                print(f"Sheets formatting fejlede (ignoreres): {e}")
+                if self._requests:
+                    self.calls += 1
+                    self.sh.batch_update({"requests": self._requests})
+                    sent["requests"] = len(self._requests)
+
+        if self._values:
+            self.calls += 1
+            self.sh.values_batch_update({"valueInputOption": "USER_ENTERED", "data": self._values})
+            sent["value_ranges"] = len(self._values)
+
+        self._values, self._requests, self._optional_requests = [], [], []
+        # Efter skrivning passer den cachede metadata ikke længere
+        self._metadata = None
+        return sent
@@ -0,0 +1,170 @@
+import os
+import random
+import threading
+import time
+from typing import Callable, Dict
+
+import requests
+from gspread.exceptions import APIError
+
+from pokemon_price_tracker import instrumentation
+
+
+# ----------------- KONFIG -----------------
+# Sheets API kvoter er pr minut (læs og skriv tælles hver for sig)
+SHEETS_READS_PER_MIN = float(os.getenv("SHEETS_READS_PER_MIN", "60"))
+SHEETS_WRITES_PER_MIN = float(os.getenv("SHEETS_WRITES_PER_MIN", "60"))
+SHEETS_BURST = float(os.getenv("SHEETS_BURST", "10"))
+
+SHEETS_MAX_RETRIES = int(os.getenv("SHEETS_MAX_RETRIES", "6"))
+SHEETS_BACKOFF_BASE = float(os.getenv("SHEETS_BACKOFF_BASE", "1.0"))
+SHEETS_BACKOFF_MAX = float(os.getenv("SHEETS_BACKOFF_MAX", "64"))
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# gspread-metoder vi bruger, fordelt på kvote
+READ_METHODS = frozenset({
+    "worksheet", "fetch_sheet_metadata", "values_batch_get",
+    "get_all_values", "row_values",
+})
+WRITE_METHODS = frozenset({
+    "add_worksheet", "batch_update", "values_batch_update",
+    "append_rows", "update", "clear", "resize", "sort",
+})
+# Ikke-idempotente kald: en timeout/5xx kan komme efter at kaldet er gået
+# igennem, og et nyt forsøg giver så dubletter (RawOffers-rækker, conditional
+# format-regler, ark). De gentages kun på 429, hvor Sheets har afvist kaldet.
+NON_IDEMPOTENT_METHODS = frozenset({"append_rows", "add_worksheet", "batch_update"})
+# ------------------------------------------
+
+
+class TokenBucket:
+    """Klassisk token bucket: rate tokens pr minut, højst capacity på lager."""
+
+    def __init__(self, per_minute: float, capacity: float = SHEETS_BURST):
+        self.rate = max(per_minute, 0.001) / 60.0
+        self.capacity = max(1.0, float(capacity))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Tag ét token; returnér hvor mange sekunder vi ventede."""
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return waited
+                delay = (1.0 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+def _retryable(e: Exception, method: str = "") -> bool:
+    if isinstance(e, APIError):
+        status = getattr(getattr(e, "response", None), "status_code", None)
+        if method in NON_IDEMPOTENT_METHODS:
+            return status == 429
+        return status in RETRY_STATUSES
+    if method in NON_IDEMPOTENT_METHODS:
+        return False
+    return isinstance(e, (requests.ConnectionError, requests.Timeout))
+
+
+class SheetsThrottle:
+    """
+    Fælles limiter for alle Sheets-kald i en kørsel: token bucket pr kvote
+    (read/write) og eksponentiel backoff med jitter på 429/5xx (kun 429 for
+    NON_IDEMPOTENT_METHODS).
+    """
+
+    def __init__(self):
+        self.buckets = {
+            "read": TokenBucket(SHEETS_READS_PER_MIN),
+            "write": TokenBucket(SHEETS_WRITES_PER_MIN),
+        }
+        self.calls: Dict[str, int] = {"read": 0, "write": 0}
+        self.retries = 0
+        self.throttle_wait = 0.0
+        self.backoff_wait = 0.0
+
+    def call(self, kind: str, fn: Callable, *args, **kwargs):
+        attempt = 0
+        method = getattr(fn, "__name__", "kald")
+        while True:
+            waited = self.buckets[kind].acquire()
+            self.throttle_wait += waited
+            self.calls[kind] += 1
+            instrumentation.count("sheets.calls", kind=kind, method=method)
+            if waited:
+                instrumentation.observe("sheets.quota_wait_s", waited, kind=kind)
+            try:
+                with instrumentation.timer("sheets.call_s", method=method):
+                    return fn(*args, **kwargs)
+            except Exception as e:
+                if attempt >= SHEETS_MAX_RETRIES or not _retryable(e, method):
+                    raise
+                # "full jitter": tilfældig ventetid op til den eksponentielle grænse
+                delay = random.uniform(0, min(SHEETS_BACKOFF_MAX, SHEETS_BACKOFF_BASE * (2 ** attempt)))
+                attempt += 1
+                self.retries += 1
+                self.backoff_wait += delay
+                instrumentation.count("sheets.retries", method=method)
+                print(f"Sheets {method} fejlede ({e}); forsøg {attempt}/{SHEETS_MAX_RETRIES} om {delay:.1f}s")
+                time.sleep(delay)
+
+    def summary(self) -> str:
+        return (
+            f"{self.calls['read']} read, {self.calls['write']} write, "
+            f"{self.retries} retries, ventet {self.throttle_wait:.1f}s (kvote) + {self.backoff_wait:.1f}s (backoff)"
+        )
+
+
+class _Throttled:
+    """Proxy der sender kendte gspread-metoder gennem throttle; alt andet går direkte igennem."""
+
+    def __init__(self, target, throttle: SheetsThrottle):
+        self._target = target
+        self._throttle = throttle
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if name in READ_METHODS:
+            kind = "read"
+        elif name in WRITE_METHODS:
+            kind = "write"
+        else:
+            return attr
+
+        def wrapped(*args, **kwargs):
+            result = self._throttle.call(kind, attr, *args, **kwargs)
+            if name in ("worksheet", "add_worksheet"):
+                return ThrottledWorksheet(result, self._throttle)
+            return result
+
+        return wrapped
+
+
+class ThrottledWorksheet(_Throttled):
+    pass
+
+
+class ThrottledSpreadsheet(_Throttled):
+    @property
+    def sheet1(self):
+        return ThrottledWorksheet(self._throttle.call("read", lambda: self._target.sheet1), self._throttle)
+
+
+_throttle = SheetsThrottle()
+
+
+def get_throttle() -> SheetsThrottle:
+    return _throttle
+
+
+def throttled(sh) -> ThrottledSpreadsheet:
+    return ThrottledSpreadsheet(sh, _throttle)
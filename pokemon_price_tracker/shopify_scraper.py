@@ -1,38 +1,39 @@
-import re
-import requests
-from pokemon_price_tracker.product_grouping import detect_series
-
-
-
-# -------- Singles (kort) indikatorer --------
-RARITY_WORDS = [
-    "common", "uncommon", "rare", "double rare",
-    "ultra rare", "secret rare", "illustration rare", "art rare",
-    "holo", "reverse holo", "reverse-holo", "reverseholo",
-]
-
-CONDITION_WORDS = [
-    "near mint", "nm", "lp", "mp", "hp", "played", "damaged",
-    "reverse-holo normal",
-]
-
-CARD_NO_BRACKET_RE = re.compile(r"\[[a-z0-9\-]{2,}\]", re.IGNORECASE)
-SLASHY_CONDITION_RE = re.compile(r"\b(english|near mint|reverse|holo)\b.*\/", re.IGNORECASE)
-
-
-def looks_like_single_card(title_or_text: str) -> bool:
-    t = (title_or_text or "").lower()
-    if CARD_NO_BRACKET_RE.search(t):
-        return True
-    if SLASHY_CONDITION_RE.search(t):
-        return True
-    if any(w in t for w in RARITY_WORDS):
-        return True
-    if any(w in t for w in CONDITION_WORDS):
-        return True
-    if re.search(r"\((common|uncommon|rare)\)", t):
-        return True
-    return False
+import datetime
+import hashlib
+import os
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from pokemon_price_tracker import http_client, instrumentation, page_cache
+from pokemon_price_tracker.json_stream import iter_json_array
+from pokemon_price_tracker.narrow_fetch import mark_full_crawl, use_narrow
+from pokemon_price_tracker.offers import Product, products_from_rows, products_to_rows
+from pokemon_price_tracker.page_prefetch import iter_pages, short_page_detector
+from pokemon_price_tracker.prefilter import (  # noqa: F401  (re-eksporteres til Shops/)
+    BANNED_GRADED_WORDS,
+    BANNED_LANGUAGE_WORDS,
+    REQUIRED_PRODUCT_WORDS,
+    ProductFilter,
+    looks_like_single_card,
+)
+from pokemon_price_tracker.state import load_json, safe_name, save_json
+from pokemon_price_tracker.product_grouping import detect_series, rules_fingerprint
+
+
+# ----------------- KONFIG -----------------
+# Conditional requests (ETag/Last-Modified) mod /products.json, med fuld crawl med jævne mellemrum
+SHOPIFY_INCREMENTAL = os.getenv("SHOPIFY_INCREMENTAL", "1").strip() not in ("0", "false", "")
+SHOPIFY_FULL_CRAWL_DAYS = int(os.getenv("SHOPIFY_FULL_CRAWL_DAYS", "7"))
+
+# Dekod products.json ét produkt ad gangen under download (i stedet for response.json()).
+# Med streaming sparer PAGE_CACHE ikke dekodningen: siden hashes mens den streames,
+# og udtrækket gemmes kun (til genbrug efter 304) når digesten afviger fra den i
+# crawl-state. SHOPIFY_STREAM_JSON=0 genbruger udtrækket for byte-identiske sider
+# helt (til gengæld læses hele siden i hukommelsen først).
+SHOPIFY_STREAM_JSON = os.getenv("SHOPIFY_STREAM_JSON", "1").strip() not in ("0", "false", "")
+STREAM_CHUNK_SIZE = 64 * 1024
+
+SHOPIFY_PAGE_LIMIT = 250  # products.json max pr side
+# ------------------------------------------
 
 
 # 151-queries vi betragter som “sikker 151”
@@ -98,106 +99,359 @@ def _series_hint_from_matches(full_text_lower: str, matched_queries: list[str])
     return "Unknown Series"
 
 
-def scan_shopify_store_json(domain: str, queries: list[str]) -> list[dict]:
-    page = 1
+def _extract_page_products(domain: str, raw_products: Iterable[dict], product_filter: ProductFilter) -> List[Product]:
     products = []
-    queries_l = [q.lower() for q in queries]
 
-    banned_language_words = [
-        "japanese", "japansk", "korean", "koreansk", "chinese", "kinesisk",
-        "german", "tysk", "french", "fransk",
-    ]
+    for product in raw_products:
+        title_raw = (product.get("title") or "")
+        body_raw = (product.get("body_html") or "")
+        ptype_raw = (product.get("product_type") or "")
+        handle = (product.get("handle") or "").strip()
+
+        full_text = f"{title_raw} {body_raw} {ptype_raw}"
+
+        # queries + udeluk (sprog/graded/singles) + kræv sealed i ét prefilter
+        verdict = product_filter.classify(title_raw, full_text)
+        if not verdict.keep:
+            continue
+        matched = verdict.matched_queries
+        full_text_l = full_text.lower()
+
+        # Hint + fallback detektion
+        series_hint = _series_hint_from_matches(full_text_l, matched)
+        if series_hint == "Unknown Series":
+            series_hint = detect_series(full_text)
+
+        # base URL til produkt (variant tilføjes pr variant)
+        base_product_url = ""
+        if handle:
+            base_product_url = f"https://{domain}/products/{handle}"
+
+        for variant in product.get("variants", []):
+            try:
+                price = float(variant["price"])
+            except Exception:
+                continue
 
-    banned_graded_words = ["psa", "bgs", "cgc", "graded", "slab"]
+            variant_title = variant.get("title", "")
+            variant_name = "" if variant_title == "Default Title" else variant_title
+            full_name = f"{title_raw.strip()} {variant_name}".strip()
 
-    required_product_words = [
-        "booster", "box", "bundle", "collection",
-        "elite trainer", "etb", "tin", "blister",
-        "display", "sticker", "poster", "figure", "pin",
-    ]
+            if looks_like_single_card(full_name):
+                continue
 
-    while True:
-        url = f"https://{domain}/products.json?limit=250&page={page}"
-        print(f"Henter JSON: {url}")
+            variant_id = variant.get("id")
+            variant_url = base_product_url
+            if base_product_url and variant_id:
+                variant_url = f"{base_product_url}?variant={variant_id}"
+
+            products.append(
+                Product(
+                    full_name,
+                    price,
+                    variant.get("available", False),
+                    series_hint,
+                    matched,
+                    variant_url,  # ✅ direkte link
+                    grouping_text=full_text,
+                )
+            )
+
+    return products
+
+
+def _iter_raw_products(response, chunks: Optional[Iterable[bytes]] = None) -> Iterable[dict]:
+    """
+    Produkterne fra en products.json-side. I streaming-mode dekodes ét produkt
+    ad gangen mens siden downloades, så hele siden (med body_html) aldrig
+    ligger i hukommelsen som ét dokument. chunks = allerede åbnet chunk-strøm
+    (fx hashet undervejs).
+    """
+    if SHOPIFY_STREAM_JSON:
+        if chunks is None:
+            chunks = response.iter_content(chunk_size=STREAM_CHUNK_SIZE)
+        return iter_json_array(chunks, "products")
+    return (response.json() or {}).get("products") or []
+
+
+def _hashed_chunks(chunks: Iterable[bytes], hasher) -> Iterator[bytes]:
+    for chunk in chunks:
+        hasher.update(chunk)
+        yield chunk
+
+
+def _track_page(raw_products: Iterable[dict], page_info: dict) -> Iterator[dict]:
+    for p in raw_products:
+        updated_at = str(p.get("updated_at") or "")
+        page_info["count"] += 1
+        page_info["updated"].append(updated_at)
+        if updated_at > page_info["max_updated_at"]:
+            page_info["max_updated_at"] = updated_at
+        yield p
+
+
+def _changed_since(page_info: dict, watermark: str) -> int:
+    # Shopify bruger ISO-8601 med samme tidszone pr butik, så strenge kan sammenlignes direkte
+    if not watermark:
+        return 0
+    return sum(1 for updated_at in page_info.get("updated") or [] if updated_at > watermark)
+
+
+def _read_page(
+    domain: str,
+    page_key: str,
+    response,
+    product_filter: ProductFilter,
+    previous_digest: Optional[str] = None,
+) -> Tuple[dict, str]:
+    """
+    Udtræk fra en products.json-side: ({"count", "max_updated_at", "updated", "products"}, digest).
+    Med PAGE_CACHE uden streaming hashes body først; er siden byte-identisk med
+    sidst, genbruges udtrækket uden JSON-dekodning og filtrering (også når
+    butikken ikke understøtter ETag/304).
+    Med streaming hashes chunks mens de dekodes, og udtrækket gemmes kun hvis
+    digesten afviger fra previous_digest (fra crawl-state); previous_digest=None
+    = ingen crawl-state at genbruge udtrækket fra, så cachen springes over.
+    digest er "" når cachen ikke bruges.
+    """
+    digest = ""
+    chunks = None
+    hasher = None
+    context = page_cache.context_key(domain, product_filter.signature) if page_cache.PAGE_CACHE else None
+    if page_cache.PAGE_CACHE:
+        if SHOPIFY_STREAM_JSON:
+            if previous_digest is not None:
+                hasher = page_cache.page_hasher(domain, product_filter.signature)
+                chunks = _hashed_chunks(response.iter_content(chunk_size=STREAM_CHUNK_SIZE), hasher)
+        else:
+            digest = page_cache.page_digest(response.content, domain, product_filter.signature)
+            cached = page_cache.load(domain, page_key, digest)
+            products = products_from_rows((cached or {}).get("products"))
+            if products is not None:
+                return dict(cached, products=products), digest
+
+    page_info = {"count": 0, "max_updated_at": "", "updated": []}
+    raw_products = _track_page(_iter_raw_products(response, chunks), page_info)
+    products = _extract_page_products(domain, raw_products, product_filter)
+
+    if hasher is not None:
+        # iter_json_array stopper ved "]"; resten af body skal med i digesten
+        for _ in chunks:
+            pass
+        digest = hasher.hexdigest()
+        if digest == previous_digest:
+            # samme side som sidst: udtrækket ligger allerede i cachen
+            page_info["products"] = products
+            return page_info, digest
+
+    if digest:
+        page_cache.store(domain, page_key, digest, dict(page_info, products=products_to_rows(products)), context)
+    page_info["products"] = products
+    return page_info, digest
+
+
+def _crawl_signature(product_filter: ProductFilter) -> str:
+    """
+    Filterets ordlister + product_grouping-regler + PAGE_CACHE_VERSION. En 304
+    genbruger det gemte udtræk (filter-verdict og series_hint), så ændres én
+    af dem, må gemt state ikke bruges.
+    """
+    raw = "\0".join((product_filter.signature, rules_fingerprint(), page_cache.PAGE_CACHE_VERSION))
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=12).hexdigest()
+
+
+def _load_crawl_state(domain: str, queries_l: list[str], signature: str) -> Tuple[dict, bool]:
+    """
+    Returnerer (state, full_crawl).
+    Fuld crawl (uden conditional headers) hvis state mangler, queries, filter
+    eller grupperings-regler er ændret (signature), eller der er gået
+    SHOPIFY_FULL_CRAWL_DAYS siden sidste fulde crawl.
+    """
+    state = load_json("shopify", f"{safe_name(domain)}.json", default=None)
+    if (
+        not isinstance(state, dict)
+        or state.get("queries") != queries_l
+        or state.get("signature") != signature
+    ):
+        return {}, True
 
-        try:
-            response = requests.get(url, timeout=30)
-            response.raise_for_status()
-            data = response.json()
-        except Exception as e:
-            print(f"Fejl ved hentning: {e}")
-            break
+    try:
+        last_full = datetime.date.fromisoformat(state.get("last_full_crawl") or "")
+    except ValueError:
+        return {}, True
 
-        if not data.get("products"):
-            break
+    if (datetime.date.today() - last_full).days >= SHOPIFY_FULL_CRAWL_DAYS:
+        return state, True
 
-        for product in data["products"]:
-            title_raw = (product.get("title") or "")
-            body_raw = (product.get("body_html") or "")
-            ptype_raw = (product.get("product_type") or "")
-            handle = (product.get("handle") or "").strip()
+    return state, False
 
-            full_text = f"{title_raw} {body_raw} {ptype_raw}"
-            full_text_l = full_text.lower()
-            title_l = title_raw.lower()
 
-            # hvilke queries matchede?
-            matched = [q for q in queries_l if q and (q in full_text_l)]
-            if not matched:
-                continue
+def scan_shopify_store_json(domain: str, queries: list[str], collections: Optional[List[str]] = None) -> List[Product]:
+    return list(iter_shopify_store_json(domain, queries, collections=collections))
 
-            # Udeluk
-            if any(word in title_l for word in banned_language_words):
-                continue
-            if any(word in title_l for word in banned_graded_words):
-                continue
-            if looks_like_single_card(title_raw) or looks_like_single_card(full_text):
-                continue
 
-            # Kræv sealed
-            if not any(word in title_l for word in required_product_words):
-                continue
+def _iter_collections(domain: str, queries: list[str], handles: List[str]) -> Iterator[Product]:
+    """
+    Narrow-mode: kun /collections/<handle>/products.json for de konfigurerede
+    collections. Produkter i flere collections yieldes kun én gang.
+    """
+    product_filter = ProductFilter([q.lower() for q in queries])
+    seen = set()
+
+    for handle in handles:
+        def fetch_page(page: int, handle: str = handle) -> Tuple[int, list]:
+            url = f"https://{domain}/collections/{handle}/products.json?limit={SHOPIFY_PAGE_LIMIT}&page={page}"
+            print(f"Henter JSON: {url}")
+            response = http_client.get(url, stream=True)
+            try:
+                response.raise_for_status()
+                page_info, _digest = _read_page(domain, f"collections/{handle}/{page}", response, product_filter)
+                return page_info["count"], page_info["products"]
+            finally:
+                response.close()
+
+        try:
+            pages = iter_pages(
+                instrumentation.timed(fetch_page, "scrape.page_s", shop=domain),
+                short_page_detector(lambda result: result[0]),
+            )
+            for _page, (count, products) in pages:
+                instrumentation.count("scrape.pages", shop=domain)
+                instrumentation.count("scrape.products_seen", count, shop=domain)
+                instrumentation.count("scrape.products_kept", len(products), shop=domain)
+                for p in products:
+                    key = p.url or (p.name, p.price)
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    yield p
+        except Exception as e:
+            print(f"Fejl ved hentning ({handle}): {e}")
 
-            # Hint + fallback detektion
-            series_hint = _series_hint_from_matches(full_text_l, matched)
-            if series_hint == "Unknown Series":
-                series_hint = detect_series(full_text)
-
-            # base URL til produkt (variant tilføjes pr variant)
-            base_product_url = ""
-            if handle:
-                base_product_url = f"https://{domain}/products/{handle}"
-
-            for variant in product.get("variants", []):
-                try:
-                    price = float(variant["price"])
-                except Exception:
-                    continue
-
-                variant_title = variant.get("title", "")
-                variant_name = "" if variant_title == "Default Title" else variant_title
-                full_name = f"{title_raw.strip()} {variant_name}".strip()
-
-                if looks_like_single_card(full_name):
-                    continue
-
-                variant_id = variant.get("id")
-                variant_url = base_product_url
-                if base_product_url and variant_id:
-                    variant_url = f"{base_product_url}?variant={variant_id}"
-
-                products.append(
-                    {
-                        "name": full_name,
-                        "price": price,
-                        "available": bool(variant.get("available", False)),
-                        "series_hint": series_hint,
-                        "grouping_text": full_text,
-                        "matched_queries": matched,
-                        "url": variant_url,  # ✅ direkte link
-                    }
-                )
 
-        page += 1
+def iter_shopify_store_json(domain: str, queries: list[str], collections: Optional[List[str]] = None) -> Iterator[Product]:
+    """
+    Crawler /products.json og yielder produkterne side for side. Siderne hentes
+    spekulativt parallelt (page_prefetch), men yieldes i rækkefølge.
 
-    return products
\ No newline at end of file
+    Inkrementel mode (SHOPIFY_INCREMENTAL): vi husker ETag/Last-Modified og de
+    udtrukne produkter pr side, og sender conditional requests. En 304 betyder
+    at siden er uændret, og vi genbruger sidste kørsels produkter for den side.
+    Produkterne ligger i page_cache (komprimeret, nøglet på sidens digest);
+    med PAGE_CACHE=0 gemmes de direkte i crawl-state som før.
+
+    collections = narrow-mode: kun de collections crawles, med fuld
+    verifikations-crawl hver NARROW_VERIFY_DAYS.
+    """
+    if collections:
+        if use_narrow(domain):
+            yield from _iter_collections(domain, queries, collections)
+            return
+        print(f"{domain}: fuld verifikations-crawl (narrow-mode)")
+
+    queries_l = [q.lower() for q in queries]
+    product_filter = ProductFilter(queries_l)
+    signature = _crawl_signature(product_filter)
+
+    state, full_crawl = ({}, True)
+    if SHOPIFY_INCREMENTAL:
+        state, full_crawl = _load_crawl_state(domain, queries_l, signature)
+    old_pages = state.get("pages") or {}
+    new_pages = {}
+    not_modified = 0
+    changed_since = 0
+    watermark = state.get("max_updated_at") or ""
+    complete = False
+
+    def cached_products(page_key: str, entry: Optional[dict]) -> Optional[List[Product]]:
+        if not entry:
+            return None
+        if "products" in entry:
+            return products_from_rows(entry["products"])
+        # digesten kommer fra state, ikke fra en body; context_key afviser udtræk lavet under andre regler
+        payload = page_cache.load(
+            domain, page_key, entry.get("digest") or "", page_cache.context_key(domain, product_filter.signature)
+        )
+        return products_from_rows(payload["products"]) if payload else None
+
+    def fetch_page(page: int) -> Tuple[dict, list, int, bool]:
+        """(page_entry, produkter, antal ændret siden watermark, 304?) - kører i prefetch-tråd."""
+        url = f"https://{domain}/products.json?limit={SHOPIFY_PAGE_LIMIT}&page={page}"
+        page_key = f"products/{page}"
+        print(f"Henter JSON: {url}")
+
+        cached = None if full_crawl else old_pages.get(str(page))
+        cached_list = cached_products(page_key, cached)
+        if cached_list is None:
+            cached = None  # uden gemte produkter kan vi ikke bruge en 304
+        headers = {}
+        if cached:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        response = http_client.get(url, headers=headers or None, stream=True)
+        try:
+            if response.status_code == 304 and cached:
+                return cached, cached_list, 0, True
+
+            response.raise_for_status()
+            previous_digest = ((old_pages.get(str(page)) or {}).get("digest") or "") if SHOPIFY_INCREMENTAL else None
+            page_info, digest = _read_page(domain, page_key, response, product_filter, previous_digest)
+            page_entry = {
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "count": page_info["count"],
+                "max_updated_at": page_info["max_updated_at"],
+            }
+            if digest:
+                page_entry["digest"] = digest
+            else:
+                page_entry["products"] = products_to_rows(page_info["products"])
+            return page_entry, page_info["products"], _changed_since(page_info, watermark), False
+        finally:
+            response.close()
+
+    # Tom side, eller kortere end butikkens sidestørrelse, er sidste side
+    is_last = short_page_detector(lambda result: result[0].get("count") or 0)
+
+    try:
+        pages = iter_pages(instrumentation.timed(fetch_page, "scrape.page_s", shop=domain), is_last)
+        for page, (page_entry, page_products, changed, was_304) in pages:
+            not_modified += was_304
+            changed_since += changed
+            instrumentation.count("scrape.pages", shop=domain)
+            instrumentation.count("scrape.pages_not_modified", was_304, shop=domain)
+            instrumentation.count("scrape.products_seen", page_entry.get("count") or 0, shop=domain)
+            instrumentation.count("scrape.products_kept", len(page_products), shop=domain)
+            if not page_entry.get("count"):
+                complete = True
+                break
+
+            new_pages[str(page)] = page_entry
+            yield from page_products
+        else:
+            complete = True
+    except Exception as e:
+        print(f"Fejl ved hentning: {e}")
+
+    if collections and complete:
+        mark_full_crawl(domain)
+
+    if SHOPIFY_INCREMENTAL and complete:
+        today = datetime.date.today().isoformat()
+        save_json(
+            {
+                "queries": queries_l,
+                "signature": signature,
+                "last_full_crawl": today if full_crawl else state.get("last_full_crawl"),
+                "max_updated_at": max([watermark] + [p.get("max_updated_at") or "" for p in new_pages.values()]),
+                "pages": new_pages,
+            },
+            "shopify",
+            f"{safe_name(domain)}.json",
+        )
+
+    if not full_crawl:
+        print(f"{domain}: {not_modified} sider uændrede (304), {changed_since} produkter opdateret siden sidst")
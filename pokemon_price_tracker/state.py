@@ -0,0 +1,56 @@
+import json
+import os
+import re
+import threading
+from typing import Any
+
+
+# ----------------- KONFIG -----------------
+# Persistent state mellem kørsler (caches, crawl-state). I GitHub Actions
+# gemmes mappen med actions/cache, lokalt ligger den i projektroden.
+STATE_DIR = os.getenv(
+    "PPT_STATE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".state"),
+)
+# ------------------------------------------
+
+_unsafe_re = re.compile(r"[^a-z0-9._\-]+")
+
+
+def safe_name(s: str) -> str:
+    """Gør fx et domæne til et sikkert filnavn."""
+    return _unsafe_re.sub("_", (s or "").strip().lower()) or "_"
+
+
+def set_state_dir(path: str) -> None:
+    """Peg resten af kørslen på en anden state-mappe (fx isoleret state under HTTP replay)."""
+    global STATE_DIR
+    STATE_DIR = path
+
+
+def state_path(*parts: str) -> str:
+    path = os.path.join(STATE_DIR, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+def load_json(*parts: str, default: Any = None) -> Any:
+    """
+    Læs en state-fil. Mangler den eller er den korrupt, returneres default,
+    så en tabt cache aldrig vælter en kørsel.
+    """
+    path = os.path.join(STATE_DIR, *parts)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return default
+
+
+def save_json(data: Any, *parts: str) -> None:
+    """Atomisk skrivning (tmp + rename), så en afbrudt kørsel ikke efterlader halve filer."""
+    path = state_path(*parts)
+    tmp = f"{path}.tmp{os.getpid()}_{threading.get_ident()}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, path)
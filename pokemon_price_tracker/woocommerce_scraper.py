@@ -1,6 +1,25 @@
-import requests
+import datetime
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Iterator, List, Optional, Tuple
+from urllib.parse import quote_plus, urlsplit
+
+from pokemon_price_tracker import http_archive, http_client, instrumentation, page_cache
+from pokemon_price_tracker.narrow_fetch import mark_full_crawl, search_terms, use_narrow
+from pokemon_price_tracker.offers import Product
+from pokemon_price_tracker.page_prefetch import iter_pages, short_page_detector
 from pokemon_price_tracker.product_grouping import detect_series
-from pokemon_price_tracker.shopify_scraper import looks_like_single_card, _series_hint_from_matches
+from pokemon_price_tracker.prefilter import ProductFilter
+from pokemon_price_tracker.shopify_scraper import _series_hint_from_matches
+from pokemon_price_tracker.state import load_json, safe_name, save_json
+
+
+# ----------------- KONFIG -----------------
+WOO_PER_PAGE = 100
+WOO_MAX_PAGES = 60
+# Hvor længe et fundet base+endpoint genbruges før vi prober igen
+WOO_ENDPOINT_TTL_DAYS = int(os.getenv("WOO_ENDPOINT_TTL_DAYS", "14"))
+# ------------------------------------------
 
 
 def _wc_price_to_float(prices_obj: dict) -> float | None:
@@ -32,112 +51,257 @@ def _wc_price_to_float(prices_obj: dict) -> float | None:
         return None
 
 
-def scan_woocommerce_store_api(domain: str, queries: list[str]) -> list[dict]:
+def scan_woocommerce_store_api(domain: str, queries: list[str], narrow: bool = False) -> List[Product]:
+    return list(iter_woocommerce_store_api(domain, queries, narrow=narrow))
+
+
+def _fetch_woo_page(url: str, base: str, product_filter: ProductFilter) -> Tuple[Optional[dict], Optional[int]]:
     """
-    Returnerer samme dict-format som shopify_scraper:
-      name, price, available, series_hint, grouping_text, matched_queries, url
+    (side, X-WP-TotalPages). side = {"count": antal rå produkter, "products": [[id, produkt], ...]}
+    med de produkter der overlever filteret; None hvis siden fejlede / ikke er en Store API-liste.
+    Er siden byte-identisk med sidst (page_cache), genbruges udtrækket uden JSON-parse og filtrering.
     """
-    queries_l = [q.lower() for q in queries]
+    print(f"Henter Woo JSON: {url}")
+    try:
+        r = http_client.get(url)
+        if r.status_code >= 400:
+            return None, None
+        total = (r.headers.get("X-WP-TotalPages") or "").strip()
+        total_pages = int(total) if total.isdigit() else None
 
-    banned_language_words = [
-        "japanese", "japansk", "korean", "koreansk", "chinese", "kinesisk",
-        "german", "tysk", "french", "fransk",
-    ]
-    banned_graded_words = ["psa", "bgs", "cgc", "graded", "slab"]
+        shop = urlsplit(base).netloc
+        digest = page_cache.page_digest(r.content, base, product_filter.signature) if page_cache.PAGE_CACHE else ""
+        if digest:
+            page = page_cache.load(shop, url, digest)
+            if page is not None:
+                products = [[pid, Product.from_row(row)] for pid, row in page["products"]]
+                return {"count": page["count"], "products": products}, total_pages
 
-    required_product_words = [
-        "booster", "box", "bundle", "collection",
-        "elite trainer", "etb", "tin", "blister",
-        "display", "sticker", "poster", "figure", "pin",
-    ]
+        data = r.json()
+    except Exception:
+        return None, None
+
+    if not isinstance(data, list):
+        return None, None
+
+    products = []
+    for p in data:
+        product = _woo_product(p, base, product_filter)
+        if product is not None:
+            products.append([p.get("id"), product])
+    if digest:
+        rows = [[pid, product.to_row()] for pid, product in products]
+        page_cache.store(shop, url, digest, {"count": len(data), "products": rows})
+    return {"count": len(data), "products": products}, total_pages
+
+
+def _woo_product(p: dict, base: str, product_filter: ProductFilter) -> Optional[Product]:
+    title_raw = (p.get("name") or "")
+    if not title_raw:
+        return None
+
+    desc_raw = (p.get("description") or "") + " " + (p.get("short_description") or "")
+    cats = p.get("categories") or []
+    cat_text = " ".join([(c.get("name") or "") for c in cats if isinstance(c, dict)])
+
+    full_text = f"{title_raw} {desc_raw} {cat_text}"
 
+    # queries + udeluk (sprog/graded/singles) + kræv sealed i ét prefilter
+    verdict = product_filter.classify(title_raw, full_text)
+    if not verdict.keep:
+        return None
+    matched = verdict.matched_queries
+    full_text_l = full_text.lower()
+
+    price = _wc_price_to_float(p.get("prices") or {})
+    if price is None or price <= 0:
+        return None
+
+    series_hint = _series_hint_from_matches(full_text_l, matched)
+    if series_hint == "Unknown Series":
+        series_hint = detect_series(full_text)
+
+    return Product(
+        title_raw.strip(),
+        price,
+        p.get("is_in_stock", False),
+        series_hint,
+        matched,
+        (p.get("permalink") or "").strip() or base,
+        grouping_text=full_text,
+    )
+
+
+def _page_url(base: str, ep: str, page: int, search: str = "") -> str:
+    # "?rest_route=..." har allerede et "?", så query-parametre skal på med "&"
+    sep = "&" if "?" in ep else "?"
+    url = f"{base}{ep}{sep}per_page={WOO_PER_PAGE}&page={page}"
+    if search:
+        url += f"&search={quote_plus(search)}"
+    return url
+
+
+def _endpoint_candidates(domain: str) -> List[Tuple[str, str]]:
     bases = [f"https://{domain}", f"https://www.{domain}"]
     endpoints = [
         "/wp-json/wc/store/products",
         "/?rest_route=/wc/store/products",
     ]
+    return [(base, ep) for base in bases for ep in endpoints]
+
+
+def _load_endpoint(domain: str) -> Optional[Tuple[str, str]]:
+    """Sidst fungerende (base, endpoint) for domænet, hvis den ikke er ældre end TTL."""
+    entry = load_json("woo", f"{safe_name(domain)}.json", default=None)
+    if not isinstance(entry, dict) or not entry.get("base") or not entry.get("endpoint"):
+        return None
+    try:
+        resolved = datetime.date.fromisoformat(entry.get("resolved") or "")
+    except ValueError:
+        return None
+    if (datetime.date.today() - resolved).days >= WOO_ENDPOINT_TTL_DAYS:
+        return None
+    return entry["base"], entry["endpoint"]
+
+
+def _save_endpoint(domain: str, base: str, ep: str) -> None:
+    save_json(
+        {"base": base, "endpoint": ep, "resolved": datetime.date.today().isoformat()},
+        "woo",
+        f"{safe_name(domain)}.json",
+    )
+
+
+def _probe_endpoints(candidates: List[Tuple[str, str]], product_filter: ProductFilter):
+    """
+    Hent side 1 fra alle kandidater parallelt; første der svarer med en
+    Store API-liste vinder. Returnerer (base, endpoint, side-1-resultat) eller None.
+    Under HTTP record/replay probes i kandidat-rækkefølge, så begge kørsler
+    vælger samme endpoint.
+    """
+    if not candidates:
+        return None
+    if http_archive.recording() or http_archive.replaying():
+        for base, ep in candidates:
+            result = _fetch_woo_page(_page_url(base, ep, 1), base, product_filter)
+            if result[0] is not None:
+                return base, ep, result
+        return None
+
+    pool = ThreadPoolExecutor(max_workers=len(candidates), thread_name_prefix="woo-probe")
+    try:
+        futures = {
+            pool.submit(_fetch_woo_page, _page_url(base, ep, 1), base, product_filter): (base, ep)
+            for base, ep in candidates
+        }
+        for future in as_completed(futures):
+            result = future.result()
+            if result[0] is not None:
+                base, ep = futures[future]
+                return base, ep, result
+        return None
+    finally:
+        # langsomme kandidater (timeouts) skal ikke holde crawlen tilbage
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _iter_endpoint(
+    base: str,
+    ep: str,
+    product_filter: ProductFilter,
+    first_page=None,
+    search: str = "",
+    seen: Optional[set] = None,
+):
+    """
+    Yielder produkterne fra ét endpoint; returnerer (via StopIteration) om
+    endpointet svarede med en Store API-liste.
+    search = server-side søgning (narrow-mode); seen = produkt-id'er allerede
+    set under tidligere søgninger, så overlap mellem søgeord ikke giver dubletter.
+    """
+    any_ok = False
+
+    def fetch_page(page: int):
+        if page == 1 and first_page is not None:
+            return first_page
+        return _fetch_woo_page(_page_url(base, ep, page, search), base, product_filter)
+
+    shop = urlsplit(base).netloc
+    pages = iter_pages(
+        instrumentation.timed(fetch_page, "scrape.page_s", shop=shop),
+        is_last=short_page_detector(lambda result: (result[0] or {}).get("count") or 0),
+        max_page=WOO_MAX_PAGES,  # safety stop (~6000 produkter)
+        total_pages=lambda result: result[1],
+    )
+    for _page, (page_data, _total) in pages:
+        if page_data is None:
+            break
+
+        any_ok = True
+        if not page_data["count"]:
+            break
+
+        kept = 0
+        for pid, product in page_data["products"]:
+            if seen is not None and pid is not None:
+                if pid in seen:
+                    continue
+                seen.add(pid)
+            kept += 1
+            yield product
+
+        instrumentation.count("scrape.pages", shop=shop)
+        instrumentation.count("scrape.products_seen", page_data["count"], shop=shop)
+        instrumentation.count("scrape.products_kept", kept, shop=shop)
+
+    return any_ok
+
+
+def iter_woocommerce_store_api(domain: str, queries: list[str], narrow: bool = False) -> Iterator[Product]:
+    """
+    Yielder Product-records som shopify_scraper.
+
+    Det fungerende base+endpoint huskes pr domæne i state (WOO_ENDPOINT_TTL_DAYS).
+    Er der intet (eller svarer det ikke længere), probes alle kandidater parallelt.
+    Siderne hentes spekulativt parallelt; X-WP-TotalPages fra første side
+    sætter slutningen, ellers stopper vi ved første tomme/korte side.
+
+    narrow=True: ét search= pr søgeord (afledt af queries) i stedet for hele
+    kataloget, med fuld verifikations-crawl hver NARROW_VERIFY_DAYS.
+    """
+    product_filter = ProductFilter(queries)
+    candidates = _endpoint_candidates(domain)
+
+    narrow_now = narrow and use_narrow(domain)
+    if narrow and not narrow_now:
+        print(f"{domain}: fuld verifikations-crawl (narrow-mode)")
+
+    def crawl(base: str, ep: str, first_page=None):
+        if not narrow_now:
+            any_ok = yield from _iter_endpoint(base, ep, product_filter, first_page=first_page)
+            if any_ok and narrow:
+                mark_full_crawl(domain)
+            return any_ok
+
+        # endpointet er allerede fundet/probet uden search, så første side kan ikke genbruges
+        seen: set = set()
+        any_ok = False
+        for term in search_terms(queries):
+            any_ok = (yield from _iter_endpoint(base, ep, product_filter, search=term, seen=seen)) or any_ok
+        return any_ok
+
+    cached = _load_endpoint(domain)
+    if cached:
+        any_ok = yield from crawl(cached[0], cached[1])
+        if any_ok:
+            return
+        print(f"{domain}: gemt Woo endpoint svarer ikke, prober igen")
+        candidates = [c for c in candidates if c != cached]
+
+    found = _probe_endpoints(candidates, product_filter)
+    if found is None:
+        return
 
-    products: list[dict] = []
-
-    for base in bases:
-        for ep in endpoints:
-            page = 1
-            any_ok = False
-
-            while True:
-                url = f"{base}{ep}?per_page=100&page={page}"
-                print(f"Henter Woo JSON: {url}")
-
-                try:
-                    r = requests.get(url, timeout=30)
-                    if r.status_code >= 400:
-                        break
-                    data = r.json()
-                except Exception:
-                    break
-
-                if not isinstance(data, list):
-                    break
-
-                any_ok = True
-                if not data:
-                    break
-
-                for p in data:
-                    title_raw = (p.get("name") or "")
-                    if not title_raw:
-                        continue
-
-                    desc_raw = (p.get("description") or "") + " " + (p.get("short_description") or "")
-                    cats = p.get("categories") or []
-                    cat_text = " ".join([(c.get("name") or "") for c in cats if isinstance(c, dict)])
-
-                    full_text = f"{title_raw} {desc_raw} {cat_text}"
-                    full_text_l = full_text.lower()
-                    title_l = title_raw.lower()
-
-                    matched = [q for q in queries_l if q and (q in full_text_l)]
-                    if not matched:
-                        continue
-
-                    # Udeluk
-                    if any(word in title_l for word in banned_language_words):
-                        continue
-                    if any(word in title_l for word in banned_graded_words):
-                        continue
-                    if looks_like_single_card(title_raw) or looks_like_single_card(full_text):
-                        continue
-
-                    # Kræv sealed
-                    if not any(word in title_l for word in required_product_words):
-                        continue
-
-                    price = _wc_price_to_float(p.get("prices") or {})
-                    if price is None or price <= 0:
-                    
-                        continue
-
-                    series_hint = _series_hint_from_matches(full_text_l, matched)
-                    if series_hint == "Unknown Series":
-                        series_hint = detect_series(full_text)
-
-                    products.append(
-                        {
-                            "name": title_raw.strip(),
-                            "price": float(price),
-                            "available": bool(p.get("is_in_stock", False)),
-                            "series_hint": series_hint,
-                            "grouping_text": full_text,
-                            "matched_queries": matched,
-                            "url": (p.get("permalink") or "").strip() or base,
-                        }
-                    )
-
-                page += 1
-                if page > 60:  # safety stop (~6000 produkter)
-                    break
-
-            if any_ok:
-                return products
-
-    return products
\ No newline at end of file
+    base, ep, first_page = found
+    _save_endpoint(domain, base, ep)
+    yield from crawl(base, ep, first_page=None if narrow_now else first_page)
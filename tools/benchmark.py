@@ -0,0 +1,387 @@
+"""
+Benchmark af de tunge stier uden at ramme rigtige butikker eller Google:
+
+  python tools/benchmark.py                 # alle cases
+  python tools/benchmark.py --only shopify woo --repeat 10
+  python tools/benchmark.py --raw-rows 2000000 --json bench.json
+
+Fixtures er syntetiske (seedet, så to kørsler er sammenlignelige): store
+products.json-sider og Woo Store API-sider serveres af en lokal stub-server
+via http_client's host-aliaser, Epicpanda-HTML parses direkte, og
+medianerne måles på samme sti som main(): syntetiske RawOffers-rækker
+importeres i en HistoryStore (SQLite), som RollingMedianState bygges af.
+
+Pr case rapporteres latency (p50/p90/p99/max over --repeat kørsler),
+throughput og peak-hukommelse (tracemalloc, i en separat kørsel).
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, List
+
+# Projektroot = mappen over /tools
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+# State (crawl-state, endpoint-cache mv.) må ikke blandes med den rigtige
+os.environ.setdefault("PPT_STATE_DIR", tempfile.mkdtemp(prefix="ppt-bench-"))
+# Gentagelser skal parse hver gang; PAGE_CACHE=1 måler i stedet cache-hit-stien
+os.environ.setdefault("PAGE_CACHE", "0")
+
+from pokemon_price_tracker import http_client  # noqa: E402
+from pokemon_price_tracker import shopify_scraper, woocommerce_scraper  # noqa: E402
+from pokemon_price_tracker.Shops import Epicpanda  # noqa: E402
+from pokemon_price_tracker.grouping_cache import GroupingCache  # noqa: E402
+from pokemon_price_tracker.history_store import HistoryStore  # noqa: E402
+from pokemon_price_tracker.median_engine import MODES  # noqa: E402
+from pokemon_price_tracker.offers import Offer  # noqa: E402
+from pokemon_price_tracker.product_grouping import build_group_key_and_name  # noqa: E402
+from pokemon_price_tracker.queries import QUERIES  # noqa: E402
+from pokemon_price_tracker.rolling_stats import RollingMedianState  # noqa: E402
+
+
+SHOPIFY_DOMAIN = "bench-shopify.test"
+WOO_DOMAIN = "bench-woo.test"
+
+# ----------------- FIXTURES -----------------
+SERIES = [
+    "Pokemon 151", "Pokémon 151", "Crown Zenith", "Prismatic Evolutions",
+    "Mega Evolution", "Phantasmal Flames", "Ascended Heroes", "Perfect Order",
+]
+PRODUCT_TYPES = [
+    "Booster Bundle", "Elite Trainer Box", "Booster Box", "Booster Display",
+    "Mini Tin", "3-Pack Blister", "Premium Collection", "Poster Collection",
+]
+NOISE = [
+    "Magic the Gathering Commander Deck", "Lorcana Booster Pack", "One Piece Starter Deck",
+    "Yu-Gi-Oh! Structure Deck", "Card Sleeves 100 stk", "Deck Box", "Playmat", "Dice Set",
+    "Pokemon Pikachu Single (rare)", "Japanese 151 Booster Box",
+]
+
+
+def make_titles(n: int, seed: int = 1, pokemon_share: float = 0.15) -> List[str]:
+    rnd = random.Random(seed)
+    titles = []
+    for i in range(n):
+        if rnd.random() < pokemon_share:
+            titles.append(f"{rnd.choice(SERIES)} {rnd.choice(PRODUCT_TYPES)}")
+        else:
+            titles.append(f"{rnd.choice(NOISE)} #{i % 500}")
+    return titles
+
+
+def _body_html(rnd: random.Random) -> str:
+    return "<p>" + " ".join(rnd.choice(["lorem", "ipsum", "dolor", "sit", "amet", "samlerkort"]) for _ in range(rnd.randint(40, 400))) + "</p>"
+
+
+def make_shopify_pages(n_products: int, seed: int = 2, per_page: int = 250) -> List[bytes]:
+    rnd = random.Random(seed)
+    products = []
+    for i, title in enumerate(make_titles(n_products, seed)):
+        products.append({
+            "id": i,
+            "title": title,
+            "handle": f"p-{i}",
+            "body_html": _body_html(rnd),
+            "product_type": "TCG",
+            "updated_at": f"2025-01-{1 + i % 28:02d}T10:00:00+01:00",
+            "variants": [
+                {"id": i * 10 + v, "title": "Default Title" if v == 0 else f"Variant {v}",
+                 "price": f"{rnd.randint(50, 2500)}.00", "available": rnd.random() < 0.7}
+                for v in range(rnd.choice([1, 1, 1, 2]))
+            ],
+        })
+    pages = [products[i:i + per_page] for i in range(0, len(products), per_page)]
+    return [json.dumps({"products": page}).encode("utf-8") for page in pages + [[]]]
+
+
+def make_woo_pages(n_products: int, seed: int = 3, per_page: int = 100) -> List[bytes]:
+    rnd = random.Random(seed)
+    products = [
+        {
+            "id": i,
+            "name": title,
+            "permalink": f"https://{WOO_DOMAIN}/produkt/p-{i}/",
+            "description": _body_html(rnd),
+            "short_description": "",
+            "categories": [{"name": "Pokémon"}],
+            "prices": {"price": str(rnd.randint(5000, 250000)), "currency_minor_unit": 2},
+            "is_in_stock": rnd.random() < 0.7,
+        }
+        for i, title in enumerate(make_titles(n_products, seed))
+    ]
+    pages = [products[i:i + per_page] for i in range(0, len(products), per_page)]
+    return [json.dumps(page).encode("utf-8") for page in pages + [[]]]
+
+
+def make_epicpanda_html(n_products: int, seed: int = 4) -> str:
+    rnd = random.Random(seed)
+    parts = ["<html><head><style>.p{}</style></head><body>"]
+    for i, title in enumerate(make_titles(n_products, seed, pokemon_share=0.8)):
+        price = f"{rnd.randint(50, 2500)},{rnd.randint(0, 99):02d}"
+        stock = rnd.choice(["På lager", "Udsolgt", "Ikke på lager"])
+        parts.append(
+            f'<div class="product"><a href="/shop/p-{i}p.html"><img src="/img/{i}.jpg"></a>'
+            f'<h3><a href="/shop/p-{i}p.html">{title}</a></h3>'
+            f'<div class="desc">{_body_html(rnd)}</div>'
+            f'<span class="price">{price}&nbsp;DKK</span><span class="stock">{stock}</span></div>\n'
+        )
+    parts.append("</body></html>")
+    return "".join(parts)
+
+
+def make_raw_rows(n_rows: int, n_products: int = 400, n_shops: int = 15, seed: int = 5) -> List[List[str]]:
+    """RawOffers-rækker; strenge deles mellem rækker, så millioner af rækker kan ligge i RAM."""
+    rnd = random.Random(seed)
+    products = [f"{s}: {t}" for s in SERIES for t in PRODUCT_TYPES][:n_products]
+    shops = [f"shop{i}" for i in range(n_shops)]
+    urls = {p: f"https://example.test/{i}" for i, p in enumerate(products)}
+    per_day = max(1, len(products) * n_shops // 3)
+
+    rows = [["Timestamp", "Date", "Product", "Price", "Shop", "URL", "Available"]]
+    day = 0
+    while len(rows) <= n_rows:
+        date = time.strftime("%d-%m-%Y", time.gmtime(1_700_000_000 + day * 86400))
+        ts = time.strftime("%Y-%m-%d 06:00:00", time.gmtime(1_700_000_000 + day * 86400))
+        for _ in range(min(per_day, n_rows + 1 - len(rows))):
+            p = rnd.choice(products)
+            rows.append([ts, date, p, str(rnd.randint(50, 2500)), rnd.choice(shops), urls[p], "TRUE" if rnd.random() < 0.7 else "FALSE"])
+        day += 1
+    return rows
+
+
+def make_history(n_rows: int) -> HistoryStore:
+    """HistoryStore i en temp-fil, fyldt med make_raw_rows (som backfill fra RawOffers)."""
+    history = HistoryStore(os.path.join(tempfile.mkdtemp(prefix="ppt-bench-history-"), "history.sqlite"))
+    history.backfill_from_raw_values(make_raw_rows(n_rows))
+    return history
+
+
+# ----------------- STUB-SERVER -----------------
+class _StubHandler(BaseHTTPRequestHandler):
+    shopify_pages: List[bytes] = []
+    woo_pages: List[bytes] = []
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        m = re.search(r"[?&]page=(\d+)", self.path)
+        page = int(m.group(1)) if m else 1
+        headers = {"Content-Type": "application/json"}
+
+        if "/products.json" in self.path:
+            pages = self.shopify_pages
+        elif "wc/store/products" in self.path:
+            pages = self.woo_pages
+            headers["X-WP-TotalPages"] = str(len(pages) - 1)
+        else:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        body = pages[min(page, len(pages)) - 1]
+        self.send_response(200)
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub_server(shopify_pages: List[bytes], woo_pages: List[bytes]) -> ThreadingHTTPServer:
+    _StubHandler.shopify_pages = shopify_pages
+    _StubHandler.woo_pages = woo_pages
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    target = f"http://127.0.0.1:{server.server_address[1]}"
+    for domain in (SHOPIFY_DOMAIN, WOO_DOMAIN):
+        http_client.set_host_alias(f"https://{domain}", target)
+        http_client.set_host_alias(f"https://www.{domain}", target)
+    return server
+
+
+# ----------------- MÅLING -----------------
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    k = (len(ordered) - 1) * pct / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def run_case(name: str, fn: Callable[[], int], units: str, repeat: int) -> Dict:
+    """fn returnerer antal behandlede enheder (produkter, titler, rækker...)."""
+    fn()  # opvarmning (imports, caches, TCP-forbindelser)
+
+    durations = []
+    count = 0
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        count = fn()
+        durations.append(time.perf_counter() - t0)
+
+    tracemalloc.start()
+    fn()
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    p50 = percentile(durations, 50)
+    return {
+        "case": name,
+        "units": units,
+        "count": count,
+        "repeat": repeat,
+        "p50_s": round(p50, 4),
+        "p90_s": round(percentile(durations, 90), 4),
+        "p99_s": round(percentile(durations, 99), 4),
+        "max_s": round(max(durations), 4),
+        "mean_s": round(statistics.fmean(durations), 4),
+        "throughput_per_s": round(count / p50, 1) if p50 > 0 else None,
+        "peak_mem_mb": round(peak / (1024 * 1024), 2),
+    }
+
+
+def print_report(results: List[Dict]) -> None:
+    header = f"{'case':<22}{'count':>10} {'units':<10}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}{'thru/s':>12}{'peak MB':>10}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(
+            f"{r['case']:<22}{r['count']:>10} {r['units']:<10}"
+            f"{r['p50_s']:>9.3f}{r['p90_s']:>9.3f}{r['p99_s']:>9.3f}{r['max_s']:>9.3f}"
+            f"{(r['throughput_per_s'] or 0):>12.1f}{r['peak_mem_mb']:>10.2f}"
+        )
+
+
+def main() -> None:
+    cases_all = ["shopify", "woo", "epicpanda", "grouping", "grouping_cached", "medians_rebuild", "medians_daily"]
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--only", nargs="+", choices=cases_all, default=cases_all)
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--shopify-products", type=int, default=5000)
+    ap.add_argument("--woo-products", type=int, default=3000)
+    ap.add_argument("--epicpanda-products", type=int, default=2000)
+    ap.add_argument("--titles", type=int, default=50000)
+    ap.add_argument("--raw-rows", type=int, default=500000)
+    ap.add_argument("--json", help="skriv resultater som JSON til denne fil")
+    args = ap.parse_args()
+
+    # Crawl-state mellem gentagelser ville gøre kørslerne forskellige
+    shopify_scraper.SHOPIFY_INCREMENTAL = False
+    # Print pr side fra scraperne drukner rapporten
+    quiet = open(os.devnull, "w")
+
+    def silenced(fn: Callable[[], int]) -> Callable[[], int]:
+        def run() -> int:
+            stdout, sys.stdout = sys.stdout, quiet
+            try:
+                return fn()
+            finally:
+                sys.stdout = stdout
+        return run
+
+    print("Bygger fixtures ...")
+    server = None
+    if "shopify" in args.only or "woo" in args.only:
+        server = start_stub_server(
+            make_shopify_pages(args.shopify_products),
+            make_woo_pages(args.woo_products),
+        )
+
+    results = []
+    for case in args.only:
+        # count = antal produkter/titler/rækker gennemløbet, ikke antal der overlevede filteret
+        if case == "shopify":
+            def shopify() -> int:
+                shopify_scraper.scan_shopify_store_json(SHOPIFY_DOMAIN, QUERIES)
+                return args.shopify_products
+            results.append(run_case(case, silenced(shopify), "products", args.repeat))
+        elif case == "woo":
+            def woo() -> int:
+                woocommerce_scraper.scan_woocommerce_store_api(WOO_DOMAIN, QUERIES)
+                return args.woo_products
+            results.append(run_case(case, silenced(woo), "products", args.repeat))
+        elif case == "epicpanda":
+            page_html = make_epicpanda_html(args.epicpanda_products)
+
+            def epicpanda() -> int:
+                Epicpanda._extract_products_from_category_html(page_html, "Bench", [])
+                return args.epicpanda_products
+            results.append(run_case(case, epicpanda, "products", args.repeat))
+        elif case == "grouping":
+            titles = make_titles(args.titles, pokemon_share=1.0)
+
+            def grouping() -> int:
+                for t in titles:
+                    build_group_key_and_name(t, None, None)
+                return len(titles)
+            results.append(run_case(case, grouping, "titles", args.repeat))
+        elif case == "grouping_cached":
+            titles = make_titles(args.titles, pokemon_share=1.0)
+            cache = GroupingCache()
+
+            def grouping_cached() -> int:
+                for t in titles:
+                    cache.get(t, None, None)
+                return len(titles)
+            results.append(run_case(case, grouping_cached, "titles", args.repeat))
+        elif case == "medians_rebuild":
+            # Kold sti: state mangler/er ude af sync -> hele historikken læses og genopbygges
+            history = make_history(args.raw_rows)
+
+            def medians_rebuild() -> int:
+                state = RollingMedianState.rebuild(history.load_offer_arrays())
+                for mode in MODES:
+                    state.medians(mode)
+                return args.raw_rows
+            results.append(run_case(case, medians_rebuild, "rows", args.repeat))
+        elif case == "medians_daily":
+            # Daglig sti: dagens billigste tilbud lægges til den gemte state
+            history = make_history(args.raw_rows)
+            state = RollingMedianState.rebuild(history.load_offer_arrays())
+            products = sorted({name for mode in MODES for name in state.modes[mode]})
+            rnd = random.Random(6)
+            next_day = [state.latest_day]
+
+            def medians_daily() -> int:
+                next_day[0] += 1
+                chosen = {name: Offer(rnd.randint(50, 2500), "shop0", True) for name in products}
+                for mode in MODES:
+                    state.update(mode, next_day[0], chosen)
+                    state.medians(mode)
+                return len(products)
+            results.append(run_case(case, medians_daily, "products", args.repeat))
+
+    if server is not None:
+        server.shutdown()
+        http_client.clear_host_aliases()
+
+    print()
+    print_report(results)
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print(f"\nSkrev {args.json}")
+
+
+if __name__ == "__main__":
+    main()